@@ -1,85 +1,143 @@
-from flask import Flask, request, jsonify, redirect, session, send_file, Response, stream_with_context, make_response
+from flask import Flask, request, redirect, session, send_file, Response, stream_with_context, make_response, url_for
 from flask_cors import CORS
+from fast_json import jsonify, init_compression
 import firebase_admin
 from firebase_admin import credentials, firestore, auth, storage
+from google.api_core.exceptions import PreconditionFailed
 import os
 from werkzeug.utils import secure_filename
-from google_drive_service import GoogleDriveService
+from google_drive_service import GoogleDriveService, forget_credentials
+from drive_service_pool import DriveServicePool
+from text_to_speech import (synthesize_speech, synthesize_speech_async, iter_speech_segments, audio_cache_key,
+                            audio_storage_path, AudioPipe, shutdown_tts_pool, TTS_MODEL, TTS_VOICE,
+                            TTS_FIRST_SEGMENT_CHARS)
+from http_caching import cached_json, not_modified, version_etag
+from artifacts import write_artifact, load_artifact, load_artifacts, delete_artifacts
+from study_guides import parse_study_guide, render_docx_study_guide
+from pdf_render_worker import render_pdf_in_pool, set_render_processes, shutdown_render_pool
+from async_jobs import JobRunner, JobError, run_blocking, wants_async
+from llm_gateway import LLMGateway, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from metrics import init_metrics, register_collector, span, timed
+from structured_logging import configure_logging, init_request_logging, REQUEST_ID_HEADER
+from prompts import (summary_request, quiz_request, study_guide_overview_request, study_guide_chunks,
+                     study_guide_chunk_request, build_study_guide_content, auditory_script_request,
+                     build_auditory_content, kinesthetic_request, parse_kinesthetic_activities,
+                     visual_suggestions_request, visual_explanations_request, build_visual_content,
+                     visual_concepts_request, parse_visual_concepts, SAMPLE_VISUAL_CONCEPTS, PLACEHOLDER_IMAGE)
 from dotenv import load_dotenv
 import tempfile
 from datetime import datetime, timedelta, date
 import uuid
 import json
-from openai import OpenAI
-import markdown
-from docxtpl import DocxTemplate
-from docx import Document
-from docx.shared import Pt, RGBColor, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.style import WD_STYLE_TYPE
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from io import BytesIO
-import traceback
 import time
-import re
 import hashlib
+from urllib.parse import quote
+from functools import lru_cache
+from xml.sax.saxutils import escape as xml_escape
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
 try:
     from flask_session import Session
 except ImportError:
-    print("Flask-Session not installed. Use: pip install Flask-Session")
     Session = None
 
-try:
-    from serpapi import GoogleSearch
-except ImportError:
-    print("SerpAPI package not installed. Please run: pip install google-search-results")
-    GoogleSearch = None
-
-# Import for the learning style model
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
-
-# Import for document text extraction
-import PyPDF2
-import docx
-from pptx import Presentation
+# Heavy dependencies (openai, transformers/torch, reportlab, python-docx,
+# python-pptx, PyPDF2, serpapi) are imported lazily by the code paths that
+# use them so that a cold start only pays for Flask and Firebase.
 
 # Load environment variables
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
-if os.path.exists(dotenv_path):
-    print(f"Loading .env file from {dotenv_path}")
+dotenv_found = os.path.exists(dotenv_path)
+if dotenv_found:
     load_dotenv(dotenv_path)
 else:
-    print(f"Warning: .env file not found at {dotenv_path}")
     load_dotenv()  # Try default locations
 
+# Logging is configured once the .env file has been read (LOG_LEVEL, LOG_FORMAT, ...)
+configure_logging()
+logger = logging.getLogger(__name__)
+if dotenv_found:
+    logger.info("Loaded .env file from %s", dotenv_path)
+else:
+    logger.warning(".env file not found at %s", dotenv_path)
+
 # Initialize OpenAI API key
 openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
-    print("WARNING: OPENAI_API_KEY environment variable not set")
-    print("Please set the OPENAI_API_KEY environment variable to use OpenAI features")
+    logger.warning("OPENAI_API_KEY environment variable not set; OpenAI features will not work")
 else:
-    print("OpenAI API key loaded successfully")
+    logger.info("OpenAI API key loaded successfully")
+
+# OpenAI client (created on first use, see get_openai_client)
+openai_client = None
+
+def get_openai_client():
+    """Create the OpenAI client on first use"""
+    global openai_client
+    if openai_client is None:
+        from openai import OpenAI
+        openai_client = OpenAI(api_key=openai_api_key)
+    return openai_client
 
-# Create OpenAI client
-client = OpenAI(api_key=openai_api_key)
+# AsyncOpenAI client for generation jobs (created on the job loop, see get_async_openai_client)
+async_openai_client = None
+
+def get_async_openai_client():
+    """Create the AsyncOpenAI client on first use; only used by jobs on the job loop"""
+    global async_openai_client
+    if async_openai_client is None:
+        from openai import AsyncOpenAI
+        async_openai_client = AsyncOpenAI(api_key=openai_api_key)
+    return async_openai_client
+
+# Rate limits, priorities, timeouts and retries for every chat completion (see llm_gateway.py)
+llm_gateway = LLMGateway(get_openai_client, get_async_openai_client)
 
 # Initialize SerpAPI key
 serpapi_key = os.getenv("SERPAPI_API_KEY")
 if not serpapi_key:
-    print("WARNING: SERPAPI_API_KEY environment variable not set")
-    print("Please set the SERPAPI_API_KEY environment variable to use image search features")
+    logger.warning("SERPAPI_API_KEY environment variable not set; image search will not work")
 else:
-    print("SerpAPI key loaded successfully")
+    logger.info("SerpAPI key loaded successfully")
+
+def get_google_search_class():
+    """Import SerpAPI's GoogleSearch on first use; returns None if the package is missing"""
+    try:
+        from serpapi import GoogleSearch
+    except ImportError:
+        logger.warning("SerpAPI package not installed. Please run: pip install google-search-results")
+        return None
+    return GoogleSearch
+
+image_lookup_service = None
+
+def get_image_lookup_service():
+    """Create the shared cached image lookup service on first use"""
+    global image_lookup_service
+    if image_lookup_service is None:
+        from image_lookup_service import ImageLookupService
+        image_lookup_service = ImageLookupService(serpapi_key, get_google_search_class, db=db)
+    return image_lookup_service
+
+job_runner = None
+# On shutdown, running jobs get this long to finish before they are cancelled
+JOB_DRAIN_SECONDS = float(os.getenv('JOB_DRAIN_SECONDS', '60'))
+
+def get_job_runner():
+    """Create the generation job runner (and its event loop thread) on first use"""
+    global job_runner
+    if job_runner is None:
+        job_runner = JobRunner(db)
+    return job_runner
 
 # Check for credentials file as fallback
 def check_credentials_file():
     credentials_file = os.path.join(os.path.dirname(__file__), 'credentials.json')
     if os.path.exists(credentials_file):
-        print(f"Found credentials.json file at {credentials_file}")
+        logger.info("Found credentials.json file at %s", credentials_file)
         try:
             # Read and verify the credentials file
             with open(credentials_file, 'r') as f:
@@ -89,19 +147,19 @@ def check_credentials_file():
                 # Set environment variables from credentials file
                 if not os.getenv('GOOGLE_DRIVE_CLIENT_ID') and 'client_id' in web_creds:
                     os.environ['GOOGLE_DRIVE_CLIENT_ID'] = web_creds['client_id']
-                    print("Set GOOGLE_DRIVE_CLIENT_ID from credentials.json")
+                    logger.info("Set GOOGLE_DRIVE_CLIENT_ID from credentials.json")
                     
                 if not os.getenv('GOOGLE_DRIVE_CLIENT_SECRET') and 'client_secret' in web_creds:
                     os.environ['GOOGLE_DRIVE_CLIENT_SECRET'] = web_creds['client_secret']
-                    print("Set GOOGLE_DRIVE_CLIENT_SECRET from credentials.json")
+                    logger.info("Set GOOGLE_DRIVE_CLIENT_SECRET from credentials.json")
                     
                 if not os.getenv('GOOGLE_DRIVE_REDIRECT_URI') and 'redirect_uris' in web_creds and web_creds['redirect_uris']:
                     os.environ['GOOGLE_DRIVE_REDIRECT_URI'] = web_creds['redirect_uris'][0]
-                    print("Set GOOGLE_DRIVE_REDIRECT_URI from credentials.json")
+                    logger.info("Set GOOGLE_DRIVE_REDIRECT_URI from credentials.json")
                     
                 return True
         except Exception as e:
-            print(f"Error loading credentials.json: {e}")
+            logger.error("Error loading credentials.json: %s", e)
     return False
 
 # Try to load from credentials.json if env vars are missing
@@ -110,27 +168,26 @@ if not (os.getenv('GOOGLE_DRIVE_CLIENT_ID') and
         os.getenv('GOOGLE_DRIVE_REDIRECT_URI')):
     check_credentials_file()
 
-# Print environment variables for debugging
+# Report which Drive settings are available
 if os.getenv('GOOGLE_DRIVE_CLIENT_ID'):
-    print("GOOGLE_DRIVE_CLIENT_ID loaded successfully")
+    logger.info("GOOGLE_DRIVE_CLIENT_ID loaded successfully")
 else:
-    print("WARNING: GOOGLE_DRIVE_CLIENT_ID not found in .env file")
+    logger.warning("GOOGLE_DRIVE_CLIENT_ID not found in .env file")
     
 if os.getenv('GOOGLE_DRIVE_CLIENT_SECRET'):
-    print("GOOGLE_DRIVE_CLIENT_SECRET loaded successfully")
+    logger.info("GOOGLE_DRIVE_CLIENT_SECRET loaded successfully")
 else:
-    print("WARNING: GOOGLE_DRIVE_CLIENT_SECRET not found in .env file")
+    logger.warning("GOOGLE_DRIVE_CLIENT_SECRET not found in .env file")
     
 if os.getenv('GOOGLE_DRIVE_REDIRECT_URI'):
-    print("GOOGLE_DRIVE_REDIRECT_URI loaded successfully")
+    logger.info("GOOGLE_DRIVE_REDIRECT_URI loaded successfully")
 else:
-    print("WARNING: GOOGLE_DRIVE_REDIRECT_URI not found in .env file")
+    logger.warning("GOOGLE_DRIVE_REDIRECT_URI not found in .env file")
 
 app = Flask(__name__)
 # Use a fixed secret key instead of generating a new one each time the server starts
 # This will maintain session cookies across server restarts
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'gradproject-fixed-secret-key-for-session-management')
-print("Session secret key configured")
 
 # Configure session behavior for more reliable sessions
 app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
@@ -143,22 +200,26 @@ app.config['SESSION_FILE_DIR'] = os.path.join(os.getcwd(), 'flask_session')
 # Create session directory if it doesn't exist
 if not os.path.exists(app.config['SESSION_FILE_DIR']):
     os.makedirs(app.config['SESSION_FILE_DIR'])
-print("Session configuration complete")
 
 # Initialize Flask-Session
 if Session is not None:
     Session(app)
-    print("Flask-Session initialized")
 else:
-    print("Warning: Flask-Session not available. Falling back to Flask's default session.")
+    logger.warning("Flask-Session not installed (pip install Flask-Session). Falling back to Flask's default session.")
 
 # Configure CORS for all routes
 CORS(app, 
      resources={r"/api/*": {"origins": ["http://localhost:3000"]}},
      supports_credentials=True,
-     allow_headers=["Content-Type", "Authorization", "Accept", "X-Requested-With"],
+     allow_headers=["Content-Type", "Authorization", "Accept", "X-Requested-With", "If-None-Match", "Prefer", REQUEST_ID_HEADER],
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
-     expose_headers=["Content-Type", "Authorization"])
+     expose_headers=["Content-Type", "Authorization", "ETag", "Location", REQUEST_ID_HEADER])
+
+# Compress large JSON/text responses (brotli or gzip, negotiated per request)
+init_compression(app)
+init_metrics(app)
+# Request ids for log correlation (X-Request-ID)
+init_request_logging(app)
 
 @app.after_request
 def after_request(response):
@@ -170,23 +231,51 @@ def after_request(response):
     
     # Add CORS headers
     response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Accept,X-Requested-With')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Accept,X-Requested-With,If-None-Match,Prefer,X-Request-ID')
     response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS,PATCH')
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
 
-# Create temp_uploads directory if it doesn't exist
-if not os.path.exists('temp_uploads'):
-    os.makedirs('temp_uploads')
+# Note: temp_uploads/ and files/ are created on demand by the routes that use
+# them rather than at import time.
+
+# Temp files older than this are treated as orphans (e.g. left behind by a crashed request)
+TEMP_DIRS = ['temp_uploads', 'temp_processing', 'temp_downloads']
+TEMP_FILE_MAX_AGE_SECONDS = int(os.getenv('TEMP_FILE_MAX_AGE_SECONDS', '3600'))
+TEMP_SWEEP_INTERVAL_SECONDS = int(os.getenv('TEMP_SWEEP_INTERVAL_SECONDS', '600'))
+last_temp_sweep = 0
+temp_sweep_lock = threading.Lock()
+
+def sweep_stale_temp_files():
+    """Remove orphaned files from the temp directories"""
+    cutoff = time.time() - TEMP_FILE_MAX_AGE_SECONDS
+    removed = 0
+    for temp_dir in TEMP_DIRS:
+        temp_dir = os.path.join(os.getcwd(), temp_dir)
+        if not os.path.isdir(temp_dir):
+            continue
+        for filename in os.listdir(temp_dir):
+            file_path = os.path.join(temp_dir, filename)
+            try:
+                if os.path.isfile(file_path) and os.path.getmtime(file_path) < cutoff:
+                    os.remove(file_path)
+                    removed += 1
+            except OSError as e:
+                logger.warning("Could not remove stale temp file %s: %s", file_path, e)
+    if removed:
+        logger.info("Removed %s stale temp files", removed)
 
-# Create files directory for local storage if Google Drive is not available
-if not os.path.exists('files'):
-    os.makedirs('files')
-    # Create subdirectories for different learning styles
-    for style in ['visual', 'auditory', 'kinesthetic', 'text']:
-        style_dir = os.path.join('files', style)
-        if not os.path.exists(style_dir):
-            os.makedirs(style_dir)
+@app.before_request
+def schedule_temp_sweep():
+    """Sweep orphaned temp files in the background at most once per interval"""
+    global last_temp_sweep
+    now = time.time()
+    # Concurrent requests must not each see the interval as elapsed and start a sweep
+    with temp_sweep_lock:
+        if now - last_temp_sweep < TEMP_SWEEP_INTERVAL_SECONDS:
+            return
+        last_temp_sweep = now
+    threading.Thread(target=sweep_stale_temp_files, daemon=True).start()
 
 # Initialize Firebase
 firebase_app = None
@@ -200,7 +289,7 @@ try:
     firebase_client_email = os.getenv('FIREBASE_CLIENT_EMAIL')
     
     if firebase_project_id and firebase_private_key and firebase_client_email:
-        print("Using Firebase credentials from environment variables")
+        logger.info("Using Firebase credentials from environment variables")
         # Replace escaped newlines in the private key
         if "\\n" in firebase_private_key:
             firebase_private_key = firebase_private_key.replace("\\n", "\n")
@@ -218,21 +307,20 @@ try:
         firebase_app = firebase_admin.initialize_app(cred, {
             'storageBucket': f"{firebase_project_id}.appspot.com"
         })
-        print(f"Firebase app initialized from environment variables with project ID: {firebase_app.project_id}")
+        logger.info("Firebase app initialized from environment variables with project ID: %s", firebase_app.project_id)
         
         # Initialize Firestore
         db = firestore.client()
-        print("Firestore client initialized")
         
         # Initialize Storage bucket
         bucket = storage.bucket()
-        print(f"Storage bucket initialized: {bucket.name}")
+        logger.info("Firestore and Storage bucket %s initialized", bucket.name)
     else:
         # Check if the firebase-adminsdk.json file exists
         firebase_sdk_path = 'firebase-adminsdk.json'
         
         if os.path.exists(firebase_sdk_path):
-            print(f"Found Firebase credentials at {firebase_sdk_path}")
+            logger.info("Found Firebase credentials at %s", firebase_sdk_path)
             try:
                 # Read and verify the credentials file
                 with open(firebase_sdk_path, 'r') as f:
@@ -241,11 +329,11 @@ try:
                     missing_fields = [field for field in required_fields if field not in creds_content]
                     
                     if missing_fields:
-                        print(f"Error: Firebase credentials file is missing required fields: {', '.join(missing_fields)}")
-                        print("Please check the credentials file and ensure it contains all required fields.")
-                        print("Continuing without Firebase functionality. Some features may not work.")
+                        logger.error("Firebase credentials file is missing required fields: %s. "
+                                     "Continuing without Firebase functionality; some features may not work.",
+                                     ', '.join(missing_fields))
                     else:
-                        print(f"Using Firebase project: {creds_content.get('project_id')}")
+                        logger.info("Using Firebase project: %s", creds_content.get('project_id'))
                         
                         # Initialize Firebase with credentials
                         cred = credentials.Certificate(firebase_sdk_path)
@@ -253,42 +341,38 @@ try:
                         firebase_app = firebase_admin.initialize_app(cred, {
                             'storageBucket': "grad-project32.firebasestorage.app"
                         })
-                        print(f"Firebase app initialized with project ID: {firebase_app.project_id}")
+                        logger.info("Firebase app initialized with project ID: %s", firebase_app.project_id)
                         
                         # Initialize Firestore
                         db = firestore.client()
-                        print("Firestore client initialized")
                         
                         # Initialize Storage bucket
                         bucket = storage.bucket(name="grad-project32.firebasestorage.app")
-                        print(f"Storage bucket initialized: {bucket.name}")
+                        logger.info("Firestore and Storage bucket %s initialized", bucket.name)
                         
-                        # Test the bucket
-                        try:
-                            bucket_metadata = bucket.get_iam_policy()
-                            print("Storage bucket access verified")
-                        except Exception as bucket_error:
-                            print(f"Warning: Could not access bucket metadata: {str(bucket_error)}")
-                            print("This may indicate permission issues with the bucket.")
+                        # Test the bucket (network round trip, opt-in via FIREBASE_VERIFY_BUCKET)
+                        if os.getenv('FIREBASE_VERIFY_BUCKET', 'False').lower() == 'true':
+                            try:
+                                bucket_metadata = bucket.get_iam_policy()
+                                logger.info("Storage bucket access verified")
+                            except Exception as bucket_error:
+                                logger.warning("Could not access bucket metadata (check the bucket's permissions): %s",
+                                               bucket_error)
                         
-                        print("Firebase initialized successfully")
+                        logger.info("Firebase initialized successfully")
             except json.JSONDecodeError:
-                print(f"Error: Firebase credentials file is not valid JSON: {firebase_sdk_path}")
-                print("Firebase functionality will be disabled. Some features may not work.")
+                logger.error("Firebase credentials file is not valid JSON: %s. "
+                             "Firebase functionality will be disabled.", firebase_sdk_path)
             except Exception as init_error:
-                print(f"Error initializing Firebase: {str(init_error)}")
-                traceback.print_exc()
-                print("Firebase functionality will be disabled. Some features may not work.")
+                logger.exception("Error initializing Firebase: %s. Firebase functionality will be disabled.", init_error)
         else:
-            print(f"Warning: Firebase credentials file not found at {firebase_sdk_path}")
-            print("Firebase functionality will be disabled. Some features may not work.")
+            logger.warning("Firebase credentials file not found at %s. "
+                           "Firebase functionality will be disabled.", firebase_sdk_path)
 except Exception as e:
-    print(f"Critical error during Firebase setup: {str(e)}")
-    traceback.print_exc()
-    print("Firebase functionality will be disabled. Some features may not work.")
+    logger.critical("Error during Firebase setup: %s. Firebase functionality will be disabled.", e, exc_info=True)
 
-# Store drive service instances for each user
-drive_services = {}
+# Drive service instances for each user (bounded LRU with idle expiry)
+drive_services = DriveServicePool()
 
 # Initialize the learning style model (lazy loading to save resources)
 learning_style_model = None
@@ -301,12 +385,13 @@ def load_learning_style_model():
     
     if learning_style_model is None:
         try:
+            from transformers import AutoTokenizer, AutoModelForSequenceClassification
             model_name = "pushpikaLiyanagama/student-learning-style-identify"
             learning_style_tokenizer = AutoTokenizer.from_pretrained(model_name)
             learning_style_model = AutoModelForSequenceClassification.from_pretrained(model_name)
-            print("Learning style model loaded successfully")
+            logger.info("Learning style model loaded successfully")
         except Exception as e:
-            print(f"Error loading learning style model: {e}")
+            logger.error("Error loading learning style model: %s", e)
             return False
     return True
 
@@ -316,30 +401,37 @@ def predict_learning_style(text):
         return None
     
     try:
+        import torch
         inputs = learning_style_tokenizer(text, return_tensors="pt", padding=True, truncation=True)
         outputs = learning_style_model(**inputs)
         logits = outputs.logits
         predicted_class = torch.argmax(logits, dim=1).item()
         return learning_style_labels[predicted_class]
     except Exception as e:
-        print(f"Error predicting learning style: {e}")
+        logger.error("Error predicting learning style: %s", e)
         return None
 
+def warm_up_worker():
+    """
+    Per-worker startup work for the production server: create the API clients and,
+    if PRELOAD_LEARNING_STYLE_MODEL is set, load the learning style model before the
+    first request instead of during it.
+    """
+    if openai_api_key:
+        get_openai_client()
+    if os.getenv('PRELOAD_LEARNING_STYLE_MODEL', 'false').lower() == 'true':
+        load_learning_style_model()
+
 def get_drive_service():
     """Get the drive service for the current user."""
     user_email = session.get('user_email')
     
-    # If no user is in session, use a default service
+    # If no user is in session, use a default service for anonymous uploads
     if not user_email:
-        # Use a default service for anonymous uploads
-        if 'default' not in drive_services:
-            drive_services['default'] = GoogleDriveService()
-        return drive_services['default']
+        return drive_services.get('default', GoogleDriveService)
         
     # Otherwise use the user-specific service
-    if user_email not in drive_services:
-        drive_services[user_email] = GoogleDriveService(user_email)
-    return drive_services[user_email]
+    return drive_services.get(user_email, lambda: GoogleDriveService(user_email))
 
 @app.route("/api/check-user", methods=["POST"])
 def check_user():
@@ -347,16 +439,16 @@ def check_user():
     try:
         data = request.json
         if not data:
-            print("Error in check_user: No JSON data provided")
+            logger.info("check_user rejected: no JSON data provided")
             return jsonify({"error": "No JSON data provided"}), 400
             
         email = data.get("email")
         
         if not email:
-            print("Error in check_user: Email is required")
+            logger.info("check_user rejected: email is required")
             return jsonify({"error": "Email is required"}), 400
             
-        print(f"Checking if user exists with email: {email}")
+        logger.debug("Checking if user exists with email: %s", email)
             
         # Check if user exists
         users_ref = db.collection("users")
@@ -368,14 +460,14 @@ def check_user():
         exists = len(results) > 0
         user_id = results[0].id if results else None
         
-        print(f"User check result - exists: {exists}, user_id: {user_id}")
+        logger.debug("User check result - exists: %s, user_id: %s", exists, user_id)
         
         return jsonify({
             "exists": exists,
             "user_id": user_id
         })
     except Exception as e:
-        print(f"Error in check_user: {str(e)}")
+        logger.error("Error in check_user: %s", e)
         return jsonify({"error": f"Failed to check user: {str(e)}"}), 500
 
 @app.route("/signup", methods=["POST"])
@@ -424,7 +516,7 @@ def signup():
             "user_id": user_ref.id
         }), 201
     except Exception as e:
-        print(f"Error in signup route: {str(e)}")
+        logger.error("Error in signup route: %s", e)
         return jsonify({"error": f"Failed to create user: {str(e)}"}), 500
 
 def allowed_file(filename):
@@ -436,115 +528,94 @@ def allowed_file(filename):
 def upload_file():
     """Upload a file to Firebase Storage and save metadata in Firestore"""
     try:
-        print("\n=== Starting file upload process ===")
-        
         # 1. Check request
-        print("1. Checking request...")
         if 'file' not in request.files:
-            print("Error: No file part in request")
+            logger.info("Upload rejected: no file part in request")
             return jsonify({"error": "No file part"}), 400
         
         file = request.files['file']
         if file.filename == '':
-            print("Error: No selected file")
+            logger.info("Upload rejected: no selected file")
             return jsonify({"error": "No selected file"}), 400
             
         # Check if file type is allowed
         if not allowed_file(file.filename):
-            print(f"Error: File type not allowed for {file.filename}")
+            logger.info("Upload rejected: file type not allowed for %s", file.filename)
             return jsonify({
                 "error": "File type not allowed. Please upload only PDF, DOC, DOCX, TXT, or PowerPoint files."
             }), 400
         
         user_id = request.form.get('userId')
         if not user_id:
-            print("Error: No user ID provided")
+            logger.info("Upload rejected: no user ID provided")
             return jsonify({"error": "User ID is required"}), 400
         
         learning_style = request.form.get('learningStyle', 'visual')
-        print(f"Request validated - File: {file.filename}, User: {user_id}, Style: {learning_style}")
         
         # 2. Generate file ID and prepare paths
         file_id = str(uuid.uuid4())
         filename = secure_filename(file.filename)
-        print(f"Generated file ID: {file_id}")
-        print(f"Secured filename: {filename}")
+        logger.debug("Uploading %s for user %s (style %s) as file %s", filename, user_id, learning_style, file_id)
         
         # 3. Save to temp file
-        print("\n2. Saving to temporary file...")
         temp_dir = os.path.join(os.getcwd(), 'temp_uploads')
         if not os.path.exists(temp_dir):
             os.makedirs(temp_dir)
-            print(f"Created temp_uploads directory at {temp_dir}")
         
         temp_path = os.path.join(temp_dir, filename)
         file.save(temp_path)
-        print(f"File saved temporarily at: {temp_path}")
         
         # 4. Debug Firebase Storage state
-        print("\n3. Checking Firebase Storage initialization...")
-        
         # Get global variables
         global bucket, firebase_app, db
         
         # Verify Firebase is initialized
         if not firebase_app:
-            print("Error: Firebase app not initialized")
+            logger.error("Firebase app not initialized")
             return jsonify({"error": "Firebase app not initialized"}), 500
             
         if not db:
-            print("Error: Firestore client not initialized")
+            logger.error("Firestore client not initialized")
             return jsonify({"error": "Firestore client not initialized"}), 500
             
         if not bucket:
-            print("Error: Firebase Storage bucket not initialized")
+            logger.error("Firebase Storage bucket not initialized")
             # Try to re-initialize the bucket
             try:
-                print("Attempting to re-initialize storage bucket...")
                 bucket = storage.bucket(name="grad-project32.firebasestorage.app")
-                print(f"Re-initialized storage bucket: {bucket.name}")
+                logger.info("Re-initialized storage bucket: %s", bucket.name)
             except Exception as bucket_error:
-                print(f"Failed to re-initialize bucket: {str(bucket_error)}")
+                logger.error("Failed to re-initialize bucket: %s", bucket_error)
                 return jsonify({"error": "Firebase Storage not available. Could not initialize bucket."}), 500
 
         # Print bucket name for verification
         try:
             bucket_name = bucket.name
-            print(f"Using Firebase Storage bucket: {bucket_name}")
         except Exception as e:
-            print(f"Error accessing bucket name: {str(e)}")
+            logger.error("Error accessing bucket name: %s", e)
             return jsonify({"error": f"Firebase Storage bucket error: {str(e)}"}), 500
 
         # 5. Create folder structure and upload to Firebase Storage
-        print("\n4. Creating folder structure in Firebase Storage...")
         # Define storage path with folder structure
         storage_path = f"users/{user_id}/{file_id}/{filename}"
-        print(f"Storage path: {storage_path}")
 
         try:
             # Create an empty placeholder file to ensure folder structure exists
             folder_path = f"users/{user_id}/{file_id}/"
             placeholder = bucket.blob(folder_path + ".placeholder")
             placeholder.upload_from_string("")
-            print(f"Created folder structure: {folder_path}")
             
             # Now create the actual file blob
             blob = bucket.blob(storage_path)
-            print("Created blob reference")
-            
-            print(f"Uploading file from {temp_path}...")
             with open(temp_path, 'rb') as file_obj:
                 blob.upload_from_file(file_obj)
-            print("File uploaded to Firebase Storage successfully")
+            logger.debug("Uploaded %s to Storage at %s", filename, storage_path)
             
             # 6. Make file public and get URL
-            print("\n5. Making file public...")
             blob.make_public()
             download_url = blob.public_url
-            print(f"File made public. URL: {download_url}")
             
             # 7. Save metadata to Firestore
-            print("\n6. Saving metadata to Firestore...")
             file_data = {
                 "name": filename,
                 "type": file.content_type,
@@ -561,15 +632,12 @@ def upload_file():
             # Save to Firestore
             file_ref = db.collection("files").document(file_id)
             file_ref.set(file_data)
-            print(f"Metadata saved to Firestore. Document ID: {file_id}")
             
             # 8. Clean up
-            print("\n7. Cleaning up...")
             if os.path.exists(temp_path):
                 os.remove(temp_path)
-                print(f"Temporary file removed: {temp_path}")
             
-            print("\n=== Upload process completed successfully ===")
+            logger.info("Uploaded file %s (%s, %s bytes) for user %s", file_id, filename, file_data["size"], user_id)
             return jsonify({
                 "success": True,
                 "fileId": file_id,
@@ -577,9 +645,7 @@ def upload_file():
                 "message": "File uploaded successfully"
             })
         except Exception as storage_error:
-            print("🔥 STORAGE ERROR 🔥")
-            print(f"Firebase Storage error: {str(storage_error)}")
-            traceback.print_exc()
+            logger.exception("Firebase Storage error during upload: %s", storage_error)
             
             # More specific error message
             error_message = str(storage_error)
@@ -593,14 +659,11 @@ def upload_file():
             }), 500
             
     except Exception as e:
-        print(f"\nError during upload: {str(e)}")
-        print("Detailed error trace:")
-        traceback.print_exc()
+        logger.exception("Error during upload: %s", e)
         
         # Clean up temp file if it exists
         if 'temp_path' in locals() and os.path.exists(temp_path):
             os.remove(temp_path)
-            print(f"Cleaned up temporary file after error: {temp_path}")
         
         return jsonify({
             "success": False,
@@ -630,15 +693,7 @@ def upload_to_drive():
     use_local_storage = request.form.get('useLocalStorage', 'false').lower() == 'true'
 
     try:
-        # Create temp directory if it doesn't exist
-        if not os.path.exists('temp_uploads'):
-            os.makedirs('temp_uploads')
-            
         filename = secure_filename(file.filename)
-        temp_path = os.path.join('temp_uploads', filename)
-        
-        # Save file temporarily
-        file.save(temp_path)
         
         # If explicitly requested local storage, don't try Google Drive
         if use_local_storage:
@@ -648,12 +703,7 @@ def upload_to_drive():
                 os.makedirs(local_file_dir)
                 
             local_path = os.path.join(local_file_dir, filename)
-            import shutil
-            shutil.copy(temp_path, local_path)
-            
-            # Clean up temporary file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            file.save(local_path)
                 
             return jsonify({
                 'success': True,
@@ -685,12 +735,7 @@ def upload_to_drive():
                 os.makedirs(local_file_dir)
                 
             local_path = os.path.join(local_file_dir, filename)
-            import shutil
-            shutil.copy(temp_path, local_path)
-            
-            # Return success with a warning about local storage
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            file.save(local_path)
                 
             return jsonify({
                 'success': True,
@@ -699,19 +744,11 @@ def upload_to_drive():
                 'learning_style': learning_style
             })
         
-        # Include learning style in metadata
-        result = drive_service.upload_file(temp_path, filename, learning_style)
-        
-        # Clean up temporary file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        # Upload straight from the request stream, including learning style in metadata
+        result = drive_service.upload_stream(file.stream, filename, file.mimetype, learning_style)
         
         return jsonify(result)
     except Exception as e:
-        # Clean up temp file if it exists
-        temp_path = os.path.join('temp_uploads', secure_filename(file.filename))
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/drive/download/<file_id>', methods=['GET'])
@@ -726,43 +763,34 @@ def download_from_drive(file_id):
         if not file_metadata['success']:
             return jsonify(file_metadata), 400
 
-        # Create temp directory if it doesn't exist
-        if not os.path.exists('temp_uploads'):
-            os.makedirs('temp_uploads')
-
-        # Generate temp file path using original name for correct extension
-        temp_path = os.path.join('temp_uploads', file_metadata['name'])
-        
-        # Download the file
-        result = drive_service.download_file(file_id, temp_path)
-        
-        if result['success']:
-            try:
-                # If custom filename is provided, use it with original extension
-                if custom_filename:
-                    original_ext = os.path.splitext(file_metadata['name'])[1]
-                    download_name = f"{custom_filename}{original_ext}"
-                else:
-                    download_name = file_metadata['name']
-
-                # Send the file to the client
-                response = send_file(
-                    temp_path,
-                    as_attachment=True,
-                    download_name=download_name
-                )
-                # Clean up the temp file after sending
-                @response.call_on_close
-                def cleanup():
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                return response
-            except Exception as e:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                raise e
+        # If custom filename is provided, use it with original extension
+        if custom_filename:
+            original_ext = os.path.splitext(file_metadata['name'])[1]
+            download_name = f"{custom_filename}{original_ext}"
         else:
-            return jsonify(result), 400
+            download_name = file_metadata['name']
+
+        # Fetch the first chunk before responding so Drive errors are still reported as JSON
+        chunks = drive_service.iter_download(file_id)
+        try:
+            first_chunk = next(chunks, b'')
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        def stream_file():
+            yield first_chunk
+            yield from chunks
+
+        headers = {'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"}
+        if file_metadata.get('size'):
+            headers['Content-Length'] = file_metadata['size']
+        
+        # Stream the file to the client as it is downloaded from Drive
+        return Response(
+            stream_with_context(stream_file()),
+            mimetype=file_metadata.get('mimeType') or 'application/octet-stream',
+            headers=headers
+        )
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -770,8 +798,9 @@ def download_from_drive(file_id):
 def list_drive_files():
     try:
         page_size = request.args.get('pageSize', default=10, type=int)
+        page_token = request.args.get('pageToken')
         drive_service = get_drive_service()
-        result = drive_service.list_files(page_size=page_size)
+        result = drive_service.list_files(page_size=page_size, page_token=page_token)
         return jsonify(result)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -780,8 +809,8 @@ def list_drive_files():
 def auth_status():
     """Check if user is authenticated."""
     user_email = session.get('user_email')
-    if user_email and user_email in drive_services:
-        drive_service = drive_services[user_email]
+    drive_service = drive_services.peek(user_email) if user_email else None
+    if drive_service:
         return jsonify({
             'isAuthenticated': drive_service.is_authenticated(),
             'user': {'email': user_email}
@@ -808,7 +837,7 @@ def oauth2callback():
         
         if user_email:
             session['user_email'] = user_email
-            drive_services[user_email] = drive_service
+            drive_services.put(user_email, drive_service)
             return """
                 <script>
                     window.opener.postMessage('authentication_successful', '*');
@@ -817,15 +846,19 @@ def oauth2callback():
             """
         return jsonify({'success': False, 'error': 'Authentication failed'})
     except Exception as e:
-        print(f"OAuth callback error: {str(e)}")
+        logger.error("OAuth callback error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/drive/auth/logout', methods=['POST'])
 def logout():
-    """Handle user logout."""
+    """Handle user logout: drop the user's Drive service and stored token."""
     user_email = session.get('user_email')
-    if user_email in drive_services:
-        del drive_services[user_email]
+    if user_email:
+        drive_services.pop(user_email)
+        try:
+            forget_credentials(user_email)
+        except Exception as e:
+            logger.error("Error deleting stored Drive credentials: %s", e)
     session.clear()
     return jsonify({'success': True})
 
@@ -839,6 +872,47 @@ def delete_file(file_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/drive/batch', methods=['POST'])
+def drive_batch():
+    """
+    Run a bulk Drive operation and return a result per file.
+    Accepts JSON with 'operation' ('delete', 'metadata' or 'update_properties') and either
+    'fileIds' (delete, metadata) or 'updates': [{'fileId': ..., 'properties': {...}}].
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        operation = data.get('operation')
+        drive_service = get_drive_service()
+        if not drive_service.is_authenticated():
+            return jsonify({'success': False, 'error': 'Not authenticated with Google Drive'}), 401
+        
+        if operation in ('delete', 'metadata'):
+            file_ids = data.get('fileIds')
+            if not isinstance(file_ids, list) or not file_ids:
+                return jsonify({'success': False, 'error': 'fileIds must be a non-empty list'}), 400
+            if operation == 'delete':
+                results = drive_service.delete_files(file_ids)
+            else:
+                results = drive_service.get_files_metadata(file_ids)
+        elif operation == 'update_properties':
+            updates = data.get('updates')
+            if not isinstance(updates, list) or not updates or not all(
+                    isinstance(update, dict) and update.get('fileId') and isinstance(update.get('properties'), dict)
+                    for update in updates):
+                return jsonify({'success': False, 'error': 'updates must be a non-empty list of {fileId, properties}'}), 400
+            results = drive_service.update_files_properties(
+                [(update['fileId'], update['properties']) for update in updates])
+        else:
+            return jsonify({'success': False, 'error': "operation must be 'delete', 'metadata' or 'update_properties'"}), 400
+        
+        return jsonify({
+            'success': all(result['success'] for result in results),
+            'results': results
+        })
+    except Exception as e:
+        logger.error("Error running Drive batch: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/predict-learning-style', methods=['POST'])
 def predict_style():
     """Endpoint to predict learning style from text"""
@@ -1013,13 +1087,14 @@ def store_quiz_score():
             return jsonify({"success": True, "message": "New user created with quiz score"})
         
     except Exception as e:
-        print(f"Error saving quiz score: {str(e)}")
+        logger.error("Error saving quiz score: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
-@app.route('/api/user/quiz-scores', methods=['POST'])
+@app.route('/api/user/quiz-scores', methods=['GET', 'POST'])
+@cached_json()
 def get_user_quiz_scores():
-    """Endpoint to get user's quiz scores from Firestore"""
-    data = request.json
+    """Endpoint to get user's quiz scores from Firestore (GET with ?email= supports conditional requests)"""
+    data = request.args if request.method == 'GET' else (request.json or {})
     email = data.get("email")
     uid = data.get("uid")
     
@@ -1059,7 +1134,7 @@ def get_user_quiz_scores():
             }), 404
         
     except Exception as e:
-        print(f"Error getting quiz scores: {str(e)}")
+        logger.error("Error getting quiz scores: %s", e)
         return jsonify({
             "success": False, 
             "error": str(e),
@@ -1090,7 +1165,7 @@ def list_local_files():
                             'modified': modified_time,
                             'learning_style': learning_style
                         })
-        else:
+        elif os.path.exists(base_dir):
             # Look in all style directories
             for style in os.listdir(base_dir):
                 style_dir = os.path.join(base_dir, style)
@@ -1116,37 +1191,112 @@ def list_local_files():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Fields returned by the file list endpoints; generated content is only returned by
+# the detail endpoint (GET /api/files/<file_id>)
+FILE_LIST_FIELDS = [
+    "name", "type", "size", "storagePath", "downloadUrl", "userId", "learningStyle",
+    "status", "processed", "processingStatus", "processingError", "createdAt", "updatedAt",
+    "readingWritingDocxUrl", "readingWritingPdfUrl", "processedDownloadUrl",
+    "readingWritingGeneratedAt", "auditoryGeneratedAt", "kinestheticGeneratedAt",
+    "visualGeneratedAt", "summaryGeneratedAt", "artifacts"
+]
+FILE_LIST_MAX_LIMIT = 100
+
+def list_user_files(user_id):
+    """
+    List a user's files, newest first, for the list endpoints.
+    Query parameters:
+    - limit: page size (max FILE_LIST_MAX_LIMIT); all files when omitted
+    - startAfter: ID of the last file of the previous page
+    - view: 'full' returns whole documents instead of the list fields
+    Returns (files, next_cursor); raises ValueError (a 400 for the routes) for a bad cursor.
+    """
+    limit = request.args.get('limit', type=int)
+    start_after = request.args.get('startAfter')
+    full_view = request.args.get('view') == 'full'
+    
+    query = db.collection("files").where("userId", "==", user_id).order_by("createdAt", direction=firestore.Query.DESCENDING)
+    if not full_view:
+        # Field mask: Firestore only sends the list-view fields
+        query = query.select(FILE_LIST_FIELDS)
+    if start_after:
+        # The cursor only needs the ordering field, and must be one of the listed user's files
+        cursor_doc = db.collection("files").document(start_after).get(field_paths=["userId", "createdAt"])
+        if not cursor_doc.exists or (cursor_doc.to_dict() or {}).get("userId") != user_id:
+            raise ValueError(f"Invalid startAfter cursor: {start_after}")
+        query = query.start_after(cursor_doc)
+    if limit:
+        limit = max(1, min(limit, FILE_LIST_MAX_LIMIT))
+        query = query.limit(limit)
+    
+    files = []
+    for doc in query.stream():
+        file_data = doc.to_dict()
+        file_data['id'] = doc.id  # Add document ID
+        files.append(file_data)
+    
+    next_cursor = files[-1]['id'] if limit and len(files) == limit else None
+    return files, next_cursor
+
 @app.route('/api/files/user/<user_id>', methods=['GET'])
+@cached_json()
 def get_user_files(user_id):
-    """Get all files for a specific user from Firestore"""
+    """Get files for a specific user from Firestore (list fields only, optionally paginated)"""
     try:
-        # Query Firestore for files that belong to this user
-        files_ref = db.collection('files').where('userId', '==', user_id).order_by('createdAt', direction=firestore.Query.DESCENDING)
-        files_docs = files_ref.get()
-        
-        # Convert to list of dictionaries
-        files = []
-        for doc in files_docs:
-            file_data = doc.to_dict()
-            file_data['id'] = doc.id
-            files.append(file_data)
+        files, next_cursor = list_user_files(user_id)
             
         return jsonify({
             'success': True,
-            'files': files
+            'files': files,
+            'nextCursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        print(f"Error getting files for user {user_id}: {str(e)}")
+        logger.error("Error getting files for user %s: %s", user_id, e)
         return jsonify({
             'success': False,
             'error': f"Failed to retrieve files: {str(e)}"
         }), 500
 
+@app.route('/api/files/<file_id>', methods=['GET'])
+def get_file_detail(file_id):
+    """
+    Get a single file document including its generated content.
+    Accepts an optional comma-separated 'fields' query parameter to fetch only those fields.
+    """
+    try:
+        fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+        
+        doc_ref = db.collection("files").document(file_id)
+        if fields:
+            # Artifact pointers are needed to know which artifacts to load
+            doc = doc_ref.get(field_paths=fields + ["artifacts"])
+        else:
+            doc = doc_ref.get()
+        
+        if not doc.exists:
+            return jsonify({"error": "File not found"}), 404
+        
+        file_data = doc.to_dict()
+        # Generated content lives in the artifacts subcollection; load what was asked for
+        file_data.update(load_artifacts(db, doc_ref, file_data, fields or None))
+        if fields and "artifacts" not in fields:
+            file_data.pop("artifacts", None)
+        file_data['id'] = doc.id
+        return jsonify({
+            "success": True,
+            "file": file_data
+        })
+    except Exception as e:
+        logger.exception("Error getting file %s: %s", file_id, e)
+        return jsonify({"error": f"Failed to get file: {str(e)}"}), 500
+
 @app.route('/api/files/<file_id>', methods=['DELETE'])
 def delete_file_metadata(file_id):
     """Delete file metadata from Firestore"""
     try:
-        print(f"Attempting to delete file metadata with ID: {file_id}")
+        logger.debug("Attempting to delete file metadata with ID: %s", file_id)
         
         # Check for required parameters
         if not file_id:
@@ -1159,9 +1309,10 @@ def delete_file_metadata(file_id):
         if not file_doc.exists:
             return jsonify({"error": "File not found"}), 404
         
-        # Delete from Firestore
+        # Delete from Firestore, including the generated artifacts
+        delete_artifacts(db, file_ref)
         file_ref.delete()
-        print(f"Deleted file metadata from Firestore with ID: {file_id}")
+        logger.debug("Deleted file metadata from Firestore with ID: %s", file_id)
         
         return jsonify({
             "success": True,
@@ -1169,43 +1320,37 @@ def delete_file_metadata(file_id):
         })
         
     except Exception as e:
-        print(f"Error deleting file: {str(e)}")
+        logger.error("Error deleting file: %s", e)
         return jsonify({
             "success": False,
             "error": f"Failed to delete file: {str(e)}"
         }), 500
 
 @app.route('/api/files', methods=['GET'])
+@cached_json()
 def get_files():
-    """Get files for a specific user from Firestore"""
+    """Get files for a specific user from Firestore (list fields only, optionally paginated)"""
     try:
         user_id = request.args.get('userId')
         if not user_id:
             return jsonify({"error": "User ID is required"}), 400
-        print(f"Fetching files for user: {user_id}")
-        
-        files = []
+        logger.debug("Fetching files for user: %s", user_id)
         
-        # Query files in Firestore
-        files_ref = db.collection("files")
-        query = files_ref.where("userId", "==", user_id).order_by("createdAt", direction=firestore.Query.DESCENDING)
+        files, next_cursor = list_user_files(user_id)
         
-        for doc in query.stream():
-            file_data = doc.to_dict()
-            file_data['id'] = doc.id  # Add document ID
-            files.append(file_data)
-        
-        print(f"Found {len(files)} files for user {user_id} in Firestore")
+        logger.debug("Found %s files for user %s in Firestore", len(files), user_id)
         
         return jsonify({
             "success": True,
             "files": files,
+            "nextCursor": next_cursor,
             "source": "firebase"
         })
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error getting files: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error getting files: %s", e)
         return jsonify({"error": f"Failed to get files: {str(e)}"}), 500
 
 @app.route('/api/files/<file_id>/process', methods=['POST'])
@@ -1215,14 +1360,14 @@ def process_document(file_id):
     processes its content, and updates its status in Firestore.
     """
     try:
-        print(f"Processing document with ID: {file_id}")
+        logger.debug("Processing document with ID: %s", file_id)
         
         # Get the document metadata from Firestore
         doc_ref = db.collection("files").document(file_id)
         doc = doc_ref.get()
         
         if not doc.exists:
-            print(f"Document with ID {file_id} not found")
+            logger.warning("Document with ID %s not found", file_id)
             return jsonify({"error": "Document not found"}), 404
         
         doc_data = doc.to_dict()
@@ -1236,7 +1381,7 @@ def process_document(file_id):
         # Get storage path from metadata
         storage_path = doc_data.get("storagePath")
         if not storage_path:
-            print(f"Storage path not found in document metadata")
+            logger.warning("Storage path not found in document metadata")
             doc_ref.update({
                 "processingStatus": "failed",
                 "processingError": "Storage path not found in document metadata",
@@ -1254,11 +1399,12 @@ def process_document(file_id):
         blob = bucket.blob(storage_path)
         
         try:
-            blob.download_to_filename(temp_path)
-            print(f"Downloaded file for processing to: {temp_path}")
+            with span('storage_download'):
+                blob.download_to_filename(temp_path)
+            logger.debug("Downloaded file for processing to: %s", temp_path)
         except Exception as e:
             error_msg = f"Error downloading file: {str(e)}"
-            print(error_msg)
+            logger.error("Error downloading file %s: %s", file_id, e)
             doc_ref.update({
                 "processingStatus": "failed",
                 "processingError": error_msg,
@@ -1271,7 +1417,7 @@ def process_document(file_id):
             # This is where you would implement text extraction based on file type
             # For now, we'll simulate this with a placeholder
             extracted_text = "This is placeholder text extracted from the document."
-            print(f"Text extracted from document: {len(extracted_text)} characters")
+            logger.debug("Text extracted from document: %s characters", len(extracted_text))
             
             # Generate content with AI based on learning style
             learning_style = doc_data.get("learningStyle", "visual")
@@ -1297,9 +1443,8 @@ def process_document(file_id):
             processed_download_url = processed_blob.public_url
             
             # Update document metadata with processing results
-            doc_ref.update({
+            write_artifact(db, doc_ref, "processedContent", processed_content, {
                 "processingStatus": "completed",
-                "processedContent": processed_content,
                 "processedStoragePath": processed_storage_path,
                 "processedDownloadUrl": processed_download_url,
                 "updatedAt": datetime.now()
@@ -1320,8 +1465,7 @@ def process_document(file_id):
             
         except Exception as e:
             error_msg = f"Error processing document: {str(e)}"
-            print(error_msg)
-            traceback.print_exc()
+            logger.exception("Error processing document %s: %s", file_id, e)
             doc_ref.update({
                 "processingStatus": "failed",
                 "processingError": error_msg,
@@ -1330,28 +1474,33 @@ def process_document(file_id):
             return jsonify({"error": error_msg}), 500
         
     except Exception as e:
-        print(f"Error processing document: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error processing document: %s", e)
         return jsonify({"error": f"Error processing document: {str(e)}"}), 500
 
 @app.route('/api/download/<file_id>/<format>', methods=['GET'])
 def download_processed_document(file_id, format):
     """Download a processed document from Firebase Storage"""
     try:
-        print(f"Attempting to download processed document with ID: {file_id} in format: {format}")
+        logger.debug("Attempting to download processed document with ID: %s in format: %s", file_id, format)
         
         # Get the file metadata from Firestore
         file_doc = db.collection("files").document(file_id).get()
         
         if not file_doc.exists:
-            print(f"File with ID {file_id} not found in Firestore")
+            logger.warning("File with ID %s not found in Firestore", file_id)
             return jsonify({"error": "File not found"}), 404
         
         file_data = file_doc.to_dict()
         
+        # Reading/writing study guides are served from the Storage cache or rendered on first download
+        if format in STUDY_GUIDE_FORMATS:
+            reading_writing_content = load_artifact(file_doc.reference, file_data, "readingWritingContent")
+            if reading_writing_content:
+                return send_study_guide(file_id, file_data, reading_writing_content, format)
+        
         # Check if the file has been processed
         if file_data.get("processingStatus") != "completed":
-            print(f"File with ID {file_id} has not been processed yet or processing failed")
+            logger.warning("File with ID %s has not been processed yet or processing failed", file_id)
             return jsonify({
                 "error": "File has not been processed yet or processing failed", 
                 "status": file_data.get("processingStatus", "unknown")
@@ -1360,7 +1509,7 @@ def download_processed_document(file_id, format):
         # Get processed file path from metadata
         processed_storage_path = file_data.get("processedStoragePath")
         if not processed_storage_path:
-            print(f"Processed storage path not found in file metadata")
+            logger.warning("Processed storage path not found in file metadata")
             return jsonify({"error": "Processed file path not found"}), 400
         
         # Create temp dir if it doesn't exist
@@ -1375,10 +1524,11 @@ def download_processed_document(file_id, format):
         blob = bucket.blob(processed_storage_path)
         
         try:
-            blob.download_to_filename(temp_path)
-            print(f"Downloaded processed file to: {temp_path}")
+            with span('storage_download'):
+                blob.download_to_filename(temp_path)
+            logger.debug("Downloaded processed file to: %s", temp_path)
         except Exception as e:
-            print(f"Error downloading processed file: {str(e)}")
+            logger.error("Error downloading processed file: %s", e)
             return jsonify({"error": f"Error downloading processed file: {str(e)}"}), 500
         
         # Generate appropriate filename
@@ -1398,20 +1548,19 @@ def download_processed_document(file_id, format):
         def cleanup():
             if os.path.exists(temp_path):
                 os.remove(temp_path)
-                print(f"Cleaned up temporary file: {temp_path}")
+                logger.debug("Cleaned up temporary file: %s", temp_path)
         
         return response
     
     except Exception as e:
-        print(f"Error serving processed file: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error serving processed file: %s", e)
         return jsonify({"error": f"Error serving processed file: {str(e)}"}), 500
 
 def create_preflight_response():
     """Create a preflight response for CORS requests"""
     response = jsonify({})
     response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Accept,X-Requested-With')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Accept,X-Requested-With,If-None-Match,Prefer,X-Request-ID')
     response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS,PATCH')
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
@@ -1434,7 +1583,7 @@ def update_learning_style(file_id):
             return jsonify({'success': False, 'error': f'Invalid learning style. Must be one of: {", ".join(valid_styles)}'}), 400
         
         # Update document in Firestore
-        print(f"Updating file {file_id} learning style to: {new_style}")
+        logger.debug("Updating file %s learning style to: %s", file_id, new_style)
         
         # Update in Firestore
         db.collection('files').document(file_id).update({
@@ -1450,14 +1599,14 @@ def update_learning_style(file_id):
         }), 200
         
     except Exception as e:
-        print(f"Error in update_learning_style: {e}")
+        logger.error("Error in update_learning_style: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/files/<file_id>', methods=['PATCH'])
 def update_file(file_id):
     """Update file properties in Firestore"""
     try:
-        print(f"Attempting to update file with ID: {file_id}")
+        logger.debug("Attempting to update file with ID: %s", file_id)
         
         # Check for required parameters
         if not file_id:
@@ -1486,7 +1635,7 @@ def update_file(file_id):
                 return jsonify({"success": False, "error": f"Invalid learning style. Must be one of: {', '.join(valid_styles)}"}), 400
                 
             update_data['learningStyle'] = data['learningStyle']
-            print(f"Updating learning style to: {data['learningStyle']}")
+            logger.debug("Updating learning style to: %s", data['learningStyle'])
             
         # Add other updateable fields as needed
         
@@ -1499,7 +1648,7 @@ def update_file(file_id):
             
         # Update the document
         file_ref.update(update_data)
-        print(f"Updated file {file_id} with data: {update_data}")
+        logger.debug("Updated file %s with data: %s", file_id, update_data)
         
         # Get the updated document
         updated_doc = file_ref.get()
@@ -1512,29 +1661,11 @@ def update_file(file_id):
         }), 200
             
     except Exception as e:
-        print(f"Error updating file: {e}")
+        logger.error("Error updating file: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
-# Set up OpenAI API key
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    print("WARNING: OPENAI_API_KEY environment variable not set")
-    print("Please set the OPENAI_API_KEY environment variable to use OpenAI features")
-else:
-    print("OpenAI API key loaded successfully")
-
-# Create OpenAI client
-client = OpenAI(api_key=openai_api_key)
-
-# Initialize SerpAPI key
-serpapi_key = os.getenv("SERPAPI_API_KEY")
-if not serpapi_key:
-    print("WARNING: SERPAPI_API_KEY environment variable not set")
-    print("Please set the SERPAPI_API_KEY environment variable to use image search features")
-else:
-    print("SerpAPI key loaded successfully")
-
 # Function to extract text from documents based on file type
+@timed('extract_text')
 def extract_text_from_document(file_path):
     """Extract text from various document formats"""
     file_extension = os.path.splitext(file_path)[1].lower()
@@ -1552,37 +1683,40 @@ def extract_text_from_document(file_path):
         else:
             return f"Unsupported file format: {file_extension}"
     except Exception as e:
-        print(f"Error extracting text from document: {e}")
+        logger.error("Error extracting text from document: %s", e)
         return f"Error extracting text: {str(e)}"
 
 def extract_text_from_pdf(file_path):
     """Extract text from PDF files"""
     text = ""
     try:
+        import PyPDF2
         with open(file_path, 'rb') as file:
             reader = PyPDF2.PdfReader(file)
             for page in reader.pages:
                 text += page.extract_text() + "\n\n"
         return text
     except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
+        logger.error("Error extracting text from PDF: %s", e)
         return f"Error extracting PDF text: {str(e)}"
 
 def extract_text_from_docx(file_path):
     """Extract text from DOCX files"""
     try:
+        import docx
         doc = docx.Document(file_path)
         text = ""
         for para in doc.paragraphs:
             text += para.text + "\n"
         return text
     except Exception as e:
-        print(f"Error extracting text from DOCX: {e}")
+        logger.error("Error extracting text from DOCX: %s", e)
         return f"Error extracting DOCX text: {str(e)}"
 
 def extract_text_from_pptx(file_path):
     """Extract text from PPTX files"""
     try:
+        from pptx import Presentation
         prs = Presentation(file_path)
         text = ""
         for slide in prs.slides:
@@ -1592,385 +1726,93 @@ def extract_text_from_pptx(file_path):
             text += "\n"
         return text
     except Exception as e:
-        print(f"Error extracting text from PPTX: {e}")
+        logger.error("Error extracting text from PPTX: %s", e)
         return f"Error extracting PPTX text: {str(e)}"
 
+def mock_reading_writing_content():
+    """Reading/writing content used for development without an OpenAI API key"""
+    return {
+        "title": "Reading/Writing Learning Materials",
+        "description": "This content has been optimized for reading/writing learners.",
+        "elements": [
+            {
+                "type": "text",
+                "content": "# Main Concepts\n\n" + 
+                          "The document covers the following key areas:\n\n" +
+                          "1. Introduction to the topic\n" +
+                          "2. Core principles and methodologies\n" +
+                          "3. Practical applications\n\n" +
+                          "## Detailed Notes\n\n" +
+                          "Lorem ipsum dolor sit amet, consectetur adipiscing elit. Ut at ex ac libero pellentesque molestie. Donec interdum ante et nisi dignissim, in consectetur tellus porttitor.\n\n" +
+                          "### Key Points:\n" +
+                          "* Point 1: Important information about the topic\n" +
+                          "* Point 2: Critical analysis of the concept\n" +
+                          "* Point 3: Practical implementation strategies\n\n" +
+                          "## Summary\n\n" +
+                          "This section summarizes the main ideas presented in the document and provides a coherent overview of the material.",
+                "caption": "Structured Notes"
+            }
+        ]
+    }
+
+def reading_writing_error_content(error, document_text):
+    """Reading/writing content reporting a generation error"""
+    return {
+        "title": "Reading/Writing Learning Materials (Error)",
+        "description": "There was an error processing this document.",
+        "elements": [
+            {
+                "type": "text",
+                "content": f"Error generating reading/writing content: {str(error)}\n\nOriginal text (partial):\n\n{document_text[:500]}...",
+                "caption": "Error Processing Document"
+            }
+        ]
+    }
+
 def generate_reading_writing_content(document_text):
     """
     Generate content optimized for reading/writing learning style using OpenAI
     """
     if not openai_api_key:
         # Return a mock response for development without API key
-        print("Using mock response for reading/writing content (No API key)")
-        return {
-            "title": "Reading/Writing Learning Materials",
-            "description": "This content has been optimized for reading/writing learners.",
-            "elements": [
-                {
-                    "type": "text",
-                    "content": "# Main Concepts\n\n" + 
-                              "The document covers the following key areas:\n\n" +
-                              "1. Introduction to the topic\n" +
-                              "2. Core principles and methodologies\n" +
-                              "3. Practical applications\n\n" +
-                              "## Detailed Notes\n\n" +
-                              "Lorem ipsum dolor sit amet, consectetur adipiscing elit. Ut at ex ac libero pellentesque molestie. Donec interdum ante et nisi dignissim, in consectetur tellus porttitor.\n\n" +
-                              "### Key Points:\n" +
-                              "* Point 1: Important information about the topic\n" +
-                              "* Point 2: Critical analysis of the concept\n" +
-                              "* Point 3: Practical implementation strategies\n\n" +
-                              "## Summary\n\n" +
-                              "This section summarizes the main ideas presented in the document and provides a coherent overview of the material.",
-                    "caption": "Structured Notes"
-                }
-            ]
-        }
+        logger.debug("Using mock response for reading/writing content (No API key)")
+        return mock_reading_writing_content()
         
     try:
-        # Truncate the document_text if it's too long for a single API call
-        truncated_text = document_text[:7000] if len(document_text) > 7000 else document_text
-        
         # First, get an overview and main topics from the document
-        overview_response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an expert educator specializing in identifying main topics and creating structured outlines. Extract the main topics from this document and create a brief outline."},
-                {"role": "user", "content": f"Extract the 3-6 main topics from this document and provide a brief overview:\n\n{truncated_text[:1500]}"}
-            ],
-            max_tokens=500,
-            temperature=0.5
-        )
-        
+        overview_response = llm_gateway.chat(study_guide_overview_request(document_text))
         overview_text = overview_response.choices[0].message.content
         
-        # Divide the document into chunks of approximately 3000 characters
-        chunk_size = 3000
-        chunks = []
-        for i in range(0, len(document_text), chunk_size):
-            chunks.append(document_text[i:i + chunk_size])
-        
-        # Limit to 5 chunks maximum to avoid excessive API calls
-        chunks = chunks[:5]
-        
-        # Process each chunk separately
+        # Process each chunk (at most 5, to avoid excessive API calls) separately
         processed_chunks = []
-        
-        for i, chunk in enumerate(chunks):
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": """You are an expert educator specializing in creating detailed educational content. Your goal is to explain concepts thoroughly while maintaining engagement and clarity. Create content that teaches concepts as if explaining to someone learning about them for the first time.
-
-Follow these guidelines:
-1. Start each major section with a brief overview paragraph that introduces the concept
-2. Break down complex topics into clear explanations with:
-   - Detailed paragraphs that thoroughly explain each concept
-   - Bullet points for key features, components, or steps
-   - Examples and real-world applications to reinforce understanding
-3. Use "Understanding X" sections to provide deeper insights into important concepts
-4. Include "Key Concept" boxes (using > for blockquotes) to highlight crucial information
-5. Add "For Example" sections to demonstrate practical applications
-
-Format using:
-- Clear headings (# for main topics, ## for subtopics, ### for specific concepts)
-- Paragraphs for detailed explanations
-- Bullet points for features and components
-- Blockquotes (>) for key concept boxes
-- Numbered lists for steps and processes"""},
-                    {"role": "user", "content": f"You're processing part {i+1} of a larger document. Create educational content that explains the concepts in this chunk, ensuring it flows well as part of a larger study guide:\n\n{chunk}"}
-                ],
-                max_tokens=1500,
-                temperature=0.7
-            )
-            
-            # Extract the formatted text from the API response
-            formatted_chunk = response.choices[0].message.content
-            processed_chunks.append(formatted_chunk)
+        for i, chunk in enumerate(study_guide_chunks(document_text)):
+            response = llm_gateway.chat(study_guide_chunk_request(i, chunk))
+            processed_chunks.append(response.choices[0].message.content)
         
         # Combine the overview with the processed chunks
-        combined_content = f"# Document Study Guide\n\n## Overview\n\n{overview_text}\n\n"
-        for i, chunk in enumerate(processed_chunks):
-            combined_content += f"\n## Part {i+1}\n\n{chunk}\n\n"
-            
-        combined_content += "\n## Study Tips\n\n* Review each section thoroughly before proceeding to the next\n* Create your own notes based on the key points\n* Try to explain these concepts in your own words\n* Practice applying these concepts to real-world scenarios"
-            
-        # Structure the response
-        return {
-            "title": "Reading/Writing Learning Materials",
-            "description": "This content has been optimized for reading/writing learners with structured notes, clear headings, and organized points.",
-            "elements": [
-                {
-                    "type": "text",
-                    "content": combined_content,
-                    "caption": "Structured Study Guide"
-                }
-            ]
-        }
+        return build_study_guide_content(overview_text, processed_chunks)
         
     except Exception as e:
-        print(f"Error generating reading/writing content: {e}")
+        logger.error("Error generating reading/writing content: %s", e)
         # Return a basic response with the error
-        return {
-            "title": "Reading/Writing Learning Materials (Error)",
-            "description": "There was an error processing this document.",
-            "elements": [
-                {
-                    "type": "text",
-                    "content": f"Error generating reading/writing content: {str(e)}\n\nOriginal text (partial):\n\n{document_text[:500]}...",
-                    "caption": "Error Processing Document"
-                }
-            ]
-        }
-
-def create_docx_study_guide(content, title="Study Guide"):
-    """
-    Create a well-formatted DOCX document from the AI-generated content
-    - This version creates a DOCX with exactly the same content as the web version
-    """
-    print(f"Creating DOCX study guide with exact same content as web")
-    
-    doc = Document()
-    
-    # Set up styles
-    styles = doc.styles
-    
-    # Title style
-    title_style = styles.add_style('CustomTitle', WD_STYLE_TYPE.PARAGRAPH)
-    title_font = title_style.font
-    title_font.size = Pt(24)
-    title_font.bold = True
-    title_font.color.rgb = RGBColor(48, 84, 150)
-    
-    # Heading 1 style
-    h1_style = styles.add_style('CustomH1', WD_STYLE_TYPE.PARAGRAPH)
-    h1_font = h1_style.font
-    h1_font.size = Pt(18)
-    h1_font.bold = True
-    h1_font.color.rgb = RGBColor(94, 110, 220)
-    
-    # Heading 2 style
-    h2_style = styles.add_style('CustomH2', WD_STYLE_TYPE.PARAGRAPH)
-    h2_font = h2_style.font
-    h2_font.size = Pt(16)
-    h2_font.bold = True
-    h2_font.color.rgb = RGBColor(63, 81, 181)
-    
-    # Heading 3 style
-    h3_style = styles.add_style('CustomH3', WD_STYLE_TYPE.PARAGRAPH)
-    h3_font = h3_style.font
-    h3_font.size = Pt(14)
-    h3_font.bold = True
-    h3_font.color.rgb = RGBColor(94, 110, 220)
-    
-    # Normal text style
-    normal_style = styles.add_style('CustomNormal', WD_STYLE_TYPE.PARAGRAPH)
-    normal_font = normal_style.font
-    normal_font.size = Pt(11)
-    
-    # Add title with consistent text across all platforms
-    doc.add_paragraph("Reading/Writing Learning Materials", 'CustomTitle').alignment = WD_ALIGN_PARAGRAPH.CENTER
-    doc.add_paragraph()  # Add some space
-    
-    # Process each line of content
-    current_list = []
-    in_list = False
-    
-    for line in content.split('\n'):
-        line = line.strip()
-        if not line:
-            if in_list and current_list:
-                # Add the current list to document
-                p = doc.add_paragraph(style='CustomNormal')
-                for item in current_list:
-                    p = doc.add_paragraph(item, style='CustomNormal')
-                    p.style = 'List Bullet'
-                current_list = []
-                in_list = False
-            doc.add_paragraph()  # Add empty paragraph for spacing
-            continue
-        
-        # Handle headers
-        if line.startswith('# '):
-            if in_list: # End any current list
-                p = doc.add_paragraph(style='CustomNormal')
-                for item in current_list:
-                    p = doc.add_paragraph(item, style='CustomNormal')
-                    p.style = 'List Bullet'
-                current_list = []
-                in_list = False
-            doc.add_paragraph(line[2:], 'CustomH1')
-        elif line.startswith('## '):
-            if in_list:
-                p = doc.add_paragraph(style='CustomNormal')
-                for item in current_list:
-                    p = doc.add_paragraph(item, style='CustomNormal')
-                    p.style = 'List Bullet'
-                current_list = []
-                in_list = False
-            doc.add_paragraph(line[3:], 'CustomH2')
-        elif line.startswith('### '):
-            if in_list:
-                p = doc.add_paragraph(style='CustomNormal')
-                for item in current_list:
-                    p = doc.add_paragraph(item, style='CustomNormal')
-                    p.style = 'List Bullet'
-                current_list = []
-                in_list = False
-            doc.add_paragraph(line[4:], 'CustomH3')
-        # Handle bullet points
-        elif line.startswith('* ') or line.startswith('- '):
-            in_list = True
-            current_list.append(line[2:])
-        # Handle numbered lists
-        elif line[0].isdigit() and '. ' in line:
-            number, text = line.split('. ', 1)
-            p = doc.add_paragraph(style='CustomNormal')
-            p.style = 'List Number'
-            p.text = text
-        # Regular paragraph
-        else:
-            if in_list:
-                p = doc.add_paragraph(style='CustomNormal')
-                for item in current_list:
-                    p = doc.add_paragraph(item, style='CustomNormal')
-                    p.style = 'List Bullet'
-                current_list = []
-                in_list = False
-            doc.add_paragraph(line, 'CustomNormal')
-    
-    # Save to BytesIO
-    docx_file = BytesIO()
-    doc.save(docx_file)
-    docx_file.seek(0)
-    return docx_file
+        return reading_writing_error_content(e, document_text)
 
-def create_pdf_study_guide(content, title="Study Guide"):
-    """
-    Create a well-formatted PDF document from the AI-generated content
-    - This version creates a PDF with exactly the same content as the web version
-    """
-    print(f"Creating new PDF study guide with exact same content as web")
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
-    
-    # Get sample stylesheet and modify it
-    styles = getSampleStyleSheet()
-    
-    # Create custom styles
-    styles.add(ParagraphStyle(
-        name='CustomTitle',
-        parent=styles['Title'],
-        fontSize=24,
-        spaceAfter=30,
-        textColor=colors.HexColor('#304E96')
-    ))
-    
-    styles.add(ParagraphStyle(
-        name='CustomH1',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=16,
-        textColor=colors.HexColor('#5E6EDC')
-    ))
-    
-    styles.add(ParagraphStyle(
-        name='CustomH2',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=14,
-        textColor=colors.HexColor('#3F51B5')
-    ))
-    
-    styles.add(ParagraphStyle(
-        name='CustomH3',
-        parent=styles['Heading3'],
-        fontSize=14,
-        spaceAfter=12,
-        textColor=colors.HexColor('#5E6EDC')
-    ))
-    
-    styles.add(ParagraphStyle(
-        name='CustomBody',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=12
-    ))
-    
-    # Build the PDF content
-    elements = []
-    
-    # Add title - using a consistent title for all documents
-    elements.append(Paragraph("Reading/Writing Learning Materials", styles['CustomTitle']))
-    elements.append(Spacer(1, 12))
-    
-    current_list = []
-    in_list = False
-    
-    for line in content.split('\n'):
-        line = line.strip()
-        if not line:
-            if in_list and current_list:
-                elements.append(ListFlowable(
-                    [ListItem(Paragraph(item, styles['CustomBody'])) for item in current_list],
-                    bulletType='bullet'
-                ))
-                current_list = []
-                in_list = False
-            elements.append(Spacer(1, 12))
-            continue
-        
-        # Handle headers
-        if line.startswith('# '):
-            if in_list:
-                elements.append(ListFlowable(
-                    [ListItem(Paragraph(item, styles['CustomBody'])) for item in current_list],
-                    bulletType='bullet'
-                ))
-                current_list = []
-                in_list = False
-            elements.append(Paragraph(line[2:], styles['CustomH1']))
-        elif line.startswith('## '):
-            if in_list:
-                elements.append(ListFlowable(
-                    [ListItem(Paragraph(item, styles['CustomBody'])) for item in current_list],
-                    bulletType='bullet'
-                ))
-                current_list = []
-                in_list = False
-            elements.append(Paragraph(line[3:], styles['CustomH2']))
-        elif line.startswith('### '):
-            if in_list:
-                elements.append(ListFlowable(
-                    [ListItem(Paragraph(item, styles['CustomBody'])) for item in current_list],
-                    bulletType='bullet'
-                ))
-                current_list = []
-                in_list = False
-            elements.append(Paragraph(line[4:], styles['CustomH3']))
-        # Handle bullet points
-        elif line.startswith('* ') or line.startswith('- '):
-            in_list = True
-            current_list.append(line[2:])
-        # Handle numbered lists
-        elif line[0].isdigit() and '. ' in line:
-            number, text = line.split('. ', 1)
-            elements.append(Paragraph(f"{number}. {text}", styles['CustomBody']))
-        # Regular paragraph
-        else:
-            if in_list:
-                elements.append(ListFlowable(
-                    [ListItem(Paragraph(item, styles['CustomBody'])) for item in current_list],
-                    bulletType='bullet'
-                ))
-                current_list = []
-                in_list = False
-            elements.append(Paragraph(line, styles['CustomBody']))
+async def generate_reading_writing_content_async(document_text, priority=PRIORITY_BACKGROUND):
+    """Async version of generate_reading_writing_content; the overview and the parts are generated concurrently"""
+    if not openai_api_key:
+        logger.debug("Using mock response for reading/writing content (No API key)")
+        return mock_reading_writing_content()
     
-    # Build the PDF
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+    try:
+        overview_response, *chunk_responses = await asyncio.gather(
+            llm_gateway.achat(study_guide_overview_request(document_text), priority),
+            *(llm_gateway.achat(study_guide_chunk_request(i, chunk), priority)
+              for i, chunk in enumerate(study_guide_chunks(document_text))))
+        return build_study_guide_content(overview_response.choices[0].message.content,
+                                         [response.choices[0].message.content for response in chunk_responses])
+    except Exception as e:
+        logger.error("Error generating reading/writing content: %s", e)
+        return reading_writing_error_content(e, document_text)
 
 def test_disabled_storage():
     """Inform the user that storage is disabled"""
@@ -2041,13 +1883,13 @@ def file_not_available(file_id):
 def download_file(file_id):
     """Download a file from Firebase Storage"""
     try:
-        print(f"Attempting to download file with ID: {file_id}")
+        logger.debug("Attempting to download file with ID: %s", file_id)
         
         # Get the file metadata from Firestore
         file_doc = db.collection("files").document(file_id).get()
         
         if not file_doc.exists:
-            print(f"File with ID {file_id} not found in Firestore")
+            logger.warning("File with ID %s not found in Firestore", file_id)
             return jsonify({"error": "File not found"}), 404
         
         file_data = file_doc.to_dict()
@@ -2055,7 +1897,7 @@ def download_file(file_id):
         # Get the storage path from metadata
         storage_path = file_data.get("storagePath")
         if not storage_path:
-            print(f"Storage path not found in file metadata")
+            logger.warning("Storage path not found in file metadata")
             return jsonify({"error": "Storage path not found"}), 400
         
         # Create temp dir if it doesn't exist
@@ -2069,8 +1911,9 @@ def download_file(file_id):
         
         # Download file from Firebase Storage
         blob = bucket.blob(storage_path)
-        blob.download_to_filename(temp_path)
-        print(f"Downloaded file to: {temp_path}")
+        with span('storage_download'):
+            blob.download_to_filename(temp_path)
+        logger.debug("Downloaded file to: %s", temp_path)
         
         # Get the original filename
         filename = file_data.get("name", os.path.basename(storage_path))
@@ -2087,13 +1930,12 @@ def download_file(file_id):
         def cleanup():
             if os.path.exists(temp_path):
                 os.remove(temp_path)
-                print(f"Cleaned up temporary file: {temp_path}")
+                logger.debug("Cleaned up temporary file: %s", temp_path)
         
         return response
     
     except Exception as e:
-        print(f"Error serving file: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error serving file: %s", e)
         return jsonify({"error": f"Error serving file: {str(e)}"}), 500
 
 @app.route('/api/files/<file_id>/url', methods=['GET'])
@@ -2124,12 +1966,120 @@ def get_file_url(file_id):
             })
         
     except Exception as e:
-        print(f"Error getting file URL: {str(e)}")
+        logger.error("Error getting file URL: %s", e)
         return jsonify({"error": f"Error getting file URL: {str(e)}"}), 500
 
+def fetch_document_text(file_id, storage_path):
+    """
+    Download a stored document to a temp file, extract its text and remove the file.
+    The temp name is unique so concurrent jobs for the same file do not collide.
+    """
+    temp_dir = os.path.join(os.getcwd(), 'temp_processing')
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_path = os.path.join(temp_dir, f"{file_id}_{uuid.uuid4().hex}_{os.path.basename(storage_path)}")
+    try:
+        with span('storage_download'):
+            bucket.blob(storage_path).download_to_filename(temp_path)
+        return extract_text_from_document(temp_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+async def load_job_document(file_id):
+    """Load a file's document and extracted text for a job; returns (doc_ref, doc_data, document_text)"""
+    if not db or not bucket:
+        raise JobError("Firebase is not properly initialized", 500)
+    
+    doc_ref = db.collection("files").document(file_id)
+    doc = await run_blocking(doc_ref.get)
+    if not doc.exists:
+        raise JobError("Document not found", 404)
+    
+    doc_data = doc.to_dict()
+    storage_path = doc_data.get("storagePath")
+    if not storage_path:
+        raise JobError("Storage path not found", 400)
+    
+    document_text = await run_blocking(fetch_document_text, file_id, storage_path)
+    return doc_ref, doc_data, document_text
+
+def start_job(job_type, job, *args, file_id=None):
+    """Start job(*args) on the job loop and answer 202 Accepted with the URL to poll for its result"""
+    job_id = get_job_runner().submit(job_type, job, *args, file_id=file_id)
+    status_url = url_for('get_job', job_id=job_id, _external=True)
+    response = jsonify({
+        "success": True,
+        "jobId": job_id,
+        "status": "pending",
+        "statusUrl": status_url
+    })
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    response.headers['Preference-Applied'] = 'respond-async'
+    return response
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Return the status of a generation job.
+    Once it has finished, result and statusCode hold the response the route would have sent.
+    """
+    try:
+        job = get_job_runner().get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        
+        response = jsonify({"success": True, **job})
+        if 'result' not in job:
+            response.headers['Retry-After'] = '2'
+        return response
+    except Exception as e:
+        logger.error("Error getting job %s: %s", job_id, e)
+        return jsonify({"error": str(e)}), 500
+
+def collect_gauges():
+    """Gateway, job and Drive pool gauges for /metrics"""
+    gateway = llm_gateway.stats()
+    jobs = job_runner.stats() if job_runner is not None else {'inFlight': 0}
+    drive = drive_services.stats()
+    return [
+        ('app_openai_queued', 'gauge', "Chat completions waiting for admission by lane",
+         [({'lane': lane}, count) for lane, count in gateway['queued'].items()]),
+        ('app_openai_in_flight', 'gauge', "Chat completions in flight", [({}, gateway['inFlight'])]),
+        ('app_openai_tokens_available', 'gauge', "Tokens left in the tokens-per-minute bucket",
+         [({}, gateway['tokensAvailable'])] if gateway['tokensAvailable'] is not None else []),
+        ('app_openai_retries_total', 'counter', "Chat completion attempts retried", [({}, gateway['retries'])]),
+        ('app_openai_rate_limited_total', 'counter', "Chat completions answered with 429", [({}, gateway['rateLimited'])]),
+        ('app_openai_queue_wait_seconds_total', 'counter', "Time chat completions spent waiting for admission",
+         [({}, gateway['queueWaitSeconds'])]),
+        ('app_jobs_in_flight', 'gauge', "Generation jobs running on this worker", [({}, jobs['inFlight'])]),
+        ('app_drive_services_pooled', 'gauge', "Drive services in the pool", [({}, drive['size'])]),
+        ('app_drive_services_pool_max', 'gauge', "Maximum Drive services kept in the pool", [({}, drive['max_size'])]),
+        ('app_drive_pool_lookups_total', 'counter', "Drive service pool lookups by result",
+         [({'result': 'hit'}, drive['hits']), ({'result': 'miss'}, drive['misses'])]),
+        ('app_drive_pool_removals_total', 'counter', "Drive services dropped from the pool by reason",
+         [({'reason': 'evicted'}, drive['evictions']), ({'reason': 'expired'}, drive['expirations'])]),
+        ('app_drive_token_refreshes_total', 'counter', "Ahead-of-time Drive token refreshes by outcome",
+         [({'outcome': 'refreshed'}, drive['refreshes']), ({'outcome': 'failed'}, drive['refresh_failures'])]),
+    ]
+
+register_collector(collect_gauges)
+
+@app.route('/api/llm/stats', methods=['GET'])
+def llm_stats():
+    """OpenAI gateway queue depth, limits and counters, and the generation jobs in flight, for this worker"""
+    return jsonify({
+        "success": True,
+        "gateway": llm_gateway.stats(),
+        "jobs": job_runner.stats() if job_runner is not None else None
+    })
+
 @app.route('/api/files/<file_id>/generate-summary', methods=['POST'])
 def generate_summary(file_id):
     """Generate a summary of the document using OpenAI."""
+    if wants_async(request):
+        return start_job('summary', generate_summary_job, file_id, file_id=file_id)
+    
     try:
         # Get the document from Firestore
         doc_ref = db.collection("files").document(file_id)
@@ -2152,7 +2102,8 @@ def generate_summary(file_id):
         # Download file
         temp_path = os.path.join(temp_dir, f"{file_id}_{os.path.basename(storage_path)}")
         blob = bucket.blob(storage_path)
-        blob.download_to_filename(temp_path)
+        with span('storage_download'):
+            blob.download_to_filename(temp_path)
         
         # Extract text from document
         document_text = extract_text_from_document(temp_path)
@@ -2162,23 +2113,11 @@ def generate_summary(file_id):
             os.remove(temp_path)
             
         # Generate summary using OpenAI
-        max_chars = 14000
-        truncated_text = document_text[:max_chars] if len(document_text) > max_chars else document_text
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an expert at summarizing documents. Create a comprehensive summary that includes: 1) Main points and key ideas 2) Important details and examples 3) Conclusions or findings. Format the summary with clear sections and bullet points where appropriate."},
-                {"role": "user", "content": f"Please summarize this document:\n\n{truncated_text}"}
-            ],
-            max_tokens=1000
-        )
-        
+        response = llm_gateway.chat(summary_request(document_text))
         summary = response.choices[0].message.content
         
         # Store the summary in Firestore
-        doc_ref.update({
-            "summary": summary,
+        write_artifact(db, doc_ref, "summary", summary, {
             "summaryGeneratedAt": firestore.SERVER_TIMESTAMP
         })
         
@@ -2188,15 +2127,30 @@ def generate_summary(file_id):
         })
         
     except Exception as e:
-        print(f"Error generating summary: {str(e)}")
+        logger.error("Error generating summary: %s", e)
         return jsonify({"error": str(e)}), 500
 
+async def generate_summary_job(file_id):
+    """Async job version of generate_summary"""
+    doc_ref, doc_data, document_text = await load_job_document(file_id)
+    
+    response = await llm_gateway.achat(summary_request(document_text), PRIORITY_BACKGROUND)
+    summary = response.choices[0].message.content
+    
+    await run_blocking(write_artifact, db, doc_ref, "summary", summary, {
+        "summaryGeneratedAt": firestore.SERVER_TIMESTAMP
+    })
+    return {"success": True, "summary": summary}, 200
+
 @app.route('/api/files/<file_id>/generate-quiz', methods=['POST'])
 def generate_quiz(file_id):
     try:
         data = request.get_json()
         quiz_type = data.get('quiz_type', 'multiple_choice')
         
+        if wants_async(request):
+            return start_job(f'quiz_{quiz_type}', generate_quiz_job, file_id, quiz_type, file_id=file_id)
+        
         # Get document from Firestore
         doc_ref = db.collection('files').document(file_id)
         doc = doc_ref.get()
@@ -2219,106 +2173,41 @@ def generate_quiz(file_id):
         temp_path = os.path.join(temp_dir, f"{file_id}_{os.path.basename(storage_path)}")
         try:
             blob = bucket.blob(storage_path)
-            blob.download_to_filename(temp_path)
-            print(f"Downloaded file to: {temp_path}")
+            with span('storage_download'):
+                blob.download_to_filename(temp_path)
+            logger.debug("Downloaded file to: %s", temp_path)
         except Exception as e:
-            print(f"Error downloading file: {str(e)}")
+            logger.error("Error downloading file: %s", e)
             return jsonify({'success': False, 'error': f'Error downloading file: {str(e)}'}), 500
 
         # Extract text from document
         try:
             content = extract_text_from_document(temp_path)
-            print(f"Extracted text length: {len(content)}")
+            logger.debug("Extracted text length: %s", len(content))
             
             # Clean up temp file
             if os.path.exists(temp_path):
                 os.remove(temp_path)
-                print("Cleaned up temporary file")
+                logger.debug("Cleaned up temporary file")
 
             if not content or len(content.strip()) == 0:
                 return jsonify({'success': False, 'error': 'Could not extract content from document'}), 400
 
         except Exception as e:
-            print(f"Error extracting text: {str(e)}")
+            logger.error("Error extracting text: %s", e)
             if os.path.exists(temp_path):
                 os.remove(temp_path)
             return jsonify({'success': False, 'error': f'Error extracting text: {str(e)}'}), 500
 
-        # Generate quiz based on type
-        if quiz_type == 'multiple_choice':
-            system_prompt = """Create 10 multiple choice questions based on the content. Format your response as a JSON array of questions. Each question should have:
-            - A clear question text
-            - Four options (A, B, C, D)
-            - The correct answer letter
-            - A brief explanation
-            
-            Example format:
-            {
-                "questions": [
-                    {
-                        "question": "What is the main topic discussed?",
-                        "options": [
-                            "A) First option",
-                            "B) Second option",
-                            "C) Third option",
-                            "D) Fourth option"
-                        ],
-                        "correct_answer": "A",
-                        "explanation": "This is correct because..."
-                    }
-                ]
-            }"""
-        else:
-            system_prompt = """Create 5 fill-in-the-blank questions based on the content. For each question:
-            1. Take a direct quote or sentence from the content
-            2. Replace a key term or concept with _____ (5 underscores)
-            3. The blank should be a single word or short phrase that is clearly defined in the content
-            4. Include the surrounding context to make it clear what should go in the blank
-            
-            Format your response as a JSON object with this structure:
-            {
-                "questions": [
-                    {
-                        "text_before_blank": "In machine learning, a",
-                        "text_after_blank": "neural network is designed to process grid-like data such as images.",
-                        "correct_answer": "convolutional",
-                        "alternative_answers": ["CNN", "convolution", "convolutional neural network"],
-                        "required_keywords": ["conv"],
-                        "explanation": "Convolutional neural networks (CNNs) are specialized for processing grid-like data, particularly images, by using convolutional layers to detect patterns and features.",
-                        "context": "This type of neural network is specifically used for image processing and computer vision tasks."
-                    }
-                ]
-            }
-            
-            Make sure each question:
-            1. Has a clear blank indicated by _____ (5 underscores)
-            2. Has enough context to determine the answer
-            3. Has a specific, unambiguous answer
-            4. Includes relevant synonyms or acceptable variations of the answer"""
-
-        # Truncate content if too long
-        max_chars = 14000
-        truncated_content = content[:max_chars] if len(content) > max_chars else content
-
         # Call OpenAI API
         try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Create quiz questions based on this content:\n\n{truncated_content}"}
-                ],
-                response_format={ "type": "json_object" },
-                temperature=0.7,
-                max_tokens=2000
-            )
+            response = llm_gateway.chat(quiz_request(content, quiz_type))
 
             # Parse the response
             quiz_data = json.loads(response.choices[0].message.content)
             
             # Store the quiz in Firestore
-            doc_ref.update({
-                f"quiz_{quiz_type}": quiz_data,
+            write_artifact(db, doc_ref, f"quiz_{quiz_type}", quiz_data, {
                 f"quiz_{quiz_type}_generatedAt": firestore.SERVER_TIMESTAMP
             })
             
@@ -2328,36 +2217,222 @@ def generate_quiz(file_id):
             })
             
         except Exception as e:
-            print(f"Error generating quiz with OpenAI: {str(e)}")
+            logger.error("Error generating quiz with OpenAI: %s", e)
             return jsonify({'success': False, 'error': f'Error generating quiz: {str(e)}'}), 500
         
     except Exception as e:
-        print(f"Error in quiz generation: {str(e)}")
+        logger.error("Error in quiz generation: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/files/<file_id>/process-reading-writing', methods=['OPTIONS', 'POST'])
-def process_reading_writing(file_id):
-    """Process a document for reading/writing learners by generating a structured study guide."""
-    # Handle preflight request
-    if request.method == 'OPTIONS':
-        return create_preflight_response()
-        
-    try:
-        print(f"Processing reading/writing content for file ID: {file_id}")
-        
-        # Get the document from Firestore
-        doc_ref = db.collection("files").document(file_id)
+async def generate_quiz_job(file_id, quiz_type):
+    """Async job version of generate_quiz"""
+    doc_ref, doc_data, content = await load_job_document(file_id)
+    if not content or len(content.strip()) == 0:
+        raise JobError('Could not extract content from document', 400)
+    
+    # Someone is waiting to take this quiz, so it goes ahead of background generation
+    response = await llm_gateway.achat(quiz_request(content, quiz_type), PRIORITY_INTERACTIVE)
+    quiz_data = json.loads(response.choices[0].message.content)
+    
+    await run_blocking(write_artifact, db, doc_ref, f"quiz_{quiz_type}", quiz_data, {
+        f"quiz_{quiz_type}_generatedAt": firestore.SERVER_TIMESTAMP
+    })
+    return {"success": True, "questions": quiz_data["questions"]}, 200
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PDF_CONTENT_TYPE = 'application/pdf'
+STUDY_GUIDE_FORMATS = {'docx': DOCX_CONTENT_TYPE, 'pdf': PDF_CONTENT_TYPE}
+
+# 'eager' renders and uploads DOCX and PDF for every reading/writing job;
+# 'on_demand' stores only the content and renders a format on its first download
+STUDY_GUIDE_RENDER_MODE = os.getenv('STUDY_GUIDE_RENDER_MODE', 'eager').lower()
+
+# Thread pool for DOCX rendering and Storage uploads (I/O-bound, created on first use).
+# PDFs are rendered in pdf_render_worker's process pool.
+artifact_io_pool = None
+
+def get_artifact_io_pool():
+    """Get the thread pool used for DOCX rendering and artifact uploads"""
+    global artifact_io_pool
+    if artifact_io_pool is None:
+        artifact_io_pool = ThreadPoolExecutor(max_workers=int(os.getenv('ARTIFACT_IO_THREADS', '8')),
+                                              thread_name_prefix='artifact-io')
+    return artifact_io_pool
+
+def shutdown_background_work(wait=True, job_drain_seconds=None):
+    """
+    Stop the background executors; with wait=True, queued artifact uploads finish first.
+    Running jobs get at most JOB_DRAIN_SECONDS, or job_drain_seconds if that is shorter.
+    Called by the production server when a worker exits (see gunicorn.conf.py).
+    """
+    global artifact_io_pool
+    if job_runner is not None:
+        # Let running generation jobs finish (they may still queue artifact uploads)
+        drain = JOB_DRAIN_SECONDS if job_drain_seconds is None else min(JOB_DRAIN_SECONDS, job_drain_seconds)
+        job_runner.close(wait=wait, timeout=drain)
+    if artifact_io_pool is not None:
+        artifact_io_pool.shutdown(wait=wait)
+        artifact_io_pool = None
+    shutdown_render_pool(wait=wait)
+    if image_lookup_service is not None:
+        image_lookup_service.close(wait=wait)
+    shutdown_tts_pool(wait=wait)
+
+def study_guide_storage_path(user_id, file_id, format):
+    """Storage path of a published (public) study guide"""
+    return f"processed/{user_id}/reading_writing_{file_id}.{format}"
+
+def study_guide_cache_path(user_id, file_id, format):
+    """Storage path of a study guide rendered by the download route (private, never published)"""
+    return f"study_guide_cache/{user_id}/reading_writing_{file_id}.{format}"
+
+def log_upload_failure(storage_path):
+    """Future callback that logs a failed background upload to storage_path"""
+    def callback(future):
+        error = future.exception()
+        if error is not None:
+            logger.error("Background upload to %s failed: %s", storage_path, error,
+                         exc_info=(type(error), error, error.__traceback__))
+    return callback
+
+@timed('storage_upload')
+def upload_artifact(storage_path, file_obj, content_type, content_hash=None, public=True):
+    """Upload an in-memory artifact to Firebase Storage and return its public URL (or None if not public)"""
+    blob = bucket.blob(storage_path)
+    if content_hash:
+        # Lets the download route tell whether a cached render still matches the content
+        blob.metadata = {"contentHash": content_hash}
+    blob.upload_from_file(file_obj, content_type=content_type, rewind=True)
+    if not public:
+        return None
+    blob.make_public()
+    return blob.public_url
+
+def submit_study_guide_artifacts(study_guide, user_id, file_id):
+    """
+    Start rendering the DOCX and PDF study guides concurrently; each is uploaded as soon as it is ready.
+    Returns the (docx, pdf) futures, whose results are the public URLs.
+    """
+    docx_storage_path = study_guide_storage_path(user_id, file_id, 'docx')
+    pdf_storage_path = study_guide_storage_path(user_id, file_id, 'pdf')
+
+    io_pool = get_artifact_io_pool()
+    docx_future = io_pool.submit(
+        lambda: upload_artifact(docx_storage_path, render_docx_study_guide(study_guide), DOCX_CONTENT_TYPE,
+                                content_hash=study_guide.content_hash))
+    pdf_future = io_pool.submit(
+        lambda: upload_artifact(pdf_storage_path, render_pdf_in_pool(study_guide), PDF_CONTENT_TYPE,
+                                content_hash=study_guide.content_hash))
+    return docx_future, pdf_future
+
+def publish_study_guide_artifacts(study_guide, user_id, file_id):
+    """
+    Render and upload the DOCX and PDF study guides concurrently.
+    Returns (docx_url, pdf_url) once both uploads have completed.
+    """
+    docx_future, pdf_future = submit_study_guide_artifacts(study_guide, user_id, file_id)
+    return docx_future.result(), pdf_future.result()
+
+def study_guide_download_urls(file_id):
+    """(docx_url, pdf_url) of the download route, used when formats are rendered on demand"""
+    return (url_for('download_processed_document', file_id=file_id, format='docx', _external=True),
+            url_for('download_processed_document', file_id=file_id, format='pdf', _external=True))
+
+def render_study_guide(study_guide, format):
+    """Render a parsed study guide in the requested format"""
+    if format == 'pdf':
+        return render_pdf_in_pool(study_guide)
+    return render_docx_study_guide(study_guide)
+
+def send_study_guide(file_id, file_data, reading_writing_content, format):
+    """
+    Send a reading/writing study guide in the requested format.
+    Uses a rendered copy in Storage (the published one or the download cache) when it
+    matches the current content; otherwise renders it now and writes the bytes to the
+    private download cache in the background. Published copies are never overwritten,
+    so their public URLs stay valid.
+    """
+    web_content = reading_writing_content["elements"][0]["content"]
+    study_guide = parse_study_guide(web_content)
+    user_id = file_data.get('userId', 'unknown')
+    cache_path = study_guide_cache_path(user_id, file_id, format)
+    content_type = STUDY_GUIDE_FORMATS[format]
+
+    file_obj = None
+    for storage_path in (study_guide_storage_path(user_id, file_id, format), cache_path):
+        cached_blob = bucket.get_blob(storage_path)
+        if cached_blob is not None and (cached_blob.metadata or {}).get("contentHash") == study_guide.content_hash:
+            logger.debug("Serving %s study guide for %s from %s", format, file_id, storage_path)
+            with span('storage_download'):
+                file_obj = BytesIO(cached_blob.download_as_bytes())
+            break
+    if file_obj is None:
+        logger.debug("Rendering %s study guide for %s on first download", format, file_id)
+        file_obj = render_study_guide(study_guide, format)
+        rendered = BytesIO(file_obj.getvalue())
+        upload = get_artifact_io_pool().submit(upload_artifact, cache_path, rendered, content_type,
+                                               study_guide.content_hash, False)
+        upload.add_done_callback(log_upload_failure(cache_path))
+
+    base_name = os.path.splitext(file_data.get("name", f"document_{file_id}"))[0]
+    return send_file(
+        file_obj,
+        mimetype=content_type,
+        as_attachment=True,
+        download_name=f"{base_name}_study_guide.{format}"
+    )
+
+def store_reading_writing_result(doc_ref, doc_data, file_id, content, study_guide):
+    """Store reading/writing content and its downloadable formats, and build the route's response"""
+    if STUDY_GUIDE_RENDER_MODE == 'on_demand':
+        # Formats are rendered on their first download
+        docx_url, pdf_url = study_guide_download_urls(file_id)
+    else:
+        # Render and upload DOCX and PDF concurrently
+        docx_url, pdf_url = publish_study_guide_artifacts(study_guide, doc_data.get('userId', 'unknown'), file_id)
+    
+    # Store the processed content in Firestore once the artifacts are uploaded
+    write_artifact(db, doc_ref, "readingWritingContent", content, {
+        "readingWritingDocxUrl": docx_url,
+        "readingWritingPdfUrl": pdf_url,
+        "readingWritingGeneratedAt": firestore.SERVER_TIMESTAMP
+    })
+    
+    return jsonify({
+        "success": True,
+        "content": content,
+        "docxUrl": docx_url,
+        "pdfUrl": pdf_url
+    })
+
+@app.route('/api/files/<file_id>/process-reading-writing', methods=['OPTIONS', 'POST'])
+def process_reading_writing(file_id):
+    """Process a document for reading/writing learners by generating a structured study guide."""
+    # Handle preflight request
+    if request.method == 'OPTIONS':
+        return create_preflight_response()
+    
+    if wants_async(request):
+        # url_for needs the request, so on-demand download URLs are built here
+        download_urls = study_guide_download_urls(file_id) if STUDY_GUIDE_RENDER_MODE == 'on_demand' else None
+        return start_job('reading_writing', process_reading_writing_job, file_id, download_urls, file_id=file_id)
+        
+    try:
+        logger.debug("Processing reading/writing content for file ID: %s", file_id)
+        
+        # Get the document from Firestore
+        doc_ref = db.collection("files").document(file_id)
         doc = doc_ref.get()
         
         if not doc.exists:
-            print(f"Document with ID {file_id} not found")
+            logger.warning("Document with ID %s not found", file_id)
             return jsonify({"error": "Document not found"}), 404
             
         doc_data = doc.to_dict()
         storage_path = doc_data.get("storagePath")
         
         if not storage_path:
-            print(f"Storage path not found for document {file_id}")
+            logger.warning("Storage path not found for document %s", file_id)
             return jsonify({"error": "Storage path not found"}), 400
             
         # Create temp directory if it doesn't exist
@@ -2368,7 +2443,8 @@ def process_reading_writing(file_id):
         # Download file
         temp_path = os.path.join(temp_dir, f"{file_id}_{os.path.basename(storage_path)}")
         blob = bucket.blob(storage_path)
-        blob.download_to_filename(temp_path)
+        with span('storage_download'):
+            blob.download_to_filename(temp_path)
         
         # Extract text from document
         document_text = extract_text_from_document(temp_path)
@@ -2380,137 +2456,216 @@ def process_reading_writing(file_id):
         # Generate reading/writing optimized content
         content = generate_reading_writing_content(document_text)
         
-        # Create both DOCX and PDF versions
-        docx_file = create_docx_study_guide(content["elements"][0]["content"], content["title"])
-        pdf_file = create_pdf_study_guide(content["elements"][0]["content"], content["title"])
-        
-        # Upload processed documents to Firebase Storage
-        docx_filename = f"reading_writing_{file_id}.docx"
-        pdf_filename = f"reading_writing_{file_id}.pdf"
+        # Parse the study guide once; both DOCX and PDF versions are rendered from it
+        study_guide = parse_study_guide(content["elements"][0]["content"])
+        return store_reading_writing_result(doc_ref, doc_data, file_id, content, study_guide)
         
-        docx_storage_path = f"processed/{doc_data.get('userId', 'unknown')}/{docx_filename}"
-        pdf_storage_path = f"processed/{doc_data.get('userId', 'unknown')}/{pdf_filename}"
+    except Exception as e:
+        logger.exception("Error processing reading/writing content: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+async def process_reading_writing_job(file_id, download_urls=None):
+    """
+    Async job version of process_reading_writing.
+    download_urls are the on-demand download URLs; without them DOCX and PDF are rendered and uploaded now.
+    """
+    doc_ref, doc_data, document_text = await load_job_document(file_id)
+    content = await generate_reading_writing_content_async(document_text)
+    study_guide = await run_blocking(parse_study_guide, content["elements"][0]["content"])
+    
+    if download_urls:
+        docx_url, pdf_url = download_urls
+    else:
+        futures = submit_study_guide_artifacts(study_guide, doc_data.get('userId', 'unknown'), file_id)
+        docx_url, pdf_url = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+    
+    await run_blocking(write_artifact, db, doc_ref, "readingWritingContent", content, {
+        "readingWritingDocxUrl": docx_url,
+        "readingWritingPdfUrl": pdf_url,
+        "readingWritingGeneratedAt": firestore.SERVER_TIMESTAMP
+    })
+    return {"success": True, "content": content, "docxUrl": docx_url, "pdfUrl": pdf_url}, 200
+
+def get_or_create_explanation_audio(text, voice=TTS_VOICE, model=TTS_MODEL):
+    """
+    Return the public URL of the audio for text, synthesizing it only if it is not cached.
+    Audio is stored under a content-addressed path derived from (text, voice, model).
+    """
+    cache_key = audio_cache_key(text, voice, model)
+    audio_blob = bucket.blob(audio_storage_path(cache_key))
+    
+    if audio_blob.exists():
+        logger.debug("Using cached audio %s", cache_key)
+        return audio_blob.public_url
+    
+    # Generate audio using OpenAI's Text-to-Speech; long text is split at sentence
+    # boundaries and the segments are synthesized concurrently and stitched in order
+    audio_bytes = synthesize_speech(get_openai_client(), text, voice=voice, model=model)
+    return store_explanation_audio(audio_blob, audio_bytes)
+
+@timed('storage_upload')
+def store_explanation_audio(audio_blob, audio_bytes):
+    """Upload synthesized audio to its content-addressed blob and return the public URL"""
+    # Upload straight from memory; if_generation_match=0 makes concurrent identical requests safe
+    try:
+        audio_blob.upload_from_string(audio_bytes, content_type='audio/mpeg', if_generation_match=0)
+    except PreconditionFailed:
+        logger.debug("Audio %s was uploaded by a concurrent request", audio_blob.name)
+    audio_blob.make_public()
+    return audio_blob.public_url
+
+async def get_or_create_explanation_audio_async(text, voice=TTS_VOICE, model=TTS_MODEL):
+    """Async version of get_or_create_explanation_audio; synthesis awaits the shared TTS pool"""
+    cache_key = audio_cache_key(text, voice, model)
+    audio_blob = bucket.blob(audio_storage_path(cache_key))
+    
+    if await run_blocking(audio_blob.exists):
+        logger.debug("Using cached audio %s", cache_key)
+        return audio_blob.public_url
+    
+    audio_bytes = await synthesize_speech_async(get_openai_client(), text, voice=voice, model=model)
+    return await run_blocking(store_explanation_audio, audio_blob, audio_bytes)
+
+def stream_explanation_audio(text, voice=TTS_VOICE, model=TTS_MODEL):
+    """
+    Synthesize text and yield the MP3 bytes as they arrive, uploading the same bytes
+    to the content-addressed audio cache in a background thread.
+    The upload is aborted (nothing is cached) if the client disconnects early.
+    """
+    cache_key = audio_cache_key(text, voice, model)
+    audio_blob = bucket.blob(audio_storage_path(cache_key))
+    pipe = AudioPipe()
+    
+    def upload():
+        try:
+            audio_blob.upload_from_file(pipe, content_type='audio/mpeg', if_generation_match=0)
+            audio_blob.make_public()
+            logger.debug("Cached streamed audio %s", cache_key)
+        except PreconditionFailed:
+            logger.debug("Audio %s was uploaded by a concurrent request", cache_key)
+        except Exception as e:
+            logger.warning("Streamed audio %s was not cached: %s", cache_key, e)
+        finally:
+            # If the upload stopped early, don't let the stream block on a full pipe
+            pipe.discard()
+    
+    threading.Thread(target=upload, daemon=True).start()
+    
+    completed = False
+    try:
+        for audio in iter_speech_segments(get_openai_client(), text, voice=voice, model=model,
+                                          first_segment_chars=TTS_FIRST_SEGMENT_CHARS):
+            pipe.write(audio)
+            yield audio
+        completed = True
+    finally:
+        if completed:
+            pipe.close()
+        else:
+            pipe.abort()
+
+@app.route('/api/files/<file_id>/auditory/stream', methods=['GET'])
+def stream_auditory_audio(file_id):
+    """Stream the audio for a file's auditory explanation, synthesizing it on the fly if it is not cached."""
+    try:
+        if not db or not bucket:
+            return jsonify({"error": "Firebase is not properly initialized"}), 500
         
-        # Upload DOCX
-        docx_blob = bucket.blob(docx_storage_path)
-        docx_blob.upload_from_file(docx_file, content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-        docx_blob.make_public()
+        doc = db.collection("files").document(file_id).get()
+        if not doc.exists:
+            return jsonify({"error": "Document not found"}), 404
         
-        # Upload PDF
-        pdf_blob = bucket.blob(pdf_storage_path)
-        pdf_blob.upload_from_file(pdf_file, content_type='application/pdf')
-        pdf_blob.make_public()
+        auditory_content = load_artifact(doc.reference, doc.to_dict(), "auditoryContent") or {}
+        elements = auditory_content.get("elements") or []
+        text = elements[0].get("content") if elements else None
+        if not text:
+            return jsonify({"error": "No auditory content found for this file"}), 404
         
-        # Store the processed content in Firestore
-        doc_ref.update({
-            "readingWritingContent": content,
-            "readingWritingDocxUrl": docx_blob.public_url,
-            "readingWritingPdfUrl": pdf_blob.public_url,
-            "readingWritingGeneratedAt": firestore.SERVER_TIMESTAMP
-        })
+        # Already synthesized: let the browser fetch it straight from Storage
+        audio_blob = bucket.blob(audio_storage_path(audio_cache_key(text)))
+        if audio_blob.exists():
+            return redirect(audio_blob.public_url)
         
-        return jsonify({
-            "success": True,
-            "content": content,
-            "docxUrl": docx_blob.public_url,
-            "pdfUrl": pdf_blob.public_url
-        })
+        if not openai_api_key:
+            return jsonify({"error": "OpenAI API key is not configured"}), 500
         
+        return Response(
+            stream_with_context(stream_explanation_audio(text)),
+            mimetype='audio/mpeg',
+            headers={"Cache-Control": "no-store"}
+        )
     except Exception as e:
-        print(f"Error processing reading/writing content: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error streaming auditory audio: %s", e)
         return jsonify({"error": str(e)}), 500
 
-def generate_auditory_content(document_text):
+def mock_auditory_content():
+    """Auditory content used for development without an OpenAI API key"""
+    return {
+        "title": "Audio Learning Materials",
+        "description": "This content has been optimized for auditory learners with spoken explanations and examples.",
+        "elements": [
+            {
+                "type": "text",
+                "content": "Imagine you're learning about this topic in a conversation with a friendly tutor...",
+                "caption": "Spoken Explanation"
+            }
+        ]
+    }
+
+def auditory_error_content(error, document_text):
+    """Auditory content reporting a generation error"""
+    return {
+        "title": "Audio Learning Materials (Error)",
+        "description": "There was an error processing this document.",
+        "elements": [
+            {
+                "type": "text",
+                "content": f"Error generating auditory content: {str(error)}\n\nOriginal text (partial):\n\n{document_text[:500]}...",
+                "caption": "Error Processing Document"
+            }
+        ]
+    }
+
+def generate_auditory_content(document_text, synthesize_audio=True):
     """
     Generate content optimized for auditory learners using OpenAI
+    - When synthesize_audio is False the audio is left to the streaming endpoint
     """
     if not openai_api_key:
-        print("Using mock response for auditory content (No API key)")
-        return {
-            "title": "Audio Learning Materials",
-            "description": "This content has been optimized for auditory learners with spoken explanations and examples.",
-            "elements": [
-                {
-                    "type": "text",
-                    "content": "Imagine you're learning about this topic in a conversation with a friendly tutor...",
-                    "caption": "Spoken Explanation"
-                }
-            ]
-        }
+        logger.debug("Using mock response for auditory content (No API key)")
+        return mock_auditory_content()
     
     try:
-        # Truncate text if too long (OpenAI has token limits)
-        max_chars = 14000
-        truncated_text = document_text[:max_chars] if len(document_text) > max_chars else document_text
-        
         # Generate spoken-friendly content first
-        chat_response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": """You are an AI tutor specialized in creating spoken-friendly content for auditory learners. Transform educational content into engaging, conversational explanations that sound natural when spoken aloud."""},
-                {"role": "user", "content": f"Transform this content into a spoken-friendly, engaging explanation that would be easy to understand when read aloud:\n\n{truncated_text}"}
-            ],
-            max_tokens=2000,
-            temperature=0.7
-        )
-        
-        # Extract the formatted text
-        formatted_text = chat_response.choices[0].message.content
-        
-        # Generate audio using OpenAI's Text-to-Speech
-        speech_response = client.audio.speech.create(
-            model="tts-1",
-            voice="alloy",
-            input=formatted_text
-        )
-        
-        # Create temp directory if it doesn't exist
-        temp_dir = os.path.join(os.getcwd(), 'temp_processing')
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-            
-        # Save the audio file temporarily
-        temp_audio_path = os.path.join(temp_dir, f"audio_explanation_{int(time.time())}.mp3")
-        speech_response.stream_to_file(temp_audio_path)
-        
-        # Upload to Firebase Storage
-        audio_storage_path = f"audio/audio_explanation_{int(time.time())}.mp3"
-        audio_blob = bucket.blob(audio_storage_path)
-        audio_blob.upload_from_filename(temp_audio_path, content_type='audio/mpeg')
-        audio_blob.make_public()
-        
-        # Clean up temp file
-        if os.path.exists(temp_audio_path):
-            os.remove(temp_audio_path)
+        chat_response = llm_gateway.chat(auditory_script_request(document_text))
         
         # Structure the response
-        return {
-            "title": "Audio Learning Materials",
-            "description": "This content has been optimized for auditory learners with spoken explanations and examples.",
-            "elements": [
-                {
-                    "type": "text",
-                    "content": formatted_text,
-                    "caption": "Spoken Explanation"
-                }
-            ],
-            "audioUrl": audio_blob.public_url
-        }
+        content = build_auditory_content(chat_response.choices[0].message.content)
+        
+        if synthesize_audio:
+            # Look up (or synthesize) the audio for this exact text
+            content["audioUrl"] = get_or_create_explanation_audio(content["elements"][0]["content"])
+        return content
         
     except Exception as e:
-        print(f"Error generating auditory content: {e}")
-        return {
-            "title": "Audio Learning Materials (Error)",
-            "description": "There was an error processing this document.",
-            "elements": [
-                {
-                    "type": "text",
-                    "content": f"Error generating auditory content: {str(e)}\n\nOriginal text (partial):\n\n{document_text[:500]}...",
-                    "caption": "Error Processing Document"
-                }
-            ]
-        }
+        logger.error("Error generating auditory content: %s", e)
+        return auditory_error_content(e, document_text)
+
+async def generate_auditory_content_async(document_text, synthesize_audio=True, priority=PRIORITY_BACKGROUND):
+    """Async version of generate_auditory_content"""
+    if not openai_api_key:
+        logger.debug("Using mock response for auditory content (No API key)")
+        return mock_auditory_content()
+    
+    try:
+        chat_response = await llm_gateway.achat(auditory_script_request(document_text), priority)
+        content = build_auditory_content(chat_response.choices[0].message.content)
+        if synthesize_audio:
+            content["audioUrl"] = await get_or_create_explanation_audio_async(content["elements"][0]["content"])
+        return content
+    except Exception as e:
+        logger.error("Error generating auditory content: %s", e)
+        return auditory_error_content(e, document_text)
 
 @app.route('/api/files/<file_id>/process-auditory', methods=['OPTIONS', 'POST'])
 def process_auditory(file_id):
@@ -2519,31 +2674,40 @@ def process_auditory(file_id):
         return create_preflight_response()
         
     try:
-        print(f"Processing auditory content for file ID: {file_id}")
+        logger.debug("Processing auditory content for file ID: %s", file_id)
+        
+        # With streamAudio the response returns as soon as the text is ready and the
+        # browser plays the audio from the streaming endpoint while it is synthesized
+        request_data = request.get_json(silent=True) or {}
+        stream_audio = bool(request_data.get("streamAudio"))
         
         # Check if OpenAI API key is set
         if not openai_api_key:
-            print("OpenAI API key is not set")
+            logger.error("OpenAI API key is not set")
             return jsonify({"error": "OpenAI API key is not configured"}), 500
             
         # Check if Firebase is initialized
         if not db or not bucket:
-            print("Firebase is not properly initialized")
+            logger.error("Firebase is not properly initialized")
             return jsonify({"error": "Firebase is not properly initialized"}), 500
         
+        if wants_async(request):
+            audio_stream_url = url_for('stream_auditory_audio', file_id=file_id, _external=True) if stream_audio else None
+            return start_job('auditory', process_auditory_job, file_id, audio_stream_url, file_id=file_id)
+        
         # Get the document from Firestore
         doc_ref = db.collection("files").document(file_id)
         doc = doc_ref.get()
         
         if not doc.exists:
-            print(f"Document with ID {file_id} not found")
+            logger.warning("Document with ID %s not found", file_id)
             return jsonify({"error": "Document not found"}), 404
             
         doc_data = doc.to_dict()
         storage_path = doc_data.get("storagePath")
         
         if not storage_path:
-            print(f"Storage path not found for document {file_id}")
+            logger.warning("Storage path not found for document %s", file_id)
             return jsonify({"error": "Storage path not found"}), 400
             
         # Create temp directory if it doesn't exist
@@ -2555,7 +2719,8 @@ def process_auditory(file_id):
             # Download file
             temp_path = os.path.join(temp_dir, f"{file_id}_{os.path.basename(storage_path)}")
             blob = bucket.blob(storage_path)
-            blob.download_to_filename(temp_path)
+            with span('storage_download'):
+                blob.download_to_filename(temp_path)
             
             # Extract text from document
             document_text = extract_text_from_document(temp_path)
@@ -2564,25 +2729,28 @@ def process_auditory(file_id):
                 raise ValueError("Failed to extract text from document")
                 
             # Generate auditory content and audio file
-            content = generate_auditory_content(document_text)
+            content = generate_auditory_content(document_text, synthesize_audio=not stream_audio)
             
             if not content:
                 raise ValueError("Failed to generate auditory content")
             
+            if stream_audio and content.get("elements"):
+                content["audioStreamUrl"] = url_for('stream_auditory_audio', file_id=file_id, _external=True)
+            
             # Store the processed content in Firestore
-            doc_ref.update({
-                "auditoryContent": content,
+            write_artifact(db, doc_ref, "auditoryContent", content, {
                 "auditoryGeneratedAt": firestore.SERVER_TIMESTAMP
             })
             
             return jsonify({
                 "success": True,
                 "content": content,
-                "audioUrl": content.get("audioUrl")
+                "audioUrl": content.get("audioUrl"),
+                "audioStreamUrl": content.get("audioStreamUrl")
             })
             
         except Exception as inner_error:
-            print(f"Error during file processing: {str(inner_error)}")
+            logger.error("Error during file processing: %s", inner_error)
             raise inner_error
             
         finally:
@@ -2591,242 +2759,134 @@ def process_auditory(file_id):
                 try:
                     os.remove(temp_path)
                 except Exception as cleanup_error:
-                    print(f"Error cleaning up temp file: {str(cleanup_error)}")
+                    logger.error("Error cleaning up temp file: %s", cleanup_error)
         
     except Exception as e:
-        print(f"Error processing auditory content: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error processing auditory content: %s", e)
         return jsonify({"error": str(e)}), 500
 
+async def process_auditory_job(file_id, audio_stream_url=None):
+    """
+    Async job version of process_auditory.
+    With audio_stream_url the audio is left to the streaming endpoint, as with streamAudio.
+    """
+    doc_ref, doc_data, document_text = await load_job_document(file_id)
+    if not document_text:
+        raise ValueError("Failed to extract text from document")
+    
+    content = await generate_auditory_content_async(document_text, synthesize_audio=audio_stream_url is None)
+    if audio_stream_url and content.get("elements"):
+        content["audioStreamUrl"] = audio_stream_url
+    
+    await run_blocking(write_artifact, db, doc_ref, "auditoryContent", content, {
+        "auditoryGeneratedAt": firestore.SERVER_TIMESTAMP
+    })
+    return {
+        "success": True,
+        "content": content,
+        "audioUrl": content.get("audioUrl"),
+        "audioStreamUrl": content.get("audioStreamUrl")
+    }, 200
+
+def mock_kinesthetic_content():
+    """Kinesthetic content used for development without an OpenAI API key"""
+    return {
+        "title": "Interactive Learning Activities",
+        "description": "Learn through hands-on activities and physical engagement.",
+        "activities": [
+            {
+                "title": "Sample Activity",
+                "description": "A hands-on exercise to understand the concept.",
+                "materials": ["Item 1", "Item 2"],
+                "steps": ["Step 1", "Step 2", "Step 3"],
+                "tips": ["Tip 1", "Tip 2"],
+                "reflection": ["Question 1", "Question 2"]
+            }
+        ]
+    }
+
+def kinesthetic_error_content():
+    """Kinesthetic content with a general activity, used when generation fails"""
+    return {
+        "title": "Interactive Learning Activities (Error)",
+        "description": "There was an error processing this document.",
+        "activities": [{
+            "title": "Temporary Activity",
+            "description": "While we fix the error, here's a general learning activity.",
+            "materials": ["Paper", "Pen", "Textbook or learning materials"],
+            "steps": [
+                "Review the main concepts in your materials",
+                "Create a mind map or diagram of key ideas",
+                "Practice explaining the concepts out loud"
+            ],
+            "tips": [
+                "Take breaks between concepts",
+                "Try to relate ideas to real-world examples"
+            ],
+            "reflection": [
+                "What was the most challenging concept to understand?",
+                "How can you apply what you learned?"
+            ]
+        }]
+    }
+
 def generate_kinesthetic_content(document_text):
     """
     Generate interactive, hands-on learning activities for kinesthetic learners using OpenAI
     """
     if not openai_api_key:
-        print("Using mock response for kinesthetic content (No API key)")
-        return {
-            "title": "Interactive Learning Activities",
-            "description": "Learn through hands-on activities and physical engagement.",
-            "activities": [
-                {
-                    "title": "Sample Activity",
-                    "description": "A hands-on exercise to understand the concept.",
-                    "materials": ["Item 1", "Item 2"],
-                    "steps": ["Step 1", "Step 2", "Step 3"],
-                    "tips": ["Tip 1", "Tip 2"],
-                    "reflection": ["Question 1", "Question 2"]
-                }
-            ]
-        }
+        logger.debug("Using mock response for kinesthetic content (No API key)")
+        return mock_kinesthetic_content()
     
     try:
-        # Truncate text if too long (OpenAI has token limits)
-        max_chars = 14000
-        truncated_text = document_text[:max_chars] if len(document_text) > max_chars else document_text
-        
         # Call OpenAI API to generate kinesthetic activities
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": """You are an AI tutor specialized in creating hands-on, interactive learning activities for kinesthetic learners. 
-                Transform educational content into engaging physical exercises, experiments, and real-world applications.
-                
-                For each activity, you MUST provide:
-                1. Title: A clear, action-oriented title
-                2. Description: Brief overview of what will be learned
-                3. Materials Needed: List of required items (at least 2)
-                4. Steps: Detailed numbered instructions (at least 3 steps)
-                5. Tips: Practical advice for success (at least 2 tips)
-                6. Reflection Questions: Thought-provoking questions (at least 2 questions)
-                
-                Format each activity section with these exact headings and format:
-                Title: [Activity Title]
-                Description: [Brief overview]
-                Materials:
-                - [First item]
-                - [Second item]
-                Steps:
-                1. [First step]
-                2. [Second step]
-                3. [Third step]
-                Tips:
-                - [First tip]
-                - [Second tip]
-                Reflection Questions:
-                - [First question]
-                - [Second question]
-                
-                Create 2-3 activities that are:
-                - Hands-on and physically engaging
-                - Using readily available materials
-                - Safe and appropriate
-                - Connected to real-world applications
-                - Suitable for both individual and group work"""},
-                {"role": "user", "content": f"Create interactive, hands-on learning activities for this content:\n\n{truncated_text}"}
-            ],
-            max_tokens=2000,
-            temperature=0.7
-        )
-        
-        # Extract the formatted text
-        activities_text = response.choices[0].message.content
+        response = llm_gateway.chat(kinesthetic_request(document_text))
         
         # Parse the activities into structured format
-        activities = []
-        current_activity = None
-        current_section = None
-        
-        lines = activities_text.split('\n')
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            if not line:
-                i += 1
-                continue
-                
-            # Check for new activity
-            if line.startswith('Title:'):
-                if current_activity and current_activity['title']:  # Save previous activity if exists
-                    activities.append(current_activity)
-                current_activity = {
-                    'title': line.split(':', 1)[1].strip(),
-                    'description': '',
-                    'materials': [],
-                    'steps': [],
-                    'tips': [],
-                    'reflection': []
-                }
-                current_section = 'title'
-            
-            # Check for sections
-            elif line.startswith('Description:'):
-                current_section = 'description'
-                current_activity['description'] = line.split(':', 1)[1].strip()
-            elif line.startswith('Materials:'):
-                current_section = 'materials'
-            elif line.startswith('Steps:'):
-                current_section = 'steps'
-            elif line.startswith('Tips:'):
-                current_section = 'tips'
-            elif line.startswith('Reflection Questions:'):
-                current_section = 'reflection'
-            
-            # Process content based on current section
-            elif current_activity and current_section:
-                content = line
-                
-                # Handle numbered steps
-                if line[0].isdigit() and '. ' in line:
-                    content = line.split('. ', 1)[1].strip()
-                # Handle bullet points
-                elif line.startswith('- ') or line.startswith('* '):
-                    content = line[2:].strip()
-                # Handle continuation of description
-                elif current_section == 'description' and not line.startswith(('Materials:', 'Steps:', 'Tips:', 'Reflection Questions:', 'Title:')):
-                    current_activity['description'] += ' ' + content
-                    i += 1
-                    continue
-                
-                # Skip if content is empty or just a bullet/number
-                if not content or content in ['-', '*'] or content.isdigit():
-                    i += 1
-                    continue
-                
-                # Add content to appropriate section
-                if current_section == 'materials':
-                    current_activity['materials'].append(content)
-                elif current_section == 'steps':
-                    current_activity['steps'].append(content)
-                elif current_section == 'tips':
-                    current_activity['tips'].append(content)
-                elif current_section == 'reflection':
-                    current_activity['reflection'].append(content)
-            
-            i += 1
-        
-        # Add the last activity if exists
-        if current_activity and current_activity['title']:
-            activities.append(current_activity)
-        
-        # Validate activities
-        validated_activities = []
-        for activity in activities:
-            if (activity['title'] and 
-                activity['description'] and 
-                len(activity['materials']) >= 1 and 
-                len(activity['steps']) >= 2 and 
-                len(activity['tips']) >= 1 and 
-                len(activity['reflection']) >= 1):
-                validated_activities.append(activity)
-        
-        if not validated_activities:
-            print("No valid activities were generated")
-            return {
-                "title": "Interactive Learning Activities",
-                "description": "Learn through hands-on activities and physical engagement.",
-                "activities": [{
-                    "title": "Activity Generation Error",
-                    "description": "Please try regenerating the activities.",
-                    "materials": ["Paper", "Pen"],
-                    "steps": ["Review the content carefully", "Take notes on key concepts", "Practice explaining the concepts"],
-                    "tips": ["Focus on understanding one concept at a time", "Try to relate concepts to real-world examples"],
-                    "reflection": ["What are the main ideas you learned?", "How can you apply this knowledge?"]
-                }]
-            }
-        
-        return {
-            "title": "Interactive Learning Activities",
-            "description": "Learn through hands-on activities and physical engagement.",
-            "activities": validated_activities
-        }
+        return parse_kinesthetic_activities(response.choices[0].message.content)
         
     except Exception as e:
-        print(f"Error generating kinesthetic content: {e}")
-        return {
-            "title": "Interactive Learning Activities (Error)",
-            "description": "There was an error processing this document.",
-            "activities": [{
-                "title": "Temporary Activity",
-                "description": "While we fix the error, here's a general learning activity.",
-                "materials": ["Paper", "Pen", "Textbook or learning materials"],
-                "steps": [
-                    "Review the main concepts in your materials",
-                    "Create a mind map or diagram of key ideas",
-                    "Practice explaining the concepts out loud"
-                ],
-                "tips": [
-                    "Take breaks between concepts",
-                    "Try to relate ideas to real-world examples"
-                ],
-                "reflection": [
-                    "What was the most challenging concept to understand?",
-                    "How can you apply what you learned?"
-                ]
-            }]
-        }
+        logger.error("Error generating kinesthetic content: %s", e)
+        return kinesthetic_error_content()
+
+async def generate_kinesthetic_content_async(document_text, priority=PRIORITY_BACKGROUND):
+    """Async version of generate_kinesthetic_content"""
+    if not openai_api_key:
+        logger.debug("Using mock response for kinesthetic content (No API key)")
+        return mock_kinesthetic_content()
+    
+    try:
+        response = await llm_gateway.achat(kinesthetic_request(document_text), priority)
+        return parse_kinesthetic_activities(response.choices[0].message.content)
+    except Exception as e:
+        logger.error("Error generating kinesthetic content: %s", e)
+        return kinesthetic_error_content()
 
 @app.route('/api/files/<file_id>/process-kinesthetic', methods=['OPTIONS', 'POST'])
 def process_kinesthetic(file_id):
     """Process a document for kinesthetic learners by generating interactive activities."""
     if request.method == 'OPTIONS':
         return create_preflight_response()
+    
+    if wants_async(request):
+        return start_job('kinesthetic', process_kinesthetic_job, file_id, file_id=file_id)
         
     try:
-        print(f"Processing kinesthetic content for file ID: {file_id}")
+        logger.debug("Processing kinesthetic content for file ID: %s", file_id)
         
         # Get the document from Firestore
         doc_ref = db.collection("files").document(file_id)
         doc = doc_ref.get()
         
         if not doc.exists:
-            print(f"Document with ID {file_id} not found")
+            logger.warning("Document with ID %s not found", file_id)
             return jsonify({"error": "Document not found"}), 404
             
         doc_data = doc.to_dict()
         storage_path = doc_data.get("storagePath")
         
         if not storage_path:
-            print(f"Storage path not found for document {file_id}")
+            logger.warning("Storage path not found for document %s", file_id)
             return jsonify({"error": "Storage path not found"}), 400
             
         # Create temp directory if it doesn't exist
@@ -2837,7 +2897,8 @@ def process_kinesthetic(file_id):
         # Download file
         temp_path = os.path.join(temp_dir, f"{file_id}_{os.path.basename(storage_path)}")
         blob = bucket.blob(storage_path)
-        blob.download_to_filename(temp_path)
+        with span('storage_download'):
+            blob.download_to_filename(temp_path)
         
         # Extract text from document
         document_text = extract_text_from_document(temp_path)
@@ -2850,8 +2911,7 @@ def process_kinesthetic(file_id):
         content = generate_kinesthetic_content(document_text)
         
         # Store the processed content in Firestore
-        doc_ref.update({
-            "kinestheticContent": content,
+        write_artifact(db, doc_ref, "kinestheticContent", content, {
             "kinestheticGeneratedAt": firestore.SERVER_TIMESTAMP
         })
         
@@ -2861,156 +2921,148 @@ def process_kinesthetic(file_id):
         })
         
     except Exception as e:
-        print(f"Error processing kinesthetic content: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error processing kinesthetic content: %s", e)
         return jsonify({"error": str(e)}), 500
 
+async def process_kinesthetic_job(file_id):
+    """Async job version of process_kinesthetic"""
+    doc_ref, doc_data, document_text = await load_job_document(file_id)
+    content = await generate_kinesthetic_content_async(document_text)
+    
+    await run_blocking(write_artifact, db, doc_ref, "kinestheticContent", content, {
+        "kinestheticGeneratedAt": firestore.SERVER_TIMESTAMP
+    })
+    return {"success": True, "content": content}, 200
+
+def mock_visual_content():
+    """Visual content used for development without an OpenAI API key"""
+    return {
+        "success": True,
+        "content": {
+            "title": "Visual Learning Materials",
+            "description": "Learn through diagrams, concept maps, and visual representations.",
+            "suggestions": [
+                "Create mind maps connecting key concepts from the document",
+                "Use color-coding to highlight related information",
+                "Draw timelines to visualize sequences and processes",
+                "Convert text information into diagrams, charts, or graphs"
+            ],
+            "explanations": [
+                {
+                    "title": "Concept Mapping",
+                    "text": "Organize information visually by connecting related ideas with lines or arrows",
+                    "image": PLACEHOLDER_IMAGE
+                },
+                {
+                    "title": "Visual Hierarchies",
+                    "text": "Represent information in a top-down structure showing relationships between main topics and subtopics",
+                    "image": PLACEHOLDER_IMAGE
+                },
+                {
+                    "title": "Color Coding",
+                    "text": "Use colors systematically to categorize information and highlight patterns",
+                    "image": PLACEHOLDER_IMAGE
+                }
+            ]
+        }
+    }
+
 def generate_visual_content(document_text):
     """Generate visual learning suggestions and concept explanations for visual learning."""
     if not openai_api_key:
-        print("Using mock response for visual content (No API key)")
-        return {
-            "success": True,
-            "content": {
-                "title": "Visual Learning Materials",
-                "description": "Learn through diagrams, concept maps, and visual representations.",
-                "suggestions": [
-                    "Create mind maps connecting key concepts from the document",
-                    "Use color-coding to highlight related information",
-                    "Draw timelines to visualize sequences and processes",
-                    "Convert text information into diagrams, charts, or graphs"
-                ],
-                "explanations": [
-                    {
-                        "title": "Concept Mapping",
-                        "text": "Organize information visually by connecting related ideas with lines or arrows",
-                        "image": "/static/images/placeholder.png"
-                    },
-                    {
-                        "title": "Visual Hierarchies",
-                        "text": "Represent information in a top-down structure showing relationships between main topics and subtopics",
-                        "image": "/static/images/placeholder.png"
-                    },
-                    {
-                        "title": "Color Coding",
-                        "text": "Use colors systematically to categorize information and highlight patterns",
-                        "image": "/static/images/placeholder.png"
-                    }
-                ]
-            }
-        }
+        logger.debug("Using mock response for visual content (No API key)")
+        return mock_visual_content()
     
     try:
-        # Truncate text if too long
-        max_chars = 14000
-        truncated_text = document_text[:max_chars] if len(document_text) > max_chars else document_text
-        
         # Generate visual learning suggestions
-        suggestions_response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": """Create visual learning suggestions for the provided content.
-                Generate a list of 4-6 specific ways a visual learner could engage with this content.
-                Focus on techniques like mind mapping, diagramming, sketching, and visual note-taking."""},
-                {"role": "user", "content": f"Create visual learning suggestions for this content:\n\n{truncated_text}"}
-            ],
-            temperature=0.7
-        )
-        
-        # Extract suggestions as a list
-        suggestions_content = suggestions_response.choices[0].message.content.strip()
-        suggestions = []
-        
-        for line in suggestions_content.split('\n'):
-            # Remove numbered bullets or dashes if present
-            clean_line = re.sub(r'^\d+\.\s*|^-\s*', '', line.strip())
-            if clean_line:
-                suggestions.append(clean_line)
+        suggestions_response = llm_gateway.chat(visual_suggestions_request(document_text))
         
         # Extract main concepts from text
-        concepts_response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": """Extract 3-5 main concepts or topics from the provided text.
-                For each concept:
-                1. Provide a short title (1-3 words)
-                2. Write a brief explanation (50-70 words)
-                
-                Return a list of concepts in JSON format with:
-                - 'title': The concept name
-                - 'text': A brief explanation
-                """},
-                {"role": "user", "content": f"Extract key concepts from this content:\n\n{truncated_text}"}
-            ],
-            response_format={ "type": "json_object" },
-            temperature=0.7
-        )
+        concepts_response = llm_gateway.chat(visual_explanations_request(document_text))
         
-        # Parse the response to get explanations
-        try:
-            concepts_data = json.loads(concepts_response.choices[0].message.content)
-            explanations = concepts_data.get("concepts", [])
-            
-            # If response doesn't have the expected format, try parsing differently
-            if not explanations and isinstance(concepts_data, list):
-                explanations = concepts_data
-                
-            # Process explanations to ensure correct format
-            processed_explanations = []
-            for exp in explanations:
-                if isinstance(exp, dict) and 'title' in exp:
-                    # Set a default image path
-                    if 'image' not in exp:
-                        exp['image'] = '/static/images/placeholder.png'
-                    processed_explanations.append(exp)
-            
-            if processed_explanations:
-                return {
-                    "success": True,
-                    "content": {
-                        "title": "Visual Learning Materials",
-                        "description": "Learn through diagrams, concept maps, and visual representations.",
-                        "suggestions": suggestions,
-                        "explanations": processed_explanations
-                    }
-                }
-            else:
-                raise ValueError("Failed to parse explanations from OpenAI response")
-                
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
-            print(f"Error parsing concepts response: {e}")
-            print(f"Raw response: {concepts_response.choices[0].message.content}")
-            raise
+        return build_visual_content(suggestions_response.choices[0].message.content,
+                                    concepts_response.choices[0].message.content)
             
     except Exception as e:
-        print(f"Error generating visual content: {e}")
+        logger.error("Error generating visual content: %s", e)
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+async def generate_visual_content_async(document_text, priority=PRIORITY_BACKGROUND):
+    """Async version of generate_visual_content; suggestions and concepts are generated concurrently"""
+    if not openai_api_key:
+        logger.debug("Using mock response for visual content (No API key)")
+        return mock_visual_content()
+    
+    try:
+        suggestions_response, concepts_response = await asyncio.gather(
+            llm_gateway.achat(visual_suggestions_request(document_text), priority),
+            llm_gateway.achat(visual_explanations_request(document_text), priority))
+        return build_visual_content(suggestions_response.choices[0].message.content,
+                                    concepts_response.choices[0].message.content)
+    except Exception as e:
+        logger.error("Error generating visual content: %s", e)
         return {
             "success": False,
             "error": str(e)
         }
 
+def validate_visual_content(content):
+    """Coerce explanations and suggestions (if present) to the format the frontend expects"""
+    # Validate explanations format
+    if "explanations" in content:
+        # Ensure explanations is an array
+        if not isinstance(content["explanations"], list):
+            content["explanations"] = []
+        
+        # Validate each explanation
+        valid_explanations = []
+        for expl in content["explanations"]:
+            if isinstance(expl, dict) and "title" in expl and "image" in expl and "text" in expl:
+                valid_explanations.append({
+                    "title": str(expl["title"]),
+                    "image": str(expl["image"]),
+                    "text": str(expl["text"])
+                })
+        content["explanations"] = valid_explanations
+    
+    # Validate suggestions format
+    if "suggestions" in content:
+        # Ensure suggestions is an array of strings
+        if not isinstance(content["suggestions"], list):
+            content["suggestions"] = []
+        
+        # Convert non-string suggestions to strings
+        content["suggestions"] = [str(s) for s in content["suggestions"]]
+    return content
+
 @app.route('/api/files/<file_id>/process-visual', methods=['OPTIONS', 'POST'])
 def process_visual(file_id):
     """Process a document for visual learners by generating visual learning suggestions."""
     if request.method == 'OPTIONS':
         return create_preflight_response()
+    
+    if wants_async(request):
+        return start_job('visual', process_visual_job, file_id, file_id=file_id)
         
     try:
-        print(f"Processing visual content for file ID: {file_id}")
+        logger.debug("Processing visual content for file ID: %s", file_id)
         
         # Get the document from Firestore
         doc_ref = db.collection("files").document(file_id)
         doc = doc_ref.get()
         
         if not doc.exists:
-            print(f"Document with ID {file_id} not found")
+            logger.warning("Document with ID %s not found", file_id)
             return jsonify({"error": "Document not found"}), 404
             
         doc_data = doc.to_dict()
         storage_path = doc_data.get("storagePath")
         
         if not storage_path:
-            print(f"Storage path not found for document {file_id}")
+            logger.warning("Storage path not found for document %s", file_id)
             return jsonify({"error": "Storage path not found"}), 400
             
         # Create temp directory if it doesn't exist
@@ -3021,7 +3073,8 @@ def process_visual(file_id):
         # Download file
         temp_path = os.path.join(temp_dir, f"{file_id}_{os.path.basename(storage_path)}")
         blob = bucket.blob(storage_path)
-        blob.download_to_filename(temp_path)
+        with span('storage_download'):
+            blob.download_to_filename(temp_path)
         
         # Extract text from document
         document_text = extract_text_from_document(temp_path)
@@ -3033,35 +3086,10 @@ def process_visual(file_id):
         # Generate visual content (now just suggestions)
         content = generate_visual_content(document_text)
         
-        # Validate explanations format
-        if "explanations" in content:
-            # Ensure explanations is an array
-            if not isinstance(content["explanations"], list):
-                content["explanations"] = []
-            
-            # Validate each explanation
-            valid_explanations = []
-            for expl in content["explanations"]:
-                if isinstance(expl, dict) and "title" in expl and "image" in expl and "text" in expl:
-                    valid_explanations.append({
-                        "title": str(expl["title"]),
-                        "image": str(expl["image"]),
-                        "text": str(expl["text"])
-                    })
-            content["explanations"] = valid_explanations
-        
-        # Validate suggestions format
-        if "suggestions" in content:
-            # Ensure suggestions is an array of strings
-            if not isinstance(content["suggestions"], list):
-                content["suggestions"] = []
-            
-            # Convert non-string suggestions to strings
-            content["suggestions"] = [str(s) for s in content["suggestions"]]
+        validate_visual_content(content)
         
         # Store the processed content in Firestore
-        doc_ref.update({
-            "visualContent": content,
+        write_artifact(db, doc_ref, "visualContent", content, {
             "visualGeneratedAt": firestore.SERVER_TIMESTAMP
         })
         
@@ -3071,12 +3099,22 @@ def process_visual(file_id):
         })
         
     except Exception as e:
-        print(f"Error processing visual content: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error processing visual content: %s", e)
         return jsonify({"error": str(e)}), 500
 
-def generate_concept_svg(concept_name):
-    """Generate a simple SVG icon based on the concept name."""
+async def process_visual_job(file_id):
+    """Async job version of process_visual"""
+    doc_ref, doc_data, document_text = await load_job_document(file_id)
+    content = validate_visual_content(await generate_visual_content_async(document_text))
+    
+    await run_blocking(write_artifact, db, doc_ref, "visualContent", content, {
+        "visualGeneratedAt": firestore.SERVER_TIMESTAMP
+    })
+    return {"success": True, "content": content}, 200
+
+@lru_cache(maxsize=1024)
+def render_concept_svg(concept_name):
+    """Render the deterministic SVG icon for a concept name; returns (svg_content, etag)"""
     # Generate a consistent color based on the concept name
     hash_value = int(hashlib.md5(concept_name.encode()).hexdigest(), 16)
     
@@ -3087,36 +3125,37 @@ def generate_concept_svg(concept_name):
     accent_color = f"hsl({(hue + 180) % 360}, 70%, 50%)"  # Accent color
     
     # Get the first letter of each word in the concept (max 2)
-    words = concept_name.split()
+    words = concept_name.split() or ['?']
     initial = words[0][0].upper()
     if len(words) > 1:
         initial += words[1][0].upper()
     else:
         initial = initial[:2]  # Take at most 2 chars
     
-    # Create a unique filename
-    safe_name = re.sub(r'[^a-z0-9]', '-', concept_name.lower())
-    filename = f"{safe_name}.svg"
-    
-    # Create the SVG file path
-    svg_path = os.path.join('frontend', 'public', 'images', filename)
-    
     # Generate a simple SVG
     svg_content = f"""<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100" viewBox="0 0 100 100">
   <rect width="100" height="100" fill="#f5f9ff" rx="10" ry="10"/>
   <circle cx="50" cy="50" r="30" fill="{primary_color}"/>
   <path d="M30 70 L70 30 M30 30 L70 70" stroke="{secondary_color}" stroke-width="5" stroke-linecap="round"/>
-  <text x="50" y="55" font-family="Arial" font-size="20" text-anchor="middle" fill="white" font-weight="bold">{initial}</text>
+  <text x="50" y="55" font-family="Arial" font-size="20" text-anchor="middle" fill="white" font-weight="bold">{xml_escape(initial)}</text>
 </svg>"""
     
-    # Ensure the directory exists
-    os.makedirs(os.path.dirname(svg_path), exist_ok=True)
-    
-    # Write the SVG file
-    with open(svg_path, 'w') as f:
-        f.write(svg_content)
+    return svg_content, hashlib.sha256(svg_content.encode('utf-8')).hexdigest()
+
+def generate_concept_svg(concept_name):
+    """Return the URL of the SVG icon for a concept (rendered on request by concept_icon)"""
+    return url_for('concept_icon', name=concept_name, _external=True)
+
+@app.route('/api/concept-icon/<path:name>.svg', methods=['GET'])
+def concept_icon(name):
+    """Serve the SVG icon for a concept; icons never change for a given name"""
+    svg_content, etag = render_concept_svg(name)
     
-    return f"/images/{filename}"
+    response = Response(svg_content, mimetype='image/svg+xml')
+    # Weak, like the compressed 200 (see fast_json), so a 304 carries the same validator
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response.make_conditional(request)
 
 @app.route('/api/generate-visuals', methods=['POST'])
 def generate_visuals():
@@ -3143,7 +3182,7 @@ def generate_visuals():
             
         # Generate visual concepts
         if not openai_api_key:
-            print("Using mock response for visual concepts (No API key)")
+            logger.debug("Using mock response for visual concepts (No API key)")
             
             # Return sample data
             return jsonify({
@@ -3172,7 +3211,7 @@ def generate_visuals():
         truncated_text = document_text[:max_chars] if len(document_text) > max_chars else document_text
         
         # Extract main concepts from text
-        concepts_response = client.chat.completions.create(
+        concepts_response = llm_gateway.chat(dict(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": """Extract 4-6 main concepts or topics from the provided text.
@@ -3191,7 +3230,7 @@ def generate_visuals():
             ],
             response_format={ "type": "json_object" },
             temperature=0.7
-        )
+        ))
         
         # Parse response
         concepts_data = json.loads(concepts_response.choices[0].message.content)
@@ -3226,8 +3265,7 @@ def generate_visuals():
         })
         
     except Exception as e:
-        print(f"Error generating visual concepts: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error generating visual concepts: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/visual-concepts', methods=['GET'])
@@ -3240,6 +3278,9 @@ def get_visual_concepts():
         file_id = request.args.get('fileId')
         if not file_id:
             return jsonify({"error": "No fileId provided"}), 400
+        
+        if wants_async(request):
+            return start_job('visual_concepts', get_visual_concepts_job, file_id, file_id=file_id)
             
         # Get the document from Firestore
         doc_ref = db.collection("files").document(file_id)
@@ -3262,7 +3303,8 @@ def get_visual_concepts():
         # Download file
         temp_path = os.path.join(temp_dir, f"{file_id}_{os.path.basename(storage_path)}")
         blob = bucket.blob(storage_path)
-        blob.download_to_filename(temp_path)
+        with span('storage_download'):
+            blob.download_to_filename(temp_path)
         
         # Extract text from document
         document_text = extract_text_from_document(temp_path)
@@ -3274,112 +3316,49 @@ def get_visual_concepts():
         # Generate sample concepts (in production, use a real NLP model)
         if not openai_api_key:
             # Sample data for testing - use placeholder images
-            return jsonify([
-                {
-                    "title": "Convolutional Neural Network",
-                    "description": "Utilized for classification and computer vision tasks.",
-                    "image": "/static/images/placeholder.png"
-                },
-                {
-                    "title": "Recurrent Neural Network",
-                    "description": "For sequential data processing, like text or time series.",
-                    "image": "/static/images/placeholder.png"
-                },
-                {
-                    "title": "Transfer Learning",
-                    "description": "Using pre-trained models and fine-tuning for new tasks.",
-                    "image": "/static/images/placeholder.png"
-                }
-            ])
+            return jsonify(SAMPLE_VISUAL_CONCEPTS)
         
         # Use OpenAI to generate concepts
         try:
-            # Truncate text if too long (OpenAI has token limits)
-            max_chars = 14000
-            truncated_text = document_text[:max_chars] if len(document_text) > max_chars else document_text
-            
             # Extract main concepts from text
-            concepts_response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": """Extract 4-6 main concepts or topics from the provided text.
-                    For each concept:
-                    1. Provide a short title (1-3 words)
-                    2. Write a brief 1-2 sentence explanation of the concept
-                    
-                    Return a JSON array where each item has:
-                    - 'title': The concept name
-                    - 'description': A brief explanation (max 120 characters)
-                    """},
-                    {"role": "user", "content": f"Extract key concepts from this content:\n\n{truncated_text}"}
-                ],
-                response_format={ "type": "json_object" },
-                temperature=0.7
-            )
-            
-            # Parse response
-            data = json.loads(concepts_response.choices[0].message.content)
-            concepts = data if isinstance(data, list) else data.get("concepts", [])
-            
-            # Get images for each concept using SerpAPI
-            for concept in concepts:
-                try:
-                    # Check for SerpAPI key
-                    if not serpapi_key:
-                        concept["image"] = "/static/images/placeholder.png"
-                        continue
-                        
-                    if GoogleSearch is None:
-                        concept["image"] = "/static/images/placeholder.png"
-                        continue
-                        
-                    # Use SerpAPI to get image
-                    search = GoogleSearch({
-                        "q": f"{concept['title']} diagram educational",
-                        "tbm": "isch",  # image search
-                        "num": 1,
-                        "safe": "active",  # safe search
-                        "api_key": serpapi_key
-                    })
-                    results = search.get_dict()
-                    
-                    if results.get("images_results"):
-                        concept["image"] = results["images_results"][0]["original"]
-                    else:
-                        concept["image"] = "/static/images/placeholder.png"
-                        
-                except Exception as img_error:
-                    print(f"Error getting image for {concept['title']}: {img_error}")
-                    concept["image"] = "/static/images/placeholder.png"
-                
-            return jsonify(concepts)
+            concepts_response = llm_gateway.chat(visual_concepts_request(document_text))
+            concepts = parse_visual_concepts(concepts_response.choices[0].message.content)
+            return jsonify(attach_concept_images(concepts))
             
         except Exception as e:
-            print(f"Error generating concepts with OpenAI: {e}")
+            logger.error("Error generating concepts with OpenAI: %s", e)
             # Fallback to sample data with placeholder images
-            return jsonify([
-                {
-                    "title": "Convolutional Neural Network",
-                    "description": "Utilized for classification and computer vision tasks.",
-                    "image": "/static/images/placeholder.png"
-                },
-                {
-                    "title": "Recurrent Neural Network", 
-                    "description": "For sequential data processing, like text or time series.",
-                    "image": "/static/images/placeholder.png"
-                },
-                {
-                    "title": "Transfer Learning",
-                    "description": "Using pre-trained models and fine-tuning for new tasks.",
-                    "image": "/static/images/placeholder.png"
-                }
-            ])
+            return jsonify(SAMPLE_VISUAL_CONCEPTS)
         
     except Exception as e:
-        print(f"Error in visual concepts endpoint: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in visual concepts endpoint: %s", e)
         return jsonify({"error": str(e)}), 500
 
+def attach_concept_images(concepts):
+    """Set each concept's image, looking all of them up concurrently through the cached SerpAPI lookup"""
+    lookup = get_image_lookup_service()
+    if lookup.available:
+        images = lookup.lookup_many([concept.get('title', '') for concept in concepts], default=PLACEHOLDER_IMAGE)
+    else:
+        images = [PLACEHOLDER_IMAGE] * len(concepts)
+    for concept, image in zip(concepts, images):
+        concept["image"] = image
+    return concepts
+
+async def get_visual_concepts_job(file_id):
+    """Async job version of get_visual_concepts"""
+    doc_ref, doc_data, document_text = await load_job_document(file_id)
+    if not openai_api_key:
+        return SAMPLE_VISUAL_CONCEPTS, 200
+    
+    try:
+        concepts_response = await llm_gateway.achat(visual_concepts_request(document_text), PRIORITY_BACKGROUND)
+        concepts = parse_visual_concepts(concepts_response.choices[0].message.content)
+        return await run_blocking(attach_concept_images, concepts), 200
+    except Exception as e:
+        logger.error("Error generating concepts with OpenAI: %s", e)
+        return SAMPLE_VISUAL_CONCEPTS, 200
+
 @app.route('/api/generate-image', methods=['POST'])
 def generate_image():
     """Redirects to SerpAPI-based image search instead of using DALL-E"""
@@ -3394,7 +3373,7 @@ def generate_image():
         return image_for_topic()
         
     except Exception as e:
-        print(f"Error redirecting image generation: {str(e)}")
+        logger.error("Error redirecting image generation: %s", e)
         return jsonify({
             "success": False,
             "error": str(e)
@@ -3410,38 +3389,27 @@ def image_for_topic():
     if not topic:
         return jsonify({"error": "No topic provided"}), 400
         
-    # Get the SerpAPI key from environment variables
-    serpapi_key = os.getenv("SERPAPI_API_KEY")
-    
     if not serpapi_key:
         return jsonify({"error": "SerpAPI key not configured"}), 500
         
-    if GoogleSearch is None:
+    if get_google_search_class() is None:
         return jsonify({"error": "SerpAPI package not installed. Please run: pip install google-search-results"}), 500
 
     try:
-        search = GoogleSearch({
-            "q": f"{topic} diagram educational",
-            "tbm": "isch",  # image search
-            "num": 1,
-            "safe": "active",  # safe search
-            "api_key": serpapi_key
-        })
-        results = search.get_dict()
+        image_url = get_image_lookup_service().lookup(topic)
         
-        if not results.get("images_results"):
+        if not image_url:
             return jsonify({"error": "No images found", "image": "/static/images/placeholder.png"}), 404
             
-        image_url = results["images_results"][0]["original"]
         return jsonify({
-            "success": true,
+            "success": True,
             "image_url": image_url
         })
         
     except Exception as e:
-        print(f"Error searching for image: {str(e)}")
+        logger.error("Error searching for image: %s", e)
         return jsonify({
-            "success": false,
+            "success": False,
             "error": str(e),
             "image_url": "/static/images/placeholder.png"
         }), 500
@@ -3454,21 +3422,21 @@ def process_reading_writing_consistent(file_id):
         return create_preflight_response()
         
     try:
-        print(f"Processing reading/writing content (CONSISTENT) for file ID: {file_id}")
+        logger.debug("Processing reading/writing content (CONSISTENT) for file ID: %s", file_id)
         
         # Get the document from Firestore
         doc_ref = db.collection("files").document(file_id)
         doc = doc_ref.get()
         
         if not doc.exists:
-            print(f"Document with ID {file_id} not found")
+            logger.warning("Document with ID %s not found", file_id)
             return jsonify({"error": "Document not found"}), 404
             
         doc_data = doc.to_dict()
         storage_path = doc_data.get("storagePath")
         
         if not storage_path:
-            print(f"Storage path not found for document {file_id}")
+            logger.warning("Storage path not found for document %s", file_id)
             return jsonify({"error": "Storage path not found"}), 400
             
         # Create temp directory if it doesn't exist
@@ -3479,7 +3447,8 @@ def process_reading_writing_consistent(file_id):
         # Download file
         temp_path = os.path.join(temp_dir, f"{file_id}_{os.path.basename(storage_path)}")
         blob = bucket.blob(storage_path)
-        blob.download_to_filename(temp_path)
+        with span('storage_download'):
+            blob.download_to_filename(temp_path)
         
         # Extract text from document
         document_text = extract_text_from_document(temp_path)
@@ -3489,52 +3458,19 @@ def process_reading_writing_consistent(file_id):
             os.remove(temp_path)
             
         # Generate reading/writing optimized content
-        print("Generating consistent content for web and files...")
+        logger.debug("Generating consistent content for web and files...")
         content = generate_reading_writing_content(document_text)
         
         # Get the content that will be displayed on the web - EXACTLY the same will be used for files
         web_content = content["elements"][0]["content"]
-        print(f"Content first 100 chars: {web_content[:100]}")
-        
-        # Create DOCX and PDF with EXACTLY the same content
-        docx_file = create_docx_study_guide(web_content)
-        pdf_file = create_pdf_study_guide(web_content)
-        
-        # Upload processed documents to Firebase Storage
-        docx_filename = f"reading_writing_{file_id}.docx"
-        pdf_filename = f"reading_writing_{file_id}.pdf"
+        logger.debug("Content first 100 chars: %s", web_content[:100])
         
-        docx_storage_path = f"processed/{doc_data.get('userId', 'unknown')}/{docx_filename}"
-        pdf_storage_path = f"processed/{doc_data.get('userId', 'unknown')}/{pdf_filename}"
-        
-        # Upload DOCX
-        docx_blob = bucket.blob(docx_storage_path)
-        docx_blob.upload_from_file(docx_file, content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-        docx_blob.make_public()
-        
-        # Upload PDF
-        pdf_blob = bucket.blob(pdf_storage_path)
-        pdf_blob.upload_from_file(pdf_file, content_type='application/pdf')
-        pdf_blob.make_public()
-        
-        # Store the processed content in Firestore
-        doc_ref.update({
-            "readingWritingContent": content,
-            "readingWritingDocxUrl": docx_blob.public_url,
-            "readingWritingPdfUrl": pdf_blob.public_url,
-            "readingWritingGeneratedAt": firestore.SERVER_TIMESTAMP
-        })
-        
-        return jsonify({
-            "success": True,
-            "content": content,
-            "docxUrl": docx_blob.public_url,
-            "pdfUrl": pdf_blob.public_url
-        })
+        # DOCX and PDF are rendered from EXACTLY the same content (parsed once)
+        study_guide = parse_study_guide(web_content)
+        return store_reading_writing_result(doc_ref, doc_data, file_id, content, study_guide)
         
     except Exception as e:
-        print(f"Error processing reading/writing content: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error processing reading/writing content: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/user/login-streak', methods=['POST'])
@@ -3629,7 +3565,7 @@ def update_login_streak():
             "longestStreak": streak_data.get("longestStreak", longest_streak)
         })
     except Exception as e:
-        print(f"Error updating login streak: {str(e)}")
+        logger.error("Error updating login streak: %s", e)
         return jsonify({"error": f"Failed to update login streak: {str(e)}"}), 500
 
 @app.route('/api/user/record-time', methods=['POST'])
@@ -3709,7 +3645,7 @@ def record_session_time():
             if last_week_tracked and last_week_tracked != week_key:
                 # We've moved to a new week, but we keep the old weeks' data in the weeklyStats object
                 # The frontend will only show current week
-                print(f"User moved to a new week: {last_week_tracked} -> {week_key}")
+                logger.debug("User moved to a new week: %s -> %s", last_week_tracked, week_key)
             
             # Update lastWeekTracked
             user_data["stats"]["lastWeekTracked"] = week_key
@@ -3736,7 +3672,7 @@ def record_session_time():
             weekly_stats[week_key]["activities"][activity_type] += duration_minutes
             
         except (ValueError, TypeError):
-            print(f"Error parsing date: {session_start}")
+            logger.warning("Error parsing date: %s", session_start)
         
         # Update user record in Firestore
         db.collection("users").document(user_id).update({
@@ -3760,7 +3696,7 @@ def record_session_time():
                     timeout=10
                 )).start()
             except Exception as e:
-                print(f"Error triggering leaderboard update: {str(e)}")
+                logger.error("Error triggering leaderboard update: %s", e)
                 # Don't fail the main request if this fails
         
         return jsonify({
@@ -3771,11 +3707,14 @@ def record_session_time():
             "currentWeekTime": current_week_data["totalMinutes"] if current_week_data else 0
         })
     except Exception as e:
-        print(f"Error recording session time: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error recording session time: %s", e)
         return jsonify({"error": f"Failed to record session time: {str(e)}"}), 500
 
+# The leaderboard is shared by all users and only changes when someone's stats are updated
+LEADERBOARD_CACHE_CONTROL = 'public, max-age=15'
+
 @app.route('/api/leaderboard', methods=['GET'])
+@cached_json(LEADERBOARD_CACHE_CONTROL)
 def get_leaderboard():
     """Get leaderboard data for top streaks and learning time"""
     try:
@@ -3783,6 +3722,14 @@ def get_leaderboard():
         leaderboard_ref = db.collection("leaderboard").document("stats")
         leaderboard_doc = leaderboard_ref.get()
         
+        etag = None
+        if leaderboard_doc.exists:
+            # The document's update time identifies the payload; answer 304 before serializing it
+            etag = version_etag("leaderboard", leaderboard_doc.update_time)
+            unchanged = not_modified(etag, LEADERBOARD_CACHE_CONTROL)
+            if unchanged:
+                return unchanged
+        
         if not leaderboard_doc.exists:
             # Initialize leaderboard if it doesn't exist
             leaderboard_data = {
@@ -3793,13 +3740,15 @@ def get_leaderboard():
         else:
             leaderboard_data = leaderboard_doc.to_dict()
             
-        return jsonify({
+        response = jsonify({
             "success": True,
             "leaderboard": leaderboard_data
         })
+        if etag:
+            response.set_etag(etag)
+        return response
     except Exception as e:
-        print(f"Error getting leaderboard: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error getting leaderboard: %s", e)
         return jsonify({"error": f"Failed to get leaderboard: {str(e)}"}), 500
 
 @app.route('/api/leaderboard/update', methods=['POST'])
@@ -3869,8 +3818,7 @@ def update_leaderboard():
             "leaderboard": leaderboard_data
         })
     except Exception as e:
-        print(f"Error updating leaderboard: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error updating leaderboard: %s", e)
         return jsonify({"error": f"Failed to update leaderboard: {str(e)}"}), 500
 
 @app.route('/api/user/time-stats', methods=['POST'])
@@ -3959,8 +3907,7 @@ def get_user_time_stats():
             "recentSessions": recent_sessions[-10:]  # Return last 10 sessions
         })
     except Exception as e:
-        print(f"Error getting time stats: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error getting time stats: %s", e)
         return jsonify({"error": f"Failed to get time stats: {str(e)}"}), 500
 
 @app.route('/api/user/current-week-time', methods=['POST'])
@@ -4017,8 +3964,7 @@ def get_current_week_time():
             "currentWeekKey": current_week_key
         })
     except Exception as e:
-        print(f"Error getting current week time: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error getting current week time: %s", e)
         return jsonify({"error": f"Failed to get current week time: {str(e)}"}), 500
 
 @app.route('/api/user/weekly-stats', methods=['POST'])
@@ -4090,15 +4036,15 @@ def get_weekly_stats():
             ]
         })
     except Exception as e:
-        print(f"Error getting weekly stats: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error getting weekly stats: %s", e)
         return jsonify({"error": f"Failed to get weekly stats: {str(e)}"}), 500
 
-@app.route('/api/user/learning-style', methods=['POST'])
+@app.route('/api/user/learning-style', methods=['GET', 'POST'])
+@cached_json()
 def get_learning_style():
-    """Get user's learning style data from Firestore"""
+    """Get user's learning style data from Firestore (GET with ?email= supports conditional requests)"""
     try:
-        data = request.json
+        data = request.args if request.method == 'GET' else request.json
         if not data:
             return jsonify({"error": "Invalid request: No JSON data provided"}), 400
             
@@ -4191,8 +4137,7 @@ def get_learning_style():
         })
         
     except Exception as e:
-        print(f"Error getting learning style: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error getting learning style: %s", e)
         return jsonify({
             "success": False, 
             "error": str(e),
@@ -4207,6 +4152,7 @@ def get_learning_style():
 
 # User Preferences API routes
 @app.route('/api/users/<user_id>/preferences/learning-style', methods=['GET'])
+@cached_json()
 def get_user_learning_style(user_id):
     try:
         # Get user document from Firestore
@@ -4232,7 +4178,7 @@ def get_user_learning_style(user_id):
             "defaultStyle": preferences_data.get("defaultStyle", "visual")
         })
     except Exception as e:
-        print(f"Error getting user learning style: {e}")
+        logger.error("Error getting user learning style: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/users/<user_id>/preferences/learning-style', methods=['POST'])
@@ -4263,10 +4209,11 @@ def set_user_learning_style(user_id):
             "message": "Learning style preference updated"
         })
     except Exception as e:
-        print(f"Error setting user learning style: {e}")
+        logger.error("Error setting user learning style: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/users/<user_id>/preferences/subjects', methods=['GET'])
+@cached_json()
 def get_user_subject_preferences(user_id):
     try:
         # Get user document from Firestore
@@ -4301,7 +4248,7 @@ def get_user_subject_preferences(user_id):
             "subjects": subject_list
         })
     except Exception as e:
-        print(f"Error getting user subject preferences: {e}")
+        logger.error("Error getting user subject preferences: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
         
 @app.route('/api/users/<user_id>/preferences/subjects', methods=['POST'])
@@ -4345,7 +4292,7 @@ def set_user_subject_preference(user_id):
             "message": "Subject preference updated"
         })
     except Exception as e:
-        print(f"Error setting user subject preference: {e}")
+        logger.error("Error setting user subject preference: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/users/<user_id>/preferences/subjects/<subject>', methods=['DELETE'])
@@ -4386,10 +4333,11 @@ def delete_user_subject_preference(user_id, subject):
             "message": "Subject preference deleted"
         })
     except Exception as e:
-        print(f"Error deleting user subject preference: {e}")
+        logger.error("Error deleting user subject preference: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/users/<user_id>/learning-effectiveness', methods=['GET'])
+@cached_json()
 def get_user_learning_effectiveness(user_id):
     try:
         # Get user document from Firestore
@@ -4438,7 +4386,7 @@ def get_user_learning_effectiveness(user_id):
             "recommendedStyle": recommended_style
         })
     except Exception as e:
-        print(f"Error getting learning effectiveness data: {e}")
+        logger.error("Error getting learning effectiveness data: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/users/<user_id>/learning-effectiveness', methods=['POST'])
@@ -4549,11 +4497,14 @@ def track_learning_effectiveness(user_id):
             "message": "Learning effectiveness data updated"
         })
     except Exception as e:
-        print(f"Error tracking learning effectiveness: {e}")
+        logger.error("Error tracking learning effectiveness: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 if __name__ == "__main__":
     # Set debug mode to False in production to avoid auto-reloading
     # You can enable it with an environment variable for development
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+    # Spawned render processes would re-run this script (Firebase, OpenAI, ...) as
+    # their __main__; the development server renders PDFs in-thread instead
+    set_render_processes(0)
     app.run(debug=debug_mode, host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
@@ -0,0 +1,156 @@
+"""
+Generated artifacts stored outside the `files` metadata documents.
+
+Generated content (study guides, summaries, quizzes, ...) used to be written
+into `files/{file_id}` itself, so every metadata read paid for all of it and
+long materials approached Firestore's 1 MiB document limit. Each artifact
+now lives in `files/{file_id}/artifacts/{artifact_id}`. The metadata
+document keeps only a small pointer under `artifacts.{artifact_id}`, with
+the status and update time.
+
+load_artifact() reads an artifact only when it is needed. It still
+understands documents that have not been migrated yet (content inline in
+the metadata document). migrate_file_artifacts() moves inline content out of
+existing documents; see migrate_artifacts.py.
+"""
+from firebase_admin import firestore
+
+from metrics import timed
+
+ARTIFACTS_COLLECTION = 'artifacts'
+
+# Metadata document field -> artifact id
+ARTIFACT_FIELDS = {
+    'processedContent': 'processed',
+    'summary': 'summary',
+    'readingWritingContent': 'reading_writing',
+    'auditoryContent': 'auditory',
+    'kinestheticContent': 'kinesthetic',
+    'visualContent': 'visual',
+}
+
+QUIZ_FIELD_PREFIX = 'quiz_'
+
+
+def artifact_id_for_field(field):
+    """Artifact id of a metadata field (None if the field is not an artifact)"""
+    if field in ARTIFACT_FIELDS:
+        return ARTIFACT_FIELDS[field]
+    # quiz_<type>, but not the quiz_<type>_generatedAt timestamps
+    if field.startswith(QUIZ_FIELD_PREFIX) and not field.endswith('_generatedAt'):
+        return field
+    return None
+
+
+def artifact_ref(doc_ref, artifact_id):
+    """Reference to an artifact document of a file"""
+    return doc_ref.collection(ARTIFACTS_COLLECTION).document(artifact_id)
+
+
+def artifact_pointer(artifact_id):
+    """Pointer stored in the metadata document for an artifact"""
+    return {
+        'status': 'ready',
+        'path': f"{ARTIFACTS_COLLECTION}/{artifact_id}",
+        'updatedAt': firestore.SERVER_TIMESTAMP
+    }
+
+
+@timed('firestore_write_artifact')
+def write_artifact(db, doc_ref, field, content, metadata=None):
+    """
+    Store generated content for field in the artifacts subcollection and update the
+    metadata document with its pointer (plus any extra metadata) in one batch.
+    """
+    artifact_id = artifact_id_for_field(field)
+    batch = db.batch()
+    batch.set(artifact_ref(doc_ref, artifact_id), {
+        'field': field,
+        'content': content,
+        'createdAt': firestore.SERVER_TIMESTAMP
+    })
+    batch.update(doc_ref, {
+        **(metadata or {}),
+        f"artifacts.{artifact_id}": artifact_pointer(artifact_id),
+        # Drop any content still stored inline from before the split
+        field: firestore.DELETE_FIELD
+    })
+    batch.commit()
+
+
+def load_artifact(doc_ref, file_data, field):
+    """
+    Return the generated content for field, or None if there is none.
+    Reads the artifacts subcollection only when the metadata document points to it.
+    """
+    if field in file_data:
+        # Not migrated yet: content is still inline
+        return file_data[field]
+
+    artifact_id = artifact_id_for_field(field)
+    if artifact_id is None or artifact_id not in (file_data.get('artifacts') or {}):
+        return None
+
+    artifact = artifact_ref(doc_ref, artifact_id).get()
+    return artifact.to_dict().get('content') if artifact.exists else None
+
+
+def load_artifacts(db, doc_ref, file_data, fields=None):
+    """
+    Return {field: content} for the file's artifacts (all of them, or only fields).
+    Artifact documents are fetched in a single batched read.
+    """
+    pointers = file_data.get('artifacts') or {}
+    artifact_fields = {artifact_id: field for field, artifact_id in ARTIFACT_FIELDS.items()}
+    wanted = {}
+    for artifact_id in pointers:
+        field = artifact_fields.get(artifact_id, artifact_id)
+        if fields is None or field in fields:
+            wanted[artifact_id] = field
+
+    contents = {}
+    if wanted:
+        refs = [artifact_ref(doc_ref, artifact_id) for artifact_id in wanted]
+        for artifact in db.get_all(refs):
+            if artifact.exists:
+                contents[wanted[artifact.id]] = artifact.to_dict().get('content')
+
+    # Content that is still inline (not migrated yet)
+    for field, value in file_data.items():
+        if artifact_id_for_field(field) and (fields is None or field in fields):
+            contents[field] = value
+    return contents
+
+
+def delete_artifacts(db, doc_ref):
+    """Delete a file's artifacts subcollection (Firestore does not cascade deletes)"""
+    batch = db.batch()
+    for artifact in doc_ref.collection(ARTIFACTS_COLLECTION).stream():
+        batch.delete(artifact.reference)
+    batch.commit()
+
+
+def migrate_file_artifacts(db, doc):
+    """
+    Move inline generated content of a `files` document snapshot into the artifacts
+    subcollection. Returns the migrated field names.
+    """
+    file_data = doc.to_dict()
+    fields = [field for field in file_data if artifact_id_for_field(field)]
+    if not fields:
+        return []
+
+    batch = db.batch()
+    update = {}
+    for field in fields:
+        artifact_id = artifact_id_for_field(field)
+        batch.set(artifact_ref(doc.reference, artifact_id), {
+            'field': field,
+            'content': file_data[field],
+            'createdAt': firestore.SERVER_TIMESTAMP
+        })
+        update[f"artifacts.{artifact_id}"] = artifact_pointer(artifact_id)
+        update[field] = firestore.DELETE_FIELD
+    batch.update(doc.reference, update)
+    batch.commit()
+    return fields
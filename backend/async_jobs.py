@@ -0,0 +1,228 @@
+"""
+Background jobs for the generation routes, run on an asyncio event loop.
+
+Generating a summary, quiz or learning-style content spends nearly all of its
+time waiting on OpenAI, Firebase Storage and SerpAPI. Served synchronously,
+every waiting request holds one of the worker's threads, so a worker can
+only have GUNICORN_THREADS generations in flight. When a request carries
+``Prefer: respond-async``, the route starts a job instead and answers
+``202 Accepted`` right away with the job's URL. The job runs as a coroutine
+on the worker's job loop (one thread per worker process). While it awaits
+OpenAI through AsyncOpenAI it holds no thread, so one worker can keep many
+generations in flight. Blocking client libraries (Firestore, Storage, text
+extraction) are called through run_blocking(), which hands them to a bounded
+thread pool.
+
+Job state is stored in the Firestore ``jobs`` collection, so whichever
+worker serves ``GET /api/jobs/<job_id>`` can answer it.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from datetime import datetime, timedelta, timezone
+import functools
+import json
+import logging
+import os
+import threading
+import uuid
+
+from firebase_admin import firestore
+
+from structured_logging import bind_request_id, get_request_id
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = 'jobs'
+# Jobs running concurrently per worker; further jobs wait their turn on the loop
+ASYNC_MAX_JOBS = int(os.getenv('ASYNC_MAX_JOBS', '200'))
+# Threads for the blocking calls made by jobs (Firestore, Storage, text extraction)
+ASYNC_IO_THREADS = int(os.getenv('ASYNC_IO_THREADS', '32'))
+# Finished jobs can be polled for this long
+JOB_TTL_SECONDS = int(os.getenv('JOB_TTL_SECONDS', str(24 * 3600)))
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+
+class JobError(Exception):
+    """Raised by a job to finish with an error response (e.g. 404 for a missing document)"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def wants_async(request):
+    """True if the client asked for a job instead of waiting for the result (Prefer: respond-async)"""
+    for preference in request.headers.get('Prefer', '').split(','):
+        if preference.split(';', 1)[0].strip().lower() == 'respond-async':
+            return True
+    return False
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call on the job loop's thread pool and await its result"""
+    loop = asyncio.get_running_loop()
+    # Carry the job's context (e.g. the request id its log lines are tagged with) into the pool thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, fn, *args, **kwargs))
+
+
+class JobRunner:
+    """
+    Run coroutine jobs on a dedicated event loop thread and record their results.
+
+    A job is a coroutine function returning (body, status_code); body must be
+    JSON-serializable. submit() returns the job id at once, and get() returns
+    the job's status and, once it has finished, its result.
+    """
+
+    def __init__(self, db, max_jobs=ASYNC_MAX_JOBS, io_threads=ASYNC_IO_THREADS, ttl=JOB_TTL_SECONDS):
+        self.db = db
+        self.max_jobs = max_jobs
+        self.io_threads = io_threads
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        # Only touched on the loop thread
+        self._semaphore = None
+        self._tasks = set()
+
+    def _job_ref(self, job_id):
+        return self.db.collection(JOBS_COLLECTION).document(job_id)
+
+    def _get_loop(self):
+        """Start the loop thread on first use"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._executor = ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix='job-io')
+                loop.set_default_executor(self._executor)
+                self._thread = threading.Thread(target=loop.run_forever, name='job-loop', daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, job_type, job, *args, file_id=None):
+        """Record a pending job and schedule job(*args) on the loop; returns the job id"""
+        job_id = uuid.uuid4().hex
+        self._job_ref(job_id).set({
+            'type': job_type,
+            'fileId': file_id,
+            'status': JOB_PENDING,
+            'createdAt': firestore.SERVER_TIMESTAMP,
+            # Datetime so a Firestore TTL policy on expiresAt can delete old jobs
+            'expiresAt': datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        })
+        # Start the job in a fresh context: the submitting thread's context holds the
+        # Flask request context, which must not outlive the request. Only the request
+        # id is carried over, so the job's log lines stay correlated with the request.
+        context = contextvars.Context()
+        request_id = get_request_id()
+        if request_id:
+            context.run(bind_request_id, request_id)
+        self._get_loop().call_soon_threadsafe(self._start, job_id, job, args, context=context)
+        return job_id
+
+    def _start(self, job_id, job, args):
+        # Runs on the loop thread inside the job's context; the task copies it
+        asyncio.ensure_future(self._run(job_id, job, args))
+
+    async def _update(self, job_id, fields):
+        try:
+            await run_blocking(self._job_ref(job_id).update, fields)
+        except Exception as e:
+            logger.error("Error updating job %s: %s", job_id, e)
+
+    async def _run(self, job_id, job, args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_jobs)
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            async with self._semaphore:
+                await self._update(job_id, {'status': JOB_RUNNING, 'startedAt': firestore.SERVER_TIMESTAMP})
+                try:
+                    body, status_code = await job(*args)
+                except JobError as e:
+                    body, status_code = {"success": False, "error": str(e)}, e.status_code
+                except asyncio.CancelledError:
+                    await self._update(job_id, {
+                        'status': JOB_FAILED,
+                        'statusCode': 503,
+                        'result': json.dumps({"success": False, "error": "The server shut down before the job finished"}),
+                        'finishedAt': firestore.SERVER_TIMESTAMP
+                    })
+                    raise
+                except Exception as e:
+                    logger.exception("Job %s failed: %s", job_id, e)
+                    body, status_code = {"success": False, "error": str(e)}, 500
+
+                await self._update(job_id, {
+                    'status': JOB_SUCCEEDED if status_code < 400 else JOB_FAILED,
+                    'statusCode': status_code,
+                    # Stored as JSON text: results may contain nested lists, which Firestore cannot hold
+                    'result': json.dumps(body),
+                    'finishedAt': firestore.SERVER_TIMESTAMP
+                })
+        finally:
+            self._tasks.discard(task)
+
+    def get(self, job_id):
+        """Return the job's state (with the parsed result once finished), or None if there is no such job"""
+        doc = self._job_ref(job_id).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        expires_at = data.get('expiresAt')
+        if expires_at is not None and expires_at <= datetime.now(timezone.utc):
+            return None
+        job = {
+            'jobId': job_id,
+            'type': data.get('type'),
+            'fileId': data.get('fileId'),
+            'status': data.get('status'),
+            'createdAt': data.get('createdAt'),
+            'finishedAt': data.get('finishedAt')
+        }
+        if data.get('result') is not None:
+            job['statusCode'] = data.get('statusCode')
+            job['result'] = json.loads(data['result'])
+        return job
+
+    def stats(self):
+        """Jobs currently scheduled on this worker's loop"""
+        return {'inFlight': len(self._tasks), 'maxConcurrent': self.max_jobs}
+
+    def close(self, wait=True, timeout=None):
+        """
+        Stop the loop. With wait=True running jobs get up to timeout seconds to finish;
+        jobs still running after that are cancelled and marked failed.
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, executor = self._thread, self._executor
+        if loop is None:
+            return
+
+        async def drain():
+            tasks = set(self._tasks)
+            if tasks and wait:
+                _, tasks = await asyncio.wait(tasks, timeout=timeout)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(drain(), loop).result()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+            executor.shutdown(wait=wait)
@@ -0,0 +1,114 @@
+"""
+Benchmark the synchronous and the async (job) path of a generation route.
+
+For each concurrency level, sends --requests generations for one file through
+the synchronous route and then through the async path (the same request with
+``Prefer: respond-async``, then polling /api/jobs/<id> until the job has
+finished). Reports completed generations per second and end-to-end latency
+for both paths.
+
+The comparison is most telling against a single small worker, where the
+synchronous path is limited by the worker's threads:
+
+    WEB_CONCURRENCY=1 GUNICORN_THREADS=8 gunicorn -c gunicorn.conf.py wsgi:app
+    python bench_async.py --base-url http://localhost:5000 --file-id <id> \\
+        --route generate-summary --concurrency 8,32,64 --requests 64
+
+Every request is a real generation: it calls OpenAI and overwrites the
+file's stored content.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+import urllib.error
+import urllib.request
+
+from load_test import percentile
+
+# Route name -> (method, path, JSON body)
+ROUTES = {
+    'generate-summary': ('POST', '/api/files/{file_id}/generate-summary', {}),
+    'generate-quiz': ('POST', '/api/files/{file_id}/generate-quiz', {'quiz_type': 'multiple_choice'}),
+    'process-reading-writing': ('POST', '/api/files/{file_id}/process-reading-writing', {}),
+    'process-auditory': ('POST', '/api/files/{file_id}/process-auditory', {}),
+    'process-kinesthetic': ('POST', '/api/files/{file_id}/process-kinesthetic', {}),
+    'process-visual': ('POST', '/api/files/{file_id}/process-visual', {}),
+    'visual-concepts': ('GET', '/api/visual-concepts?fileId={file_id}', None),
+}
+
+
+def send(url, method='GET', body=None, headers=None, timeout=600):
+    """Send a request and return (status, parsed JSON body)"""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method,
+                                     headers={'Content-Type': 'application/json', **(headers or {})})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def run_sync(args, url, method, body):
+    """One generation through the synchronous route; returns (latency, ok)"""
+    start = time.perf_counter()
+    status, _ = send(url, method, body, timeout=args.timeout)
+    return time.perf_counter() - start, status < 400
+
+
+def run_async(args, url, method, body):
+    """One generation through the async path, polling until the job finishes; returns (latency, ok)"""
+    start = time.perf_counter()
+    status, accepted = send(url, method, body, headers={'Prefer': 'respond-async'}, timeout=args.timeout)
+    if status != 202:
+        return time.perf_counter() - start, False
+    while time.perf_counter() - start < args.timeout:
+        time.sleep(args.poll_interval)
+        status, job = send(accepted['statusUrl'], timeout=args.timeout)
+        if status != 200:
+            return time.perf_counter() - start, False
+        if 'result' in job:
+            return time.perf_counter() - start, job['statusCode'] < 400
+    return time.perf_counter() - start, False
+
+
+def measure(args, run, url, method, body, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: run(args, url, method, body), range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        'throughput': len(results) / elapsed,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'errors': sum(1 for _, ok in results if not ok),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sync and async throughput of a generation route")
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--file-id', required=True, help="Uploaded file to generate content for")
+    parser.add_argument('--route', choices=sorted(ROUTES), default='generate-summary')
+    parser.add_argument('--concurrency', default='8,32,64', help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=64, help="Generations per path and concurrency level")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between job status polls")
+    parser.add_argument('--timeout', type=float, default=600, help="Per-generation timeout in seconds")
+    args = parser.parse_args()
+
+    method, path, body = ROUTES[args.route]
+    url = args.base_url.rstrip('/') + path.format(file_id=args.file_id)
+
+    print(f"{'clients':>8} {'path':>6} {'gen/s':>8} {'p50 (s)':>8} {'p95 (s)':>8} {'errors':>7}")
+    for concurrency in [int(level) for level in args.concurrency.split(',')]:
+        for name, run in (('sync', run_sync), ('async', run_async)):
+            result = measure(args, run, url, method, body, concurrency)
+            print(f"{concurrency:>8} {name:>6} {result['throughput']:>8.2f} {result['p50']:>8.2f} "
+                  f"{result['p95']:>8.2f} {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark for JSON serialization and response compression.
+
+For representative API payloads, compares Flask's JSON encoder with the
+orjson-based serializer in fast_json, and reports the bytes on the wire
+uncompressed, gzipped and brotli-compressed (if brotli is installed).
+
+Usage:
+    python bench_json.py --rounds 200
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+import gzip
+import time
+
+from flask import Flask, json as flask_json
+
+import fast_json
+
+
+def make_study_guide():
+    sections = []
+    for i in range(12):
+        sections.append(
+            f"## Part {i + 1}\n\n### Understanding concept {i + 1}\n"
+            "This paragraph explains the concept in detail so the payload has realistic text. " * 4
+            + "\n* First key feature\n* Second key feature\n1. First step\n2. Second step\n"
+        )
+    return {
+        "success": True,
+        "content": {
+            "title": "Reading/Writing Learning Materials",
+            "description": "Study guide with key concepts, definitions and examples.",
+            "elements": [{"type": "text", "content": "# Study Guide\n\n" + "\n".join(sections),
+                          "caption": "Study Guide"}],
+            "docxUrl": "https://storage.googleapis.com/bucket/study_guides/user/file/reading_writing.docx",
+            "pdfUrl": "https://storage.googleapis.com/bucket/study_guides/user/file/reading_writing.pdf",
+        }
+    }
+
+
+def make_quiz():
+    return {
+        "success": True,
+        "questions": [
+            {
+                "question": f"Which statement best describes concept {i}?",
+                "options": [f"Option {c} for concept {i} with some explanatory text" for c in "ABCD"],
+                "correctAnswer": 1,
+                "explanation": "The correct option restates the definition given in the material. " * 2,
+            }
+            for i in range(20)
+        ]
+    }
+
+
+def make_file_list():
+    now = datetime.now(timezone.utc)
+    return {
+        "success": True,
+        "files": [
+            {
+                "id": f"file{i:04d}",
+                "name": f"Lecture {i} - Introduction to Machine Learning.pdf",
+                "type": "application/pdf",
+                "size": 1048576 + i,
+                "storagePath": f"users/uid/files/file{i:04d}.pdf",
+                "downloadUrl": f"https://storage.googleapis.com/bucket/users/uid/files/file{i:04d}.pdf",
+                "userId": "uid",
+                "learningStyle": "visual",
+                "status": "uploaded",
+                "processed": i % 2 == 0,
+                "createdAt": now - timedelta(days=i),
+                "readingWritingGeneratedAt": now - timedelta(days=i, hours=1),
+            }
+            for i in range(100)
+        ],
+        "nextCursor": "file0099",
+        "source": "firebase"
+    }
+
+
+def make_weekly_stats():
+    start = datetime.now(timezone.utc) - timedelta(weeks=12)
+    return {
+        "success": True,
+        "weeklyStats": [
+            {
+                "weekStart": start + timedelta(weeks=w),
+                "totalMinutes": 300 + w,
+                "days": {day: {"minutes": 40 + w, "sessions": 3} for day in
+                         ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]},
+            }
+            for w in range(12)
+        ]
+    }
+
+
+PAYLOADS = {
+    'study_guide': make_study_guide,
+    'quiz': make_quiz,
+    'file_list': make_file_list,
+    'weekly_stats': make_weekly_stats,
+}
+
+
+def best_time(fn, rounds):
+    """Best-of-5 mean seconds per call over rounds calls"""
+    best = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        best = min(best, (time.perf_counter() - start) / rounds)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON serialization and compression of API payloads")
+    parser.add_argument('--rounds', type=int, default=200, help="Serializations per measurement")
+    args = parser.parse_args()
+
+    if fast_json.orjson is None:
+        raise SystemExit("orjson is not installed; pip install orjson")
+
+    app = Flask(__name__)
+    print(f"{'payload':<14} {'flask (us)':>11} {'orjson (us)':>12} {'speedup':>8} "
+          f"{'raw (B)':>9} {'gzip (B)':>9} {'br (B)':>9}")
+    with app.app_context():
+        for name, make_payload in PAYLOADS.items():
+            payload = make_payload()
+            body = fast_json.dumps(payload)
+
+            flask_time = best_time(lambda: flask_json.dumps(payload), args.rounds)
+            orjson_time = best_time(lambda: fast_json.dumps(payload), args.rounds)
+
+            gzip_size = len(gzip.compress(body, compresslevel=fast_json.GZIP_LEVEL))
+            br_size = len(fast_json.compress(body, 'br')) if fast_json.brotli is not None else None
+
+            print(f"{name:<14} {flask_time * 1e6:>11.1f} {orjson_time * 1e6:>12.1f} "
+                  f"{flask_time / orjson_time:>7.1f}x {len(body):>9} {gzip_size:>9} "
+                  f"{br_size if br_size is not None else '-':>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark for study guide rendering.
+
+Renders a batch of synthetic study guides per format: once rebuilding
+the DOCX template / PDF styles for every render (the previous behaviour) and
+once with the prebuilt per-process templates, then prints the per-render
+savings.
+
+Usage:
+    python bench_study_guides.py --guides 50 --sections 8
+"""
+import argparse
+import time
+
+from study_guides import (get_docx_template_bytes, get_pdf_styles, parse_study_guide,
+                          render_docx_study_guide, render_pdf_study_guide)
+
+
+def make_study_guide_markdown(index, sections):
+    """Build a study guide with the same shape as the generated reading/writing content"""
+    parts = [f"# Document Study Guide {index}\n\n## Overview\n\nOverview of document {index}.\n"]
+    for section in range(sections):
+        parts.append(
+            f"\n## Part {section + 1}\n\n"
+            f"### Understanding concept {section + 1}\n"
+            "This paragraph explains the concept in detail so the rendered page has realistic text.\n"
+            "* First key feature of the concept\n"
+            "* Second key feature of the concept\n"
+            "- Third key feature of the concept\n\n"
+            "1. First step of the process\n"
+            "2. Second step of the process\n"
+        )
+    parts.append("\n## Study Tips\n\n* Review each section\n* Explain concepts in your own words")
+    return ''.join(parts)
+
+
+def clear_templates():
+    """Drop the prebuilt templates so the next render rebuilds them"""
+    get_docx_template_bytes.cache_clear()
+    get_pdf_styles.cache_clear()
+
+
+def time_batch(render, study_guides, rebuild_templates):
+    """Render every study guide and return the mean seconds per render"""
+    start = time.perf_counter()
+    for study_guide in study_guides:
+        if rebuild_templates:
+            clear_templates()
+        render(study_guide)
+    return (time.perf_counter() - start) / len(study_guides)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark study guide rendering with and without prebuilt templates")
+    parser.add_argument('--guides', type=int, default=50, help="Number of study guides in the batch")
+    parser.add_argument('--sections', type=int, default=8, help="Sections per study guide")
+    parser.add_argument('--rounds', type=int, default=3, help="Rounds per measurement; the fastest round is reported")
+    args = parser.parse_args()
+
+    study_guides = [parse_study_guide(make_study_guide_markdown(i, args.sections)) for i in range(args.guides)]
+
+    # Warm up imports so they are not attributed to the first measurement
+    render_docx_study_guide(study_guides[0])
+    render_pdf_study_guide(study_guides[0])
+
+    print(f"Rendering {args.guides} study guides with {args.sections} sections each\n")
+    print(f"{'format':<8} {'rebuilt (ms)':>14} {'prebuilt (ms)':>14} {'saved (ms)':>12} {'saved (%)':>10}")
+    for name, render in [('docx', render_docx_study_guide), ('pdf', render_pdf_study_guide)]:
+        rebuilt = min(time_batch(render, study_guides, rebuild_templates=True) for _ in range(args.rounds))
+        clear_templates()
+        prebuilt = min(time_batch(render, study_guides, rebuild_templates=False) for _ in range(args.rounds))
+        saved = rebuilt - prebuilt
+        print(f"{name:<8} {rebuilt * 1000:>14.2f} {prebuilt * 1000:>14.2f} "
+              f"{saved * 1000:>12.2f} {saved / rebuilt * 100:>9.1f}%")
+
+
+if __name__ == '__main__':
+    main()
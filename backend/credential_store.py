@@ -0,0 +1,217 @@
+"""
+Encrypted, versioned store for per-user Google credentials and settings.
+
+Records are JSON objects encrypted with Fernet and kept in a small SQLite
+database (WAL mode), so every worker process on a host shares them without
+unpickling anything. Each record carries a version number. save() can be
+made a compare-and-set on that version, which lets concurrent token
+refreshes detect that another process already wrote newer credentials.
+Decrypted records are kept in an in-memory cache for
+CREDENTIAL_CACHE_SECONDS, so repeated loads do not touch the database.
+
+The backend can be replaced: register_credential_store() maps a name to a
+factory, and CREDENTIAL_STORE_BACKEND selects which one
+get_credential_store() builds.
+"""
+import abc
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CREDENTIAL_STORE_BACKEND = os.getenv('CREDENTIAL_STORE_BACKEND', 'sqlite')
+CREDENTIAL_STORE_PATH = os.getenv('CREDENTIAL_STORE_PATH', os.path.join('user_tokens', 'credentials.db'))
+CREDENTIAL_CACHE_SECONDS = float(os.getenv('CREDENTIAL_CACHE_SECONDS', '30'))
+
+
+class CredentialStore(abc.ABC):
+    """Interface of a credential store; records are JSON-serializable dicts"""
+
+    @abc.abstractmethod
+    def load(self, key):
+        """Return (record, version) for key, or (None, 0) if there is none"""
+
+    @abc.abstractmethod
+    def save(self, key, record, expected_version=None):
+        """
+        Store record under key and return its new version.
+        If expected_version is given and the stored version differs, nothing is
+        written and None is returned.
+        """
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """Remove the record stored under key, if there is one"""
+
+
+def load_encryption_key(key_path):
+    """
+    Return the Fernet key from CREDENTIAL_STORE_KEY, or from key_path. If neither
+    exists, generate a key and save it to key_path (readable by the owner only).
+    """
+    env_key = os.getenv('CREDENTIAL_STORE_KEY')
+    if env_key:
+        return env_key.encode()
+
+    from cryptography.fernet import Fernet
+    key = _read_key_file(key_path)
+    if key:
+        return key
+
+    # A key stored next to the database adds little protection; production should set CREDENTIAL_STORE_KEY
+    # (gunicorn sets SERVER_SOFTWARE in every worker)
+    log = logger.error if 'gunicorn' in os.getenv('SERVER_SOFTWARE', '') else logger.warning
+    log("CREDENTIAL_STORE_KEY not set; using a local key at %s next to the credential database", key_path)
+
+    # Write the key to a temp file and hard-link it into place: the link either
+    # publishes a complete key file or fails because another process won the race
+    directory = os.path.dirname(key_path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.credential-key-')
+    try:
+        os.chmod(temp_path, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(Fernet.generate_key())
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(temp_path, key_path)
+        except FileExistsError:
+            pass
+    finally:
+        os.unlink(temp_path)
+    return _read_key_file(key_path)
+
+
+def _read_key_file(key_path):
+    """Key stored at key_path, or None if there is none"""
+    try:
+        with open(key_path, 'rb') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class SQLiteCredentialStore(CredentialStore):
+    """Fernet-encrypted records in a SQLite file with an in-memory read cache"""
+
+    def __init__(self, path=CREDENTIAL_STORE_PATH, encryption_key=None, cache_seconds=CREDENTIAL_CACHE_SECONDS):
+        from cryptography.fernet import Fernet
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.cache_seconds = cache_seconds
+        self._fernet = Fernet(encryption_key or load_encryption_key(f"{path}.key"))
+        self._cache = {}  # key -> (record, version, cached_at)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS credentials ("
+                "key TEXT PRIMARY KEY, version INTEGER NOT NULL, payload BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        """One connection per thread; sqlite3 connections must not be shared across threads"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    def _cache_put(self, key, record, version):
+        with self._lock:
+            self._cache[key] = (record, version, time.monotonic())
+
+    def load(self, key):
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[2] < self.cache_seconds:
+            return cached[0], cached[1]
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload, version FROM credentials WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, 0
+
+        record = json.loads(self._fernet.decrypt(row[0]))
+        self._cache_put(key, record, row[1])
+        return record, row[1]
+
+    def save(self, key, record, expected_version=None):
+        payload = self._fernet.encrypt(json.dumps(record, separators=(',', ':')).encode('utf-8'))
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock up front so the version check and write are atomic
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT version FROM credentials WHERE key = ?", (key,)).fetchone()
+            current_version = row[0] if row else 0
+            if expected_version is not None and current_version != expected_version:
+                conn.execute("ROLLBACK")
+                with self._lock:
+                    self._cache.pop(key, None)
+                return None
+            version = current_version + 1
+            conn.execute(
+                "INSERT INTO credentials (key, version, payload, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET version = excluded.version, payload = excluded.payload, "
+                "updated_at = excluded.updated_at",
+                (key, version, payload, time.time())
+            )
+            conn.execute("COMMIT")
+        self._cache_put(key, record, version)
+        return version
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM credentials WHERE key = ?", (key,))
+        with self._lock:
+            self._cache.pop(key, None)
+
+
+class _Transaction:
+    """Context manager that rolls back an open transaction if the block raises"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+_store_factories = {
+    'sqlite': SQLiteCredentialStore,
+}
+_store = None
+_store_lock = threading.Lock()
+
+
+def register_credential_store(name, factory):
+    """Make a credential store backend available to CREDENTIAL_STORE_BACKEND"""
+    _store_factories[name] = factory
+
+
+def get_credential_store():
+    """Return the process-wide credential store, creating it on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            factory = _store_factories.get(CREDENTIAL_STORE_BACKEND)
+            if factory is None:
+                raise ValueError(f"Unknown CREDENTIAL_STORE_BACKEND: {CREDENTIAL_STORE_BACKEND}")
+            _store = factory()
+        return _store
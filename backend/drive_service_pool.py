@@ -0,0 +1,120 @@
+"""
+Bounded, expiring pool of GoogleDriveService instances.
+
+Building a GoogleDriveService reads the user's token and builds the Drive
+discovery client, so instances are reused across requests. The pool keeps
+at most DRIVE_SERVICE_POOL_SIZE of them in LRU order and drops entries that
+have been idle for DRIVE_SERVICE_IDLE_SECONDS. On every checkout, credentials
+that expire within DRIVE_TOKEN_REFRESH_MARGIN_SECONDS are refreshed ahead of
+time, so requests do not stall on an expired token.
+"""
+from collections import OrderedDict
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DRIVE_SERVICE_POOL_SIZE = int(os.getenv('DRIVE_SERVICE_POOL_SIZE', '256'))
+DRIVE_SERVICE_IDLE_SECONDS = int(os.getenv('DRIVE_SERVICE_IDLE_SECONDS', '3600'))
+DRIVE_TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv('DRIVE_TOKEN_REFRESH_MARGIN_SECONDS', '300'))
+
+
+class DriveServicePool:
+    """Thread-safe LRU/TTL pool of Drive services keyed by user email (or 'default')"""
+
+    def __init__(self, max_size=DRIVE_SERVICE_POOL_SIZE, idle_seconds=DRIVE_SERVICE_IDLE_SECONDS,
+                 refresh_margin=DRIVE_TOKEN_REFRESH_MARGIN_SECONDS):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.refresh_margin = refresh_margin
+        self._services = OrderedDict()  # key -> (service, last_used)
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'refreshes': 0,
+                          'refresh_failures': 0}
+
+    def _count(self, name):
+        # Callers hold self._lock
+        self._counters[name] += 1
+
+    def _expire(self, now):
+        """Drop idle entries (callers hold self._lock); entries are in LRU order"""
+        while self._services:
+            key, (_, last_used) = next(iter(self._services.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            del self._services[key]
+            self._count('expirations')
+
+    def _refresh_if_needed(self, service):
+        if service.refresh_credentials_if_needed(self.refresh_margin):
+            with self._lock:
+                self._count('refreshes')
+
+    def peek(self, key):
+        """Return the pooled service for key without creating one (None if absent)"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._services.get(key)
+            if entry is None:
+                return None
+            self._services[key] = (entry[0], now)
+            self._services.move_to_end(key)
+            return entry[0]
+
+    def get(self, key, factory):
+        """Return the pooled service for key, creating it with factory() on a miss"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._services.get(key)
+            if entry is not None:
+                self._count('hits')
+                self._services[key] = (entry[0], now)
+                self._services.move_to_end(key)
+            else:
+                self._count('misses')
+
+        if entry is not None:
+            service = entry[0]
+            try:
+                self._refresh_if_needed(service)
+            except Exception as e:
+                logger.error("Error refreshing Drive credentials for %s: %s", key, e)
+                with self._lock:
+                    self._count('refresh_failures')
+            return service
+
+        # Build outside the lock; it reads the token and builds the API client
+        service = factory()
+        return self.put(key, service)
+
+    def put(self, key, service):
+        """Add (or replace) the service for key and return it"""
+        with self._lock:
+            self._services[key] = (service, time.time())
+            self._services.move_to_end(key)
+            while len(self._services) > self.max_size:
+                self._services.popitem(last=False)
+                self._count('evictions')
+        return service
+
+    def pop(self, key):
+        """Remove the service for key (e.g. on logout)"""
+        with self._lock:
+            entry = self._services.pop(key, None)
+        return entry[0] if entry else None
+
+    def stats(self):
+        """Pool size and hit/miss/eviction counters"""
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                'size': len(self._services),
+                'max_size': self.max_size,
+                'idle_seconds': self.idle_seconds,
+                **self._counters,
+                'hit_rate': round(self._counters['hits'] / lookups, 4) if lookups else None
+            }
@@ -0,0 +1,127 @@
+"""
+Fast JSON responses and negotiated response compression.
+
+jsonify() is a drop-in replacement for flask.jsonify that serializes with
+orjson when it is installed (falling back to Flask's encoder otherwise). The
+output matches Flask's: keys are sorted when JSON_SORT_KEYS is set,
+datetimes and dates (including Firestore's DatetimeWithNanoseconds) become
+HTTP dates, and UUIDs become strings.
+
+init_compression() registers an after_request hook. It compresses text and
+JSON responses of at least COMPRESSION_MIN_BYTES with brotli (when the
+package is installed) or gzip, depending on the client's Accept-Encoding.
+"""
+from datetime import date, datetime
+import dataclasses
+import gzip
+import os
+import uuid
+
+from flask import current_app, jsonify as flask_jsonify, request
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+# Brotli quality 4-5 compresses better than gzip -6 at a similar speed; 11 is only for static assets
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'image/svg+xml', 'text/html',
+    'text/plain', 'text/css', 'text/csv', 'text/markdown',
+}
+
+
+def _default(value):
+    """Serialize the types Flask's JSON encoder supports and orjson doesn't (or does differently)"""
+    if isinstance(value, (datetime, date)):
+        return http_date(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data, sort_keys=True):
+    """Serialize data to JSON bytes the way jsonify does"""
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        options |= orjson.OPT_SORT_KEYS
+    return orjson.dumps(data, default=_default, option=options)
+
+
+def jsonify(*args, **kwargs):
+    """Like flask.jsonify, serialized with orjson"""
+    if orjson is None:
+        return flask_jsonify(*args, **kwargs)
+
+    if args and kwargs:
+        raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+    if len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+
+    body = dumps(data, sort_keys=current_app.config.get('JSON_SORT_KEYS', True))
+    return current_app.response_class(body + b'\n', mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
+def choose_encoding(accept_encodings):
+    """Pick the best content coding the client accepts (None for identity)"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response):
+    """Compress an eligible response according to the request's Accept-Encoding"""
+    response.vary.add('Accept-Encoding')
+
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_BYTES:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    # A strong ETag identifies the uncompressed bytes; the encoded variant only matches weakly.
+    # Views whose 304s must match use weak ETags from the start (see http_caching).
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """Register response compression on the Flask app"""
+    app.after_request(compress_response)
@@ -2,22 +2,88 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow, Flow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
+from io import BytesIO
 import os
+import json
 import pickle
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import hashlib
+import time
+from credential_store import get_credential_store
+from metrics import timed
+import logging
 
 # Load environment variables
 load_dotenv()
 
-# If modifying these scopes, delete the file token.pickle.
+logger = logging.getLogger(__name__)
+
+# If modifying these scopes, users have to sign in again.
 SCOPES = [
     'https://www.googleapis.com/auth/drive.file',
     'https://www.googleapis.com/auth/userinfo.email',
     'openid'
 ]
 
+# Fields returned for every file in listings
+FILE_FIELDS = 'id, name, mimeType, createdTime, properties'
+
+# Resumable upload chunk size (must be a multiple of 256 KiB) and download chunk size.
+# The client library defaults to 100 MiB chunks, which buffers most files whole in memory.
+DRIVE_UPLOAD_CHUNK_SIZE = int(os.getenv('DRIVE_UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+DRIVE_DOWNLOAD_CHUNK_SIZE = int(os.getenv('DRIVE_DOWNLOAD_CHUNK_SIZE', str(4 * 1024 * 1024)))
+
+# Maximum number of calls per Drive HTTP batch request (Drive API limit)
+DRIVE_BATCH_SIZE = 100
+
+# How long a folder listing is reused before Drive is asked again
+DRIVE_LISTING_CACHE_SECONDS = int(os.getenv('DRIVE_LISTING_CACHE_SECONDS', '60'))
+
+def credentials_to_record(creds):
+    """Serialize OAuth user credentials to a JSON-compatible dict."""
+    record = json.loads(creds.to_json())
+    record['expiry'] = creds.expiry.isoformat() if creds.expiry else None
+    return record
+
+def credentials_from_record(record):
+    """Rebuild OAuth user credentials from credentials_to_record output."""
+    creds = Credentials(
+        token=record.get('token'),
+        refresh_token=record.get('refresh_token'),
+        token_uri=record.get('token_uri'),
+        client_id=record.get('client_id'),
+        client_secret=record.get('client_secret'),
+        scopes=record.get('scopes')
+    )
+    if record.get('expiry'):
+        # google-auth compares expiry as a naive UTC datetime
+        creds.expiry = datetime.fromisoformat(record['expiry'].rstrip('Z')).replace(tzinfo=None)
+    return creds
+
+def user_store_key(user_email, kind):
+    """Credential store key of a per-user record ('token' or 'folder')."""
+    # Key on a hash of the email rather than the email itself
+    email_hash = hashlib.md5(user_email.encode()).hexdigest()
+    return f'{kind}:{email_hash}'
+
+def legacy_token_path(user_email):
+    """Path of the pickle file tokens were stored in before the credential store."""
+    email_hash = hashlib.md5(user_email.encode()).hexdigest()
+    return os.path.join('user_tokens', f'token_{email_hash}.pickle')
+
+def forget_credentials(user_email):
+    """
+    Delete a user's stored Drive token (on logout); the LearnLink folder id is kept.
+    Services in other processes notice on their next token refresh and log out too.
+    """
+    get_credential_store().delete(user_store_key(user_email, 'token'))
+    legacy_path = legacy_token_path(user_email)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
 class GoogleDriveService:
     def __init__(self, user_email=None):
         self.creds = None
@@ -30,29 +96,122 @@ class GoogleDriveService:
         
         # Print for debugging
         if not self.client_id or not self.client_secret or not self.redirect_uri:
-            print("WARNING: Missing Google Drive credentials in .env file")
-            print(f"GOOGLE_DRIVE_CLIENT_ID: {'Set' if self.client_id else 'Missing'}")
-            print(f"GOOGLE_DRIVE_CLIENT_SECRET: {'Set' if self.client_secret else 'Missing'}")
-            print(f"GOOGLE_DRIVE_REDIRECT_URI: {'Set' if self.redirect_uri else 'Missing'}")
+            logger.warning("Missing Google Drive credentials in .env file "
+                           "(GOOGLE_DRIVE_CLIENT_ID: %s, GOOGLE_DRIVE_CLIENT_SECRET: %s, GOOGLE_DRIVE_REDIRECT_URI: %s)",
+                           'Set' if self.client_id else 'Missing',
+                           'Set' if self.client_secret else 'Missing',
+                           'Set' if self.redirect_uri else 'Missing')
         
         self.folder_id = None
+        self._folder_checked = False  # whether a saved folder id has been checked against Drive
         self.user_email = user_email
+        self._listing_cache = {}  # (page_size, page_token) -> (fetched_at, result)
+        self._credentials_version = None  # version of the stored credentials self.creds came from
         self.initialize_service()
 
-    def _get_token_path(self):
-        """Get the token file path for the current user."""
+    def _store_key(self, kind):
+        """Credential store key of a per-user record ('token' or 'folder')."""
         if not self.user_email:
             return None
-        
-        # Create a hash of the email to use as filename
-        email_hash = hashlib.md5(self.user_email.encode()).hexdigest()
-        tokens_dir = 'user_tokens'
-        
-        # Create tokens directory if it doesn't exist
-        if not os.path.exists(tokens_dir):
-            os.makedirs(tokens_dir)
-            
-        return os.path.join(tokens_dir, f'token_{email_hash}.pickle')
+        return user_store_key(self.user_email, kind)
+
+    def _get_legacy_token_path(self):
+        """Path of the pickle file tokens were stored in before the credential store."""
+        return legacy_token_path(self.user_email)
+
+    def _load_credentials(self):
+        """Load the user's credentials from the credential store, migrating a legacy pickle once."""
+        store = get_credential_store()
+        key = self._store_key('token')
+        record, version = store.load(key)
+        if record is not None:
+            self._credentials_version = version
+            return credentials_from_record(record)
+
+        legacy_path = self._get_legacy_token_path()
+        if os.path.exists(legacy_path):
+            # One-time migration; the pickle is removed once its contents are in the store
+            with open(legacy_path, 'rb') as token:
+                creds = pickle.load(token)
+            self._credentials_version = store.save(key, credentials_to_record(creds))
+            os.remove(legacy_path)
+            logger.info("Migrated legacy token file %s to the credential store", legacy_path)
+            return creds
+        return None
+
+    def _save_credentials(self):
+        """
+        Persist the current credentials to the credential store.
+        If another process stored newer credentials since they were loaded, adopt those instead;
+        if it deleted them (the user logged out), drop ours too.
+        """
+        key = self._store_key('token')
+        if not key:
+            return
+        store = get_credential_store()
+        version = store.save(key, credentials_to_record(self.creds), expected_version=self._credentials_version)
+        if version is None:
+            record, version = store.load(key)
+            if record is None:
+                logger.info("Drive credentials for %s were removed by another process; treating as logged out",
+                            self._store_key('token'))
+                self.creds = None
+                self.service = None
+                self._credentials_version = 0
+                return
+            stored = credentials_from_record(record)
+            if stored.expiry and (not self.creds.expiry or stored.expiry > self.creds.expiry):
+                self.creds = stored
+                if self.service is not None:
+                    self.service = build('drive', 'v3', credentials=self.creds)
+            else:
+                version = store.save(key, credentials_to_record(self.creds))
+        self._credentials_version = version
+
+    def _load_folder_id(self):
+        """Load the LearnLink folder id stored next to the user's token."""
+        key = self._store_key('folder')
+        if not key:
+            return None
+        record, _ = get_credential_store().load(key)
+        return record.get('folder_id') if record else None
+
+    def _save_folder_id(self):
+        """Store the resolved LearnLink folder id next to the user's token."""
+        key = self._store_key('folder')
+        if not key:
+            return
+        try:
+            if self.folder_id:
+                get_credential_store().save(key, {'folder_id': self.folder_id})
+            else:
+                get_credential_store().delete(key)
+        except Exception as e:
+            logger.error("Error saving LearnLink folder id: %s", e)
+
+    def refresh_credentials_if_needed(self, margin_seconds=300):
+        """
+        Refresh the credentials if they are invalid or expire within margin_seconds.
+        Returns True if a refresh happened.
+        """
+        creds = self.creds
+        if not creds:
+            return False
+        expiry = getattr(creds, 'expiry', None)  # naive UTC datetime
+        if creds.valid and (expiry is None or expiry - datetime.utcnow() > timedelta(seconds=margin_seconds)):
+            return False
+        # User credentials can only be refreshed with a refresh token
+        if self.user_email and not getattr(creds, 'refresh_token', None):
+            return False
+
+        creds.refresh(Request())
+        self._save_credentials()
+        if self.creds is None:
+            # Logged out in another process while we were refreshing
+            return False
+        if self.service is None:
+            self.service = build('drive', 'v3', credentials=creds)
+        return True
 
     def is_authenticated(self):
         """Check if we have valid credentials."""
@@ -106,38 +265,31 @@ class GoogleDriveService:
             user_info = service.userinfo().get().execute()
             self.user_email = user_info['email']
             
-            # Save the credentials for this user
-            token_path = self._get_token_path()
-            if token_path:
-                with open(token_path, 'wb') as token:
-                    pickle.dump(self.creds, token)
+            # Save the credentials for this user (a fresh sign-in replaces whatever is stored)
+            self._credentials_version = None
+            self._save_credentials()
             
             # Initialize the Drive service
             self.service = build('drive', 'v3', credentials=self.creds)
             return self.user_email
             
         except Exception as e:
-            print(f"Error in OAuth callback: {str(e)}")
+            logger.error("Error in OAuth callback: %s", e)
             raise
 
+    @timed('drive_connect')
     def initialize_service(self):
         """Initialize the Google Drive service."""
         # If we have a user email, try to load their credentials
         if self.user_email:
-            token_path = self._get_token_path()
-            if token_path and os.path.exists(token_path):
-                with open(token_path, 'rb') as token:
-                    self.creds = pickle.load(token)
+            self.creds = self._load_credentials()
 
             # If there are no (valid) credentials available, let the user log in.
             if not self.creds or not self.creds.valid:
                 if self.creds and self.creds.expired and self.creds.refresh_token:
                     self.creds.refresh(Request())
                     # Save the refreshed credentials
-                    token_path = self._get_token_path()
-                    if token_path:
-                        with open(token_path, 'wb') as token:
-                            pickle.dump(self.creds, token)
+                    self._save_credentials()
         
         # For anonymous uploads (no user email), check for service account credentials
         else:
@@ -156,7 +308,7 @@ class GoogleDriveService:
                         flow = InstalledAppFlow.from_client_secrets_file(client_secrets_path, SCOPES)
                         self.creds = flow.run_local_server(port=0)
             except Exception as e:
-                print(f"Error initializing anonymous service: {e}")
+                logger.error("Error initializing anonymous service: %s", e)
                 # We'll proceed with self.creds as None, which will limit functionality
                 pass
         
@@ -164,6 +316,7 @@ class GoogleDriveService:
         if self.creds and self.creds.valid:
             self.service = build('drive', 'v3', credentials=self.creds)
 
+    @timed('drive_folder')
     def get_or_create_folder(self):
         """Get or create the LearnLink folder."""
         try:
@@ -179,6 +332,7 @@ class GoogleDriveService:
             if existing_folders:
                 # Use existing folder
                 self.folder_id = existing_folders[0]['id']
+                self._save_folder_id()
                 return {'success': True, 'folder_id': self.folder_id}
             else:
                 # Create new folder
@@ -193,38 +347,42 @@ class GoogleDriveService:
                 ).execute()
                 
                 self.folder_id = folder.get('id')
+                self._save_folder_id()
                 return {'success': True, 'folder_id': self.folder_id}
                 
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-    def upload_file(self, file_path, file_name=None, learning_style=None):
-        """Upload a file to the LearnLink folder in Google Drive with learning style metadata."""
+    @timed('drive_upload')
+    def upload_stream(self, stream, file_name, mime_type=None, learning_style=None):
+        """
+        Upload a seekable file-like object (e.g. an upload from the request) to the
+        LearnLink folder with learning style metadata, in resumable chunks.
+        """
         try:
-            # Ensure we have a folder
-            if not self.folder_id:
-                folder_result = self.get_or_create_folder()
-                if not folder_result['success']:
-                    return folder_result
-
-            if not file_name:
-                file_name = os.path.basename(file_path)
-
-            file_metadata = {
-                'name': file_name,
-                'parents': [self.folder_id],  # Add to LearnLink folder
-                'properties': {
-                    'learning_style': learning_style or 'visual',
+            def create_request(folder_id):
+                file_metadata = {
+                    'name': file_name,
+                    'parents': [folder_id],  # Add to LearnLink folder
+                    'properties': {
+                        'learning_style': learning_style or 'visual',
+                    }
                 }
-            }
-            
-            media = MediaFileUpload(file_path, resumable=True)
+                stream.seek(0)
+                media = MediaIoBaseUpload(
+                    stream,
+                    mimetype=mime_type or 'application/octet-stream',
+                    chunksize=DRIVE_UPLOAD_CHUNK_SIZE,
+                    resumable=True
+                )
+                return self.service.files().create(
+                    body=file_metadata,
+                    media_body=media,
+                    fields='id, properties'
+                )
             
-            file = self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id, properties'
-            ).execute()
+            file = self._execute_in_folder(create_request)
+            self.invalidate_listing()
             
             return {
                 'success': True, 
@@ -234,88 +392,230 @@ class GoogleDriveService:
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
+    def upload_file(self, file_path, file_name=None, learning_style=None):
+        """Upload a file to the LearnLink folder in Google Drive with learning style metadata."""
+        if not file_name:
+            file_name = os.path.basename(file_path)
+        try:
+            with open(file_path, 'rb') as f:
+                return self.upload_stream(f, file_name, learning_style=learning_style)
+        except OSError as e:
+            return {'success': False, 'error': str(e)}
+
+    @timed('drive_download')
+    def iter_download(self, file_id, chunk_size=DRIVE_DOWNLOAD_CHUNK_SIZE):
+        """Download a file from Google Drive, yielding it in chunks as they arrive."""
+        request = self.service.files().get_media(fileId=file_id)
+        buffer = BytesIO()
+        downloader = MediaIoBaseDownload(buffer, request, chunksize=chunk_size)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk()
+            chunk = buffer.getvalue()
+            if chunk:
+                yield chunk
+            buffer.seek(0)
+            buffer.truncate()
+
     def download_file(self, file_id, output_path):
         """Download a file from Google Drive."""
         try:
-            request = self.service.files().get_media(fileId=file_id)
             with open(output_path, 'wb') as f:
-                downloader = MediaIoBaseDownload(f, request)
-                done = False
-                while done is False:
-                    status, done = downloader.next_chunk()
+                for chunk in self.iter_download(file_id):
+                    f.write(chunk)
             return {'success': True}
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-    def list_files(self, page_size=10):
-        """List files in the LearnLink folder."""
+    def _ensure_folder(self):
+        """
+        Resolve the LearnLink folder id; returns an error result or None.
+        A saved id is checked once per service (a trashed folder still accepts
+        uploads and lists its files); after that it is trusted, and
+        _execute_in_folder re-resolves it if Drive reports it missing.
+        """
+        if not self.folder_id:
+            self.folder_id = self._load_folder_id()
+        if self.folder_id and not self._folder_checked and self._folder_in_trash():
+            logger.info("LearnLink folder %s is in the trash; resolving it again", self.folder_id)
+            self.folder_id = None
+            self._save_folder_id()
+            self.invalidate_listing()
+        if not self.folder_id:
+            folder_result = self.get_or_create_folder()
+            if not folder_result['success']:
+                return folder_result
+        self._folder_checked = True
+        return None
+
+    def _folder_in_trash(self):
+        """Whether the saved folder is trashed or gone (other errors leave it trusted)"""
         try:
-            # Ensure we have a folder
-            if not self.folder_id:
-                folder_result = self.get_or_create_folder()
-                if not folder_result['success']:
-                    return folder_result
+            folder = self.service.files().get(fileId=self.folder_id, fields='trashed').execute()
+        except HttpError as e:
+            if e.resp.status == 404:
+                return True
+            logger.warning("Could not check LearnLink folder %s: %s", self.folder_id, e)
+            return False
+        return bool(folder.get('trashed'))
 
-            # Query for files in the LearnLink folder
-            results = self.service.files().list(
+    def _execute_in_folder(self, make_request):
+        """
+        Execute make_request(folder_id) for the LearnLink folder. If the folder id
+        is stale (deleted folder), search for or create the folder again and retry once.
+        """
+        for attempt in range(2):
+            folder_error = self._ensure_folder()
+            if folder_error:
+                raise RuntimeError(folder_error['error'])
+            try:
+                return make_request(self.folder_id).execute()
+            except HttpError as e:
+                if attempt or e.resp.status != 404:
+                    raise
+                logger.info("LearnLink folder %s not found; resolving it again", self.folder_id)
+                self.folder_id = None
+                self._save_folder_id()
+                self.invalidate_listing()
+
+    def invalidate_listing(self):
+        """Drop cached folder listings (after an upload or delete)."""
+        self._listing_cache.clear()
+
+    @timed('drive_list')
+    def list_files_page(self, page_size=10, page_token=None):
+        """
+        List one page of files in the LearnLink folder.
+        The list call already returns properties, so no per-file requests are made.
+        """
+        try:
+            results = self._execute_in_folder(lambda folder_id: self.service.files().list(
                 pageSize=page_size,
-                q=f"'{self.folder_id}' in parents and trashed=false",
-                fields="nextPageToken, files(id, name, mimeType, createdTime, properties)",
+                pageToken=page_token,
+                q=f"'{folder_id}' in parents and trashed=false",
+                fields=f"nextPageToken, files({FILE_FIELDS})",
                 spaces='drive'
-            ).execute()
-            
-            # Verify each file still exists and is accessible
-            accessible_files = []
-            for file in results.get('files', []):
-                try:
-                    # Get full file metadata including properties
-                    file_data = self.service.files().get(
-                        fileId=file['id'],
-                        fields='id, name, mimeType, createdTime, properties'
-                    ).execute()
-                    
-                    # Add learning style to the file metadata
-                    if 'properties' not in file_data:
-                        file_data['properties'] = {'learning_style': 'visual'}
-                    elif 'learning_style' not in file_data['properties']:
-                        file_data['properties']['learning_style'] = 'visual'
-                    
-                    # Add file to accessible list
-                    accessible_files.append(file_data)
-                except Exception:
-                    continue
-                    
-            return {'success': True, 'files': accessible_files}
+            ))
+
+            files = results.get('files', [])
+            for file in files:
+                # Add learning style to the file metadata
+                file.setdefault('properties', {}).setdefault('learning_style', 'visual')
+
+            return {'success': True, 'files': files, 'nextPageToken': results.get('nextPageToken')}
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
+    def iter_files(self, page_size=100):
+        """Yield every file in the LearnLink folder, fetching further pages only as needed."""
+        page_token = None
+        while True:
+            result = self.list_files_page(page_size=page_size, page_token=page_token)
+            if not result['success']:
+                raise RuntimeError(result['error'])
+            yield from result['files']
+            page_token = result['nextPageToken']
+            if not page_token:
+                return
+
+    def list_files(self, page_size=10, page_token=None):
+        """List files in the LearnLink folder (cached briefly; invalidated on upload and delete)."""
+        key = (page_size, page_token)
+        cached = self._listing_cache.get(key)
+        if cached and time.time() - cached[0] < DRIVE_LISTING_CACHE_SECONDS:
+            return cached[1]
+
+        result = self.list_files_page(page_size=page_size, page_token=page_token)
+        if result['success']:
+            self._listing_cache[key] = (time.time(), result)
+        return result
+
+    @timed('drive_metadata')
     def get_file_metadata(self, file_id):
         """Get file metadata from Google Drive."""
         try:
             file = self.service.files().get(
                 fileId=file_id,
-                fields='id, name, mimeType'
+                fields='id, name, mimeType, size'
             ).execute()
             return {
                 'success': True,
                 'id': file.get('id'),
                 'name': file.get('name'),
-                'mimeType': file.get('mimeType')
+                'mimeType': file.get('mimeType'),
+                'size': file.get('size')
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
+    @timed('drive_delete')
     def delete_file(self, file_id):
         """Delete a file from Google Drive."""
         try:
-            # First check if the file exists and is accessible
-            try:
-                self.service.files().get(fileId=file_id).execute()
-            except Exception as e:
-                return {'success': False, 'error': 'File not found or not accessible'}
-
-            # If file exists, try to delete it
+            # A missing or inaccessible file is reported by the delete call itself
             self.service.files().delete(fileId=file_id).execute()
+            self.invalidate_listing()
             return {'success': True}
+        except HttpError as e:
+            if e.resp.status == 404:
+                return {'success': False, 'error': 'File not found or not accessible'}
+            return {'success': False, 'error': str(e)}
         except Exception as e:
-            return {'success': False, 'error': str(e)} 
\ No newline at end of file
+            return {'success': False, 'error': str(e)}
+
+    @timed('drive_batch')
+    def _execute_batch(self, requests):
+        """
+        Execute requests with the Drive HTTP batch endpoint, DRIVE_BATCH_SIZE per round trip.
+        Returns a list of (response, exception) tuples in the order of requests.
+        """
+        results = [None] * len(requests)
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        for start in range(0, len(requests), DRIVE_BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for index in range(start, min(start + DRIVE_BATCH_SIZE, len(requests))):
+                batch.add(requests[index], request_id=str(index))
+            batch.execute()
+        return results
+
+    def _batch_results(self, file_ids, requests, on_success):
+        """Run a batch and build one result dict per file id."""
+        results = []
+        for file_id, (response, exception) in zip(file_ids, self._execute_batch(requests)):
+            if exception is None:
+                results.append({'file_id': file_id, 'success': True, **on_success(response)})
+            elif isinstance(exception, HttpError) and exception.resp.status == 404:
+                results.append({'file_id': file_id, 'success': False, 'error': 'File not found or not accessible'})
+            else:
+                results.append({'file_id': file_id, 'success': False, 'error': str(exception)})
+        return results
+
+    def delete_files(self, file_ids):
+        """Delete several files in batched requests; returns a result per file."""
+        requests = [self.service.files().delete(fileId=file_id) for file_id in file_ids]
+        results = self._batch_results(file_ids, requests, lambda response: {})
+        self.invalidate_listing()
+        return results
+
+    def get_files_metadata(self, file_ids, fields=FILE_FIELDS):
+        """Fetch metadata for several files in batched requests; returns a result per file."""
+        requests = [self.service.files().get(fileId=file_id, fields=fields) for file_id in file_ids]
+        return self._batch_results(file_ids, requests, lambda response: {'file': response})
+
+    def update_files_properties(self, updates):
+        """
+        Update custom properties of several files in batched requests.
+        updates is a list of (file_id, properties) pairs; returns a result per file.
+        """
+        file_ids = [file_id for file_id, _ in updates]
+        requests = [
+            self.service.files().update(fileId=file_id, body={'properties': properties}, fields='id, properties')
+            for file_id, properties in updates
+        ]
+        results = self._batch_results(file_ids, requests,
+                                      lambda response: {'properties': response.get('properties', {})})
+        self.invalidate_listing()
+        return results
@@ -0,0 +1,93 @@
+"""
+Production server profile: gunicorn -c gunicorn.conf.py wsgi:app
+
+Pre-forked workers with a thread pool each (gthread). Most expensive routes
+spend their time waiting on OpenAI, Firebase Storage or SerpAPI, so
+threads — not processes — provide the concurrency. Processes are only added
+to use more CPU cores (PDF rendering, text extraction). See the "Production
+Server" section of the README for how to size WEB_CONCURRENCY and
+GUNICORN_THREADS with load_test.py.
+
+The app is imported in each worker after the fork (no preload_app): the
+Firebase/gRPC clients are not fork-safe, so each worker creates its own.
+"""
+import multiprocessing
+import os
+import signal
+import time
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Workers: one per core by default (each worker holds its own clients and,
+# if loaded, its own copy of the learning style model)
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+worker_class = 'gthread'
+# Threads per worker: concurrent I/O-bound requests each worker can serve
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+
+# OpenAI generations can take a minute or more; the worker is only killed
+# if it stops responding entirely for this long
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+# On SIGTERM/restart, in-flight requests get this long to finish
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '120'))
+# Part of graceful_timeout kept back for artifact uploads and render processes
+# after generation jobs have drained (see worker_exit)
+SHUTDOWN_RESERVE_SECONDS = 15
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth; jitter avoids restarting all at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+# Set GUNICORN_ACCESS_LOG to an empty string to turn the access log off
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+# Gunicorn's default format plus the request id the app logs with (X-Request-ID)
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(M)sms %({x-request-id}o)s'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    job_drain = float(os.getenv('JOB_DRAIN_SECONDS', '60'))
+    if job_drain + SHUTDOWN_RESERVE_SECONDS > graceful_timeout:
+        server.log.warning("JOB_DRAIN_SECONDS (%s) plus %ss for uploads exceeds GUNICORN_GRACEFUL_TIMEOUT (%s); "
+                           "jobs will only get the part of graceful_timeout left after in-flight requests",
+                           job_drain, SHUTDOWN_RESERVE_SECONDS, graceful_timeout)
+
+
+def post_worker_init(worker):
+    """Per-worker startup: Firebase is initialized by the app import; warm the remaining clients"""
+    from app import warm_up_worker
+    warm_up_worker()
+
+    # The master kills a worker graceful_timeout after sending SIGTERM; remember
+    # when that was so worker_exit only drains within the time that is left
+    handle_exit = worker.handle_exit
+
+    def note_shutdown(sig, frame):
+        if not hasattr(worker, 'shutdown_started'):
+            worker.shutdown_started = time.monotonic()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, note_shutdown)
+    worker.log.info("Worker %s ready", worker.pid)
+
+
+def worker_exit(server, worker):
+    """Drain background work (jobs, artifact uploads, render processes) before the worker exits"""
+    try:
+        from app import shutdown_background_work
+    except Exception:
+        # The app failed to import in this worker; nothing to drain
+        return
+    # In-flight requests have already used part of graceful_timeout (none if the
+    # worker is recycled by max_requests, which the master does not time)
+    started = getattr(worker, 'shutdown_started', None)
+    elapsed = time.monotonic() - started if started is not None else 0.0
+    job_drain = max(0.0, graceful_timeout - elapsed - SHUTDOWN_RESERVE_SECONDS)
+    shutdown_background_work(wait=True, job_drain_seconds=job_drain)
+    server.log.info("Worker %s drained background work", worker.pid)
+
+    # Write out log records still queued for the writer thread
+    from structured_logging import stop_logging
+    stop_logging()
@@ -0,0 +1,62 @@
+"""
+Conditional GET support for read-heavy JSON endpoints.
+
+cached_json() gives a view's GET/HEAD responses an ETag and a per-route
+Cache-Control header, and answers a matching If-None-Match with 304 Not
+Modified. Polling dashboards then get an empty response while nothing has
+changed. Other methods (e.g. the POST form of a route) pass through untouched.
+
+The ETags are weak (W/"..."): they identify the JSON payload, which may be
+sent brotli- or gzip-encoded (see fast_json), so a 200 of either encoding and
+the 304 for it carry the same validator.
+
+By default the ETag is a hash of the response body. A view that knows a
+cheaper version of its data (e.g. a Firestore document's update_time) can
+call not_modified(version_etag(...)) before building the payload. That
+also skips the serialization when the client is up to date.
+"""
+from functools import wraps
+import hashlib
+
+from flask import make_response, request
+
+# Methods whose responses can be validated and cached
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def version_etag(*parts):
+    """ETag value derived from version information (ids, update times, ...)"""
+    return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag, cache_control='private, no-cache'):
+    """Return a 304 response if the request's If-None-Match matches etag, else None"""
+    if request.method in SAFE_METHODS and request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = cache_control
+        return response
+    return None
+
+
+def cached_json(cache_control='private, no-cache'):
+    """
+    Decorator for views returning JSON: on GET/HEAD, set a weak ETag (payload hash unless
+    the view set one) and Cache-Control on 200 responses, and turn matching requests into 304s.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in SAFE_METHODS:
+                return view(*args, **kwargs)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            etag, _ = response.get_etag()
+            response.set_etag(etag or hashlib.sha256(response.get_data()).hexdigest(), weak=True)
+            response.headers['Cache-Control'] = cache_control
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,179 @@
+"""
+Cached, concurrent image lookups through SerpAPI.
+
+Searching for "<topic> diagram educational" returns the same image for the
+same topic, and popular topics (e.g. "Neural Network") come up for many
+users. Results are cached by normalized query with a TTL, first in process
+memory and then in the Firestore ``image_cache`` collection so every backend
+instance shares them. Topics with no image results are cached too (with a
+shorter TTL) so they are not searched again on every request. Lookups for
+several topics run concurrently with a bounded pool.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_COLLECTION = 'image_cache'
+IMAGE_CACHE_TTL_SECONDS = int(os.getenv('IMAGE_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+IMAGE_CACHE_MISS_TTL_SECONDS = int(os.getenv('IMAGE_CACHE_MISS_TTL_SECONDS', str(6 * 3600)))
+IMAGE_CACHE_MEMORY_SIZE = int(os.getenv('IMAGE_CACHE_MEMORY_SIZE', '1024'))
+IMAGE_LOOKUP_MAX_WORKERS = int(os.getenv('IMAGE_LOOKUP_MAX_WORKERS', '4'))
+
+
+def image_query(topic):
+    """The SerpAPI query used for a topic"""
+    return f"{topic} diagram educational"
+
+
+def image_cache_key(query):
+    """Cache key (and Firestore document ID) for a query; case and whitespace insensitive"""
+    normalized = ' '.join(query.lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class ImageLookupService:
+    """
+    Look up an image URL per topic with a two-level TTL cache.
+
+    lookup() returns the image URL, or None when the search has no image
+    results. Search errors are raised and never cached.
+    """
+
+    def __init__(self, api_key, search_class_getter, db=None,
+                 ttl=IMAGE_CACHE_TTL_SECONDS, miss_ttl=IMAGE_CACHE_MISS_TTL_SECONDS,
+                 memory_size=IMAGE_CACHE_MEMORY_SIZE, max_workers=IMAGE_LOOKUP_MAX_WORKERS):
+        self.api_key = api_key
+        self.search_class_getter = search_class_getter
+        self.db = db
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.memory_size = memory_size
+        self.max_workers = max_workers
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def available(self):
+        return bool(self.api_key) and self.search_class_getter() is not None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='image-lookup')
+            return self._pool
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return False, None
+            image_url, expires_at = entry
+            if expires_at <= time.time():
+                del self._memory[key]
+                return False, None
+            self._memory.move_to_end(key)
+            return True, image_url
+
+    def _memory_put(self, key, image_url, expires_at):
+        with self._lock:
+            self._memory[key] = (image_url, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _firestore_get(self, key):
+        if self.db is None:
+            return False, None, 0
+        try:
+            doc = self.db.collection(IMAGE_CACHE_COLLECTION).document(key).get()
+        except Exception as e:
+            logger.error("Error reading image cache: %s", e)
+            return False, None, 0
+        if not doc.exists:
+            return False, None, 0
+        data = doc.to_dict()
+        expires_at = data.get('expiresAt', 0)
+        if expires_at <= time.time():
+            return False, None, 0
+        return True, data.get('imageUrl'), expires_at
+
+    def _firestore_put(self, key, query, image_url, expires_at):
+        if self.db is None:
+            return
+        try:
+            self.db.collection(IMAGE_CACHE_COLLECTION).document(key).set({
+                'query': query,
+                'imageUrl': image_url,
+                'expiresAt': expires_at
+            })
+        except Exception as e:
+            logger.error("Error writing image cache: %s", e)
+
+    def _search(self, query):
+        GoogleSearch = self.search_class_getter()
+        if GoogleSearch is None:
+            raise RuntimeError("SerpAPI package not installed. Please run: pip install google-search-results")
+        results = GoogleSearch({
+            "q": query,
+            "tbm": "isch",  # image search
+            "num": 1,
+            "safe": "active",  # safe search
+            "api_key": self.api_key
+        }).get_dict()
+        if results.get("error") and not results.get("images_results"):
+            # "Google hasn't returned any results" is a miss; anything else is an error
+            if "hasn't returned any results" not in results["error"]:
+                raise RuntimeError(results["error"])
+        images = results.get("images_results")
+        return images[0]["original"] if images else None
+
+    def lookup(self, topic):
+        """Return the image URL for a topic (None if there is none), using the caches first"""
+        query = image_query(topic)
+        key = image_cache_key(query)
+
+        found, image_url = self._memory_get(key)
+        if found:
+            return image_url
+
+        found, image_url, expires_at = self._firestore_get(key)
+        if found:
+            self._memory_put(key, image_url, expires_at)
+            return image_url
+
+        image_url = self._search(query)
+        expires_at = time.time() + (self.ttl if image_url else self.miss_ttl)
+        self._memory_put(key, image_url, expires_at)
+        self._firestore_put(key, query, image_url, expires_at)
+        return image_url
+
+    def close(self, wait=True):
+        """Shut down the lookup pool (it is recreated on the next lookup_many)"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def lookup_many(self, topics, default=None):
+        """
+        Look up several topics concurrently.
+        Returns a list aligned with topics; misses and failed lookups get default.
+        """
+        def lookup_or_default(topic):
+            try:
+                image_url = self.lookup(topic)
+            except Exception as e:
+                logger.error("Error getting image for %s: %s", topic, e)
+                return default
+            return image_url if image_url else default
+
+        if len(topics) <= 1:
+            return [lookup_or_default(topic) for topic in topics]
+        return list(self._get_pool().map(lookup_or_default, topics))
@@ -0,0 +1,356 @@
+"""
+Central gateway for OpenAI chat completions.
+
+The generators send their completions through an LLMGateway instead of
+calling client.chat.completions.create directly:
+
+- Rate limits: token buckets for requests per minute and tokens per minute
+  keep a worker within its share of the account's limits, so bursts wait
+  briefly instead of failing with 429s. A call's tokens are estimated up
+  front (prompt characters / 4 + max_tokens) and reconciled with the usage
+  OpenAI reports.
+- Concurrency: at most max_concurrency completions are in flight at once.
+- Priority lanes: waiting calls are admitted interactive lane first, then
+  background, in arrival order within a lane. A quiz a user is waiting for
+  is not queued behind background generation jobs.
+- Retries: 429s (except exhausted quota), 5xx responses, timeouts and
+  connection errors are retried with jittered exponential backoff,
+  honouring Retry-After. A 429 also pauses admissions for every caller
+  until the backoff has passed. Every attempt has a timeout.
+- Metrics: stats() reports queue depth per lane, calls in flight, bucket
+  levels, and counters for calls, retries, failures and time spent queued.
+  Queue waits and calls are timed as the openai_queue and openai_chat spans,
+  and token usage and cost are recorded per model (see metrics.py).
+
+Limits apply per worker process, so set them to the account's limits divided
+by the number of processes (WEB_CONCURRENCY x instances). Sync callers use
+chat() and block their thread while queued. Coroutines on the job loop use
+achat() and wait without holding a thread.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+from metrics import span, record_openai_chat, record_openai_error
+
+logger = logging.getLogger(__name__)
+
+OPENAI_RPM_LIMIT = int(os.getenv('OPENAI_RPM_LIMIT', '500'))
+OPENAI_TPM_LIMIT = int(os.getenv('OPENAI_TPM_LIMIT', '160000'))
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '16'))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv('OPENAI_TIMEOUT_SECONDS', '120'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '4'))
+OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv('OPENAI_BACKOFF_BASE_SECONDS', '1'))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv('OPENAI_BACKOFF_MAX_SECONDS', '30'))
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BACKGROUND = 'background'
+# Lanes in admission order
+PRIORITY_LANES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+# Completion tokens assumed for requests that do not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+
+def estimate_tokens(request):
+    """Rough token count of a chat completion request: prompt characters / 4 plus the completion budget"""
+    prompt_chars = sum(len(message.get('content') or '') for message in request.get('messages', []))
+    return prompt_chars // 4 + request.get('max_tokens', DEFAULT_COMPLETION_TOKENS)
+
+
+class TokenBucket:
+    """Bucket refilled continuously at rate_per_minute and holding at most capacity tokens (not thread-safe)"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount tokens are available; amounts over capacity wait for a full bucket"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount, now):
+        """Remove tokens; the level may go negative (debt is repaid by the refill)"""
+        self._refill(now)
+        self.tokens -= amount
+
+    def give_back(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _Waiter:
+    __slots__ = ('tokens', 'lane', 'admit', 'queued_at', 'admitted', 'cancelled')
+
+    def __init__(self, tokens, lane, admit):
+        self.tokens = tokens
+        self.lane = lane
+        self.admit = admit
+        self.queued_at = time.monotonic()
+        self.admitted = False
+        self.cancelled = False
+
+
+class LLMGateway:
+    """
+    Rate-limited, prioritized, retrying access to chat completions.
+
+    client_getter and async_client_getter return the OpenAI and AsyncOpenAI
+    clients; the gateway disables their own retries and does its own.
+    """
+
+    def __init__(self, client_getter, async_client_getter=None,
+                 rpm=OPENAI_RPM_LIMIT, tpm=OPENAI_TPM_LIMIT, max_concurrency=OPENAI_MAX_CONCURRENCY,
+                 timeout=OPENAI_TIMEOUT_SECONDS, max_retries=OPENAI_MAX_RETRIES,
+                 backoff_base=OPENAI_BACKOFF_BASE_SECONDS, backoff_max=OPENAI_BACKOFF_MAX_SECONDS):
+        self.client_getter = client_getter
+        self.async_client_getter = async_client_getter
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # 0 disables a limit
+        self._requests = TokenBucket(rpm) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm) if tpm > 0 else None
+
+        self._condition = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._queued = {lane: 0 for lane in PRIORITY_LANES}
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._dispatcher = None
+        self._client = None
+        self._async_client = None
+        self._counters = {
+            'calls': 0,
+            'retries': 0,
+            'failures': 0,
+            'rateLimited': 0,
+            'queueWaitSeconds': 0.0,
+            'maxQueueWaitSeconds': 0.0,
+        }
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = self.client_getter().with_options(max_retries=0)
+        return self._client
+
+    def _get_async_client(self):
+        if self._async_client is None:
+            self._async_client = self.async_client_getter().with_options(max_retries=0)
+        return self._async_client
+
+    # Admission
+
+    def _admit_waiting(self):
+        """
+        Admit queued calls in priority order while capacity allows (lock held).
+        Returns the seconds until the next call could be admitted, or None to wait for a release.
+        """
+        while self._queue:
+            _, _, waiter = self._queue[0]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                self._queued[waiter.lane] -= 1
+                continue
+            if self._in_flight >= self.max_concurrency:
+                return None
+            now = time.monotonic()
+            wait = max(
+                self._paused_until - now,
+                self._requests.wait_time(1, now) if self._requests else 0.0,
+                self._tokens.wait_time(waiter.tokens, now) if self._tokens else 0.0,
+            )
+            if wait > 0:
+                return wait
+
+            heapq.heappop(self._queue)
+            self._queued[waiter.lane] -= 1
+            if self._requests:
+                self._requests.take(1, now)
+            if self._tokens:
+                self._tokens.take(waiter.tokens, now)
+            self._in_flight += 1
+            waited = now - waiter.queued_at
+            self._counters['queueWaitSeconds'] += waited
+            self._counters['maxQueueWaitSeconds'] = max(self._counters['maxQueueWaitSeconds'], waited)
+            waiter.admitted = True
+            waiter.admit()
+        return None
+
+    def _dispatch(self):
+        """Dispatcher thread: admit waiting calls as the buckets refill and slots free up"""
+        with self._condition:
+            while True:
+                self._condition.wait(timeout=self._admit_waiting())
+
+    def _enqueue(self, tokens, priority, admit):
+        lane = priority if priority in PRIORITY_LANES else PRIORITY_INTERACTIVE
+        waiter = _Waiter(tokens, lane, admit)
+        with self._condition:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='llm-gateway', daemon=True)
+                self._dispatcher.start()
+            heapq.heappush(self._queue, (PRIORITY_LANES.index(lane), next(self._sequence), waiter))
+            self._queued[lane] += 1
+            # Admit right away if there is capacity; otherwise the dispatcher takes over
+            self._admit_waiting()
+            self._condition.notify()
+        return waiter
+
+    def _release(self, estimate, response=None):
+        """Free the call's slot and correct the token bucket with the usage OpenAI reported"""
+        usage = getattr(response, 'usage', None)
+        with self._condition:
+            self._in_flight -= 1
+            if self._tokens and usage is not None and usage.total_tokens is not None:
+                self._tokens.give_back(estimate - usage.total_tokens)
+            self._condition.notify()
+
+    def _cancel(self, waiter, estimate):
+        """Withdraw a queued call, or free its slot if it was admitted meanwhile"""
+        with self._condition:
+            waiter.cancelled = True
+            admitted = waiter.admitted
+        if admitted:
+            self._release(estimate)
+
+    # Retries
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying after error, or None if it should not be retried"""
+        if attempt >= self.max_retries:
+            return None
+        import openai
+        if isinstance(error, openai.RateLimitError):
+            # An exhausted quota will not recover by retrying
+            if getattr(error, 'code', None) == 'insufficient_quota':
+                return None
+        elif isinstance(error, openai.APIStatusError):
+            if error.status_code < 500:
+                return None
+        elif not isinstance(error, openai.APIConnectionError):  # includes timeouts
+            return None
+
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        try:
+            delay = max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            pass  # an HTTP date; keep the backoff
+
+        if isinstance(error, openai.RateLimitError):
+            # Hold every caller back, not just this one
+            with self._condition:
+                self._counters['rateLimited'] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def _record(self, counter):
+        with self._condition:
+            self._counters[counter] += 1
+
+    # Calls
+
+    def chat(self, request, priority=PRIORITY_INTERACTIVE):
+        """Send a chat completion request (create() keyword arguments) and return the completion"""
+        estimate = estimate_tokens(request)
+        self._record('calls')
+        attempt = 0
+        while True:
+            admitted = threading.Event()
+            with span('openai_queue'):
+                self._enqueue(estimate, priority, admitted.set)
+                admitted.wait()
+            try:
+                with span('openai_chat'):
+                    response = self._get_client().chat.completions.create(**request, timeout=self.timeout)
+            except Exception as e:
+                self._release(estimate)
+                record_openai_error(request.get('model'), e)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self._record('failures')
+                    raise
+                logger.warning("OpenAI call failed (%s); retrying in %.1fs", e, delay)
+                self._record('retries')
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._release(estimate, response)
+            record_openai_chat(request.get('model'), response.usage)
+            return response
+
+    async def achat(self, request, priority=PRIORITY_INTERACTIVE):
+        """Async version of chat() using the AsyncOpenAI client"""
+        loop = asyncio.get_running_loop()
+        estimate = estimate_tokens(request)
+        self._record('calls')
+        attempt = 0
+        while True:
+            admitted = loop.create_future()
+            waiter = self._enqueue(estimate, priority,
+                                   lambda: loop.call_soon_threadsafe(
+                                       lambda: admitted.done() or admitted.set_result(None)))
+            try:
+                with span('openai_queue'):
+                    await admitted
+            except asyncio.CancelledError:
+                self._cancel(waiter, estimate)
+                raise
+            try:
+                with span('openai_chat'):
+                    response = await self._get_async_client().chat.completions.create(**request, timeout=self.timeout)
+            except asyncio.CancelledError:
+                self._release(estimate)
+                raise
+            except Exception as e:
+                self._release(estimate)
+                record_openai_error(request.get('model'), e)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self._record('failures')
+                    raise
+                logger.warning("OpenAI call failed (%s); retrying in %.1fs", e, delay)
+                self._record('retries')
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._release(estimate, response)
+            record_openai_chat(request.get('model'), response.usage)
+            return response
+
+    def stats(self):
+        """Queue depth per lane, calls in flight, bucket levels and counters"""
+        with self._condition:
+            now = time.monotonic()
+            if self._requests:
+                self._requests.wait_time(0, now)
+            if self._tokens:
+                self._tokens.wait_time(0, now)
+            return {
+                'queued': dict(self._queued),
+                'inFlight': self._in_flight,
+                'maxConcurrency': self.max_concurrency,
+                'requestsAvailable': round(self._requests.tokens, 1) if self._requests else None,
+                'tokensAvailable': round(self._tokens.tokens) if self._tokens else None,
+                'pausedForSeconds': round(max(0.0, self._paused_until - now), 1),
+                **self._counters,
+            }
@@ -0,0 +1,91 @@
+"""
+Closed-loop load test for sizing the production server.
+
+Runs a fixed number of concurrent clients against one endpoint for each
+concurrency level and reports throughput, latency percentiles and errors.
+Throughput stops growing (and p95 latency climbs) once the server's
+workers x threads are saturated; see the README's "Production Server"
+section for how to turn that into WEB_CONCURRENCY / GUNICORN_THREADS.
+
+Usage:
+    python load_test.py --url http://localhost:5000/api/leaderboard --concurrency 1,8,32,64 --duration 30
+    python load_test.py --url http://localhost:5000/api/files/<id>/generate-summary \\
+        --method POST --body '{}' --concurrency 4,16,32 --duration 120
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def run_client(args, deadline, results, lock):
+    """Send requests back to back until the deadline, recording (latency, ok)"""
+    body = args.body.encode('utf-8') if args.body else None
+    headers = {'Content-Type': 'application/json'} if body else {}
+    while time.perf_counter() < deadline:
+        request = urllib.request.Request(args.url, data=body, method=args.method, headers=headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=args.timeout) as response:
+                response.read()
+                ok = response.status < 500
+        except urllib.error.HTTPError as e:
+            ok = e.code < 500
+        except Exception:
+            ok = False
+        with lock:
+            results.append((time.perf_counter() - start, ok))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_level(args, concurrency):
+    results = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(run_client, args, deadline, results, lock)
+    # Requests still in flight at the deadline finish late; measure up to now
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'rps': len(results) / elapsed,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput and latency at increasing concurrency")
+    parser.add_argument('--url', required=True, help="Endpoint to load")
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--body', help="JSON request body")
+    parser.add_argument('--concurrency', default='1,4,16,32,64', help="Comma-separated concurrency levels")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds per concurrency level")
+    parser.add_argument('--timeout', type=float, default=300, help="Per-request timeout in seconds")
+    args = parser.parse_args()
+
+    print(f"{'clients':>8} {'requests':>9} {'req/s':>8} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} {'errors':>7}")
+    for concurrency in [int(level) for level in args.concurrency.split(',')]:
+        result = run_level(args, concurrency)
+        print(f"{result['concurrency']:>8} {result['requests']:>9} {result['rps']:>8.2f} "
+              f"{result['p50']:>8.3f} {result['p95']:>8.3f} {result['p99']:>8.3f} {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
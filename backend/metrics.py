@@ -0,0 +1,286 @@
+"""
+Latency and cost instrumentation.
+
+span("name") (or the @timed("name") decorator) measures one stage of the
+work, e.g. a Storage download, text extraction, an OpenAI call or a PDF
+render. Every span is observed in the ``app_span_seconds`` histogram. Spans
+that run on a request's thread are also summed per name into that response's
+``Server-Timing`` header, so the browser's network panel shows where a slow
+request spent its time.
+
+OpenAI calls record their token usage and an estimated cost. The prices
+(USD per 1K tokens, or per 1K characters for speech) can be overridden with
+OPENAI_PRICES, a JSON object mapping a model to [prompt, completion] or to a
+single per-1K-characters price.
+
+init_metrics(app) adds the per-request hooks and, when METRICS_TOKEN is set,
+``GET /metrics`` in the Prometheus text format for scrapers that send it as a
+bearer token (without a token the route is not registered). Other components expose gauges through
+register_collector(). Metrics are kept per worker process; Prometheus scrapes
+whichever worker answers, so run one worker per instance or scrape each
+worker's port when exact totals matter.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+import functools
+import hmac
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+# USD per 1K tokens (prompt, completion)
+OPENAI_CHAT_PRICES = {
+    'gpt-3.5-turbo': (0.0010, 0.0020),
+    'gpt-4': (0.03, 0.06),
+    'gpt-4-turbo': (0.01, 0.03),
+}
+# USD per 1K characters
+OPENAI_SPEECH_PRICES = {
+    'tts-1': 0.015,
+    'tts-1-hd': 0.030,
+}
+for _model, _price in json.loads(os.getenv('OPENAI_PRICES', '{}')).items():
+    if isinstance(_price, (list, tuple)):
+        OPENAI_CHAT_PRICES[_model] = tuple(_price)
+    else:
+        OPENAI_SPEECH_PRICES[_model] = float(_price)
+
+# Bearer token required by GET /metrics; the route is not registered without one
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    type = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = []
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+_collectors = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+span_seconds = _register(Histogram('app_span_seconds', "Duration of instrumented stages"))
+http_request_seconds = _register(Histogram('app_http_request_seconds', "HTTP request duration by route"))
+openai_requests = _register(Counter('app_openai_requests_total', "OpenAI API calls by model and outcome"))
+openai_tokens = _register(Counter('app_openai_tokens_total', "OpenAI tokens by model and kind (prompt/completion)"))
+openai_characters = _register(Counter('app_openai_speech_characters_total', "Characters synthesized by OpenAI TTS"))
+openai_cost = _register(Counter('app_openai_cost_usd_total', "Estimated OpenAI cost in USD by model"))
+
+
+def register_collector(collect):
+    """
+    Add a callable invoked on every scrape. It returns (name, type, help, samples)
+    tuples, where samples is a list of (labels dict, value).
+    """
+    _collectors.append(collect)
+
+
+def _add_request_timing(name, seconds):
+    if has_request_context():
+        timings = g.setdefault('server_timings', {})
+        total, count = timings.get(name, (0.0, 0))
+        timings[name] = (total + seconds, count + 1)
+
+
+@contextmanager
+def span(name):
+    """Time a stage of work"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        span_seconds.observe(elapsed, span=name)
+        _add_request_timing(name, elapsed)
+
+
+def timed(name):
+    """Decorator form of span(); a generator is timed until it is exhausted or closed"""
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                with span(name):
+                    yield from fn(*args, **kwargs)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _add_request_cost(cost):
+    if has_request_context():
+        g.openai_cost = g.get('openai_cost', 0.0) + cost
+
+
+def record_openai_chat(model, usage):
+    """Record a successful chat completion's token usage and estimated cost"""
+    openai_requests.inc(model=model, outcome='ok')
+    if usage is None:
+        return
+    prompt_tokens = usage.prompt_tokens or 0
+    completion_tokens = usage.completion_tokens or 0
+    openai_tokens.inc(prompt_tokens, model=model, kind='prompt')
+    openai_tokens.inc(completion_tokens, model=model, kind='completion')
+    prompt_price, completion_price = OPENAI_CHAT_PRICES.get(model, (0.0, 0.0))
+    cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+    openai_cost.inc(cost, model=model)
+    _add_request_cost(cost)
+
+
+def record_openai_speech(model, characters):
+    """Record a text-to-speech call and its estimated cost"""
+    openai_requests.inc(model=model, outcome='ok')
+    openai_characters.inc(characters, model=model)
+    cost = characters * OPENAI_SPEECH_PRICES.get(model, 0.0) / 1000
+    openai_cost.inc(cost, model=model)
+    _add_request_cost(cost)
+
+
+def record_openai_error(model, error):
+    openai_requests.inc(model=model, outcome=type(error).__name__)
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            logger.error("Error collecting metrics: %s", e)
+            continue
+        for name, metric_type, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(f"{name}{_format_labels(_label_key(labels))} {value}" for labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def server_timing_header(total_seconds):
+    """Server-Timing value for the current request: its spans summed per name, the total, and the OpenAI cost"""
+    entries = []
+    for name, (seconds, count) in g.get('server_timings', {}).items():
+        description = f';desc="{count} calls"' if count > 1 else ''
+        entries.append(f"{name};dur={seconds * 1000:.1f}{description}")
+    if 'openai_cost' in g:
+        entries.append(f'openai_cost;desc="${g.openai_cost:.4f}"')
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ', '.join(entries)
+
+
+def init_metrics(app):
+    """Time every request, add Server-Timing headers and serve GET /metrics (if METRICS_TOKEN is set)"""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def add_server_timing(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_request_seconds.observe(elapsed, route=route, method=request.method, status=response.status_code)
+        # Streamed responses are still running; their header only covers the time to the first byte
+        response.headers['Server-Timing'] = server_timing_header(elapsed)
+        return response
+
+    if not METRICS_TOKEN:
+        logger.info("METRICS_TOKEN is not set; GET /metrics is disabled")
+        return
+
+    def metrics():
+        expected = f'Bearer {METRICS_TOKEN}'.encode()
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain',
+                            headers={'WWW-Authenticate': 'Bearer'})
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
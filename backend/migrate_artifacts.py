@@ -0,0 +1,53 @@
+"""
+Move generated content out of existing `files` documents into their
+artifacts subcollections (see artifacts.py).
+
+Documents that are already migrated are skipped, so the script can be
+re-run safely. Use --dry-run to only report what would be moved.
+
+Usage:
+    python migrate_artifacts.py --dry-run
+    python migrate_artifacts.py --user-id <uid>
+"""
+import argparse
+
+from artifacts import artifact_id_for_field, migrate_file_artifacts
+
+
+def migrate_files(db, user_id=None, dry_run=False):
+    """Migrate every `files` document (or one user's); returns (migrated, scanned) document counts"""
+    query = db.collection("files")
+    if user_id:
+        query = query.where("userId", "==", user_id)
+
+    scanned = migrated = 0
+    for doc in query.stream():
+        scanned += 1
+        if dry_run:
+            fields = [field for field in doc.to_dict() if artifact_id_for_field(field)]
+        else:
+            fields = migrate_file_artifacts(db, doc)
+        if fields:
+            migrated += 1
+            print(f"{doc.id}: {', '.join(fields)}")
+    return migrated, scanned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate inline generated content to the artifacts subcollection")
+    parser.add_argument('--user-id', help="Only migrate files of this user")
+    parser.add_argument('--dry-run', action='store_true', help="Report the fields that would be moved without writing")
+    args = parser.parse_args()
+
+    # Importing the app initializes Firebase with the same configuration as the server
+    from app import db
+    if db is None:
+        raise SystemExit("Firebase is not initialized; check the service account configuration")
+
+    migrated, scanned = migrate_files(db, args.user_id, args.dry_run)
+    action = "would be migrated" if args.dry_run else "migrated"
+    print(f"\n{migrated} of {scanned} documents {action}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Process pool for study guide PDF rendering.
+
+ReportLab rendering is CPU-bound, so PDFs are rendered in a small pool of
+spawned processes (spawn, not fork: workers must not inherit the app's
+Firebase/gRPC threads). This module is the pool's entry point and imports
+nothing from the app, so a worker only loads study_guides; each worker
+builds the PDF styles once, in its initializer, before its first render.
+
+A spawned worker also re-runs the parent's __main__ module. That is the
+gunicorn launcher in production (see wsgi.py), but under `python app.py` it
+would be the whole app, so the development server calls
+set_render_processes(0) and renders in the request thread instead.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+import logging
+import multiprocessing
+import os
+import threading
+
+from metrics import timed
+from study_guides import get_pdf_styles, render_pdf_study_guide
+
+logger = logging.getLogger(__name__)
+
+# 0 renders in the calling thread
+ARTIFACT_RENDER_PROCESSES = int(os.getenv('ARTIFACT_RENDER_PROCESSES', str(min(2, os.cpu_count() or 1))))
+
+_render_processes = ARTIFACT_RENDER_PROCESSES
+_render_pool = None
+# Guards creating, replacing and shutting down the pool
+_render_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    """Build the shared PDF styles once per worker process"""
+    get_pdf_styles()
+
+
+def render_pdf_bytes(study_guide):
+    """Render a parsed study guide to PDF bytes (runs in a worker process)"""
+    return render_pdf_study_guide(study_guide).getvalue()
+
+
+def _get_render_pool():
+    """The process pool, created on first use; None when rendering in-thread"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None and _render_processes > 0:
+            _render_pool = ProcessPoolExecutor(max_workers=_render_processes,
+                                               mp_context=multiprocessing.get_context('spawn'),
+                                               initializer=_init_worker)
+        return _render_pool
+
+
+@timed('render_pdf')
+def render_pdf_in_pool(study_guide):
+    """Render a study guide PDF in the process pool, falling back to this thread if the pool is unavailable"""
+    global _render_pool
+    pool = _get_render_pool()
+    if pool is None:
+        return render_pdf_study_guide(study_guide)
+    try:
+        return BytesIO(pool.submit(render_pdf_bytes, study_guide).result())
+    except BrokenProcessPool as e:
+        logger.warning("PDF render pool unavailable, rendering in-thread: %s", e)
+        with _render_pool_lock:
+            # Another thread may already have replaced the broken pool
+            if _render_pool is pool:
+                _render_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        return render_pdf_study_guide(study_guide)
+
+
+def set_render_processes(processes):
+    """Change the number of render processes (0 renders in-thread); the current pool is stopped"""
+    global _render_processes
+    with _render_pool_lock:
+        _render_processes = processes
+    shutdown_render_pool(wait=True)
+
+
+def shutdown_render_pool(wait=True):
+    """Stop the render processes; with wait=True, running renders finish first"""
+    global _render_pool
+    with _render_pool_lock:
+        pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
@@ -0,0 +1,111 @@
+"""
+Cold-start profiler and startup-time budget check for app.py.
+
+Imports the app in a fresh interpreter with ``-X importtime``, prints the
+slowest imports and fails (exit code 1) when the cold start exceeds the
+budget or when a heavy dependency is imported eagerly again. The same check
+runs in the test suite (tests/test_startup.py).
+
+Usage:
+    python profile_startup.py                 # budget from STARTUP_BUDGET_SECONDS (default 3.0)
+    python profile_startup.py --budget 2.5 --top 25 --runs 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+STARTUP_BUDGET_SECONDS = float(os.getenv('STARTUP_BUDGET_SECONDS', '3.0'))
+
+# Modules that must only be imported by the code paths that use them
+LAZY_MODULES = ['openai', 'transformers', 'torch', 'reportlab', 'docx', 'docxtpl',
+                'pptx', 'PyPDF2', 'markdown', 'serpapi']
+
+MARKER = '__LAZY_MODULES_LOADED__='
+
+PROBE = (
+    "import sys, app\n"
+    f"print({MARKER!r} + ','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))\n"
+)
+
+
+def run_cold_start():
+    """Import app.py in a fresh interpreter and return (seconds, importtime lines, eager modules)"""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=backend_dir,
+        capture_output=True,
+        text=True
+    )
+    elapsed = time.perf_counter() - start
+
+    if result.returncode != 0:
+        print(result.stdout)
+        print(result.stderr)
+        raise RuntimeError(f"Importing app.py failed with exit code {result.returncode}")
+
+    eager_modules = []
+    for line in result.stdout.splitlines():
+        if line.startswith(MARKER):
+            eager_modules = [m for m in line[len(MARKER):].split(',') if m]
+
+    import_lines = [line for line in result.stderr.splitlines() if line.startswith('import time:')]
+    return elapsed, import_lines, eager_modules
+
+
+def parse_import_times(import_lines):
+    """Parse ``-X importtime`` output into (cumulative_us, self_us, module) tuples"""
+    entries = []
+    for line in import_lines:
+        try:
+            _, values = line.split(':', 1)
+            self_us, cumulative_us, module = [part.strip() for part in values.split('|')]
+            entries.append((int(cumulative_us), int(self_us), module))
+        except ValueError:
+            # Skip the header line
+            continue
+    return entries
+
+
+def print_report(elapsed, entries, top):
+    """Print the slowest top-level imports by cumulative time"""
+    print(f"Cold start: {elapsed:.3f}s")
+    print(f"\nTop {top} imports by cumulative time:")
+    print(f"{'cumulative (ms)':>16} {'self (ms)':>10}  module")
+    for cumulative_us, self_us, module in sorted(entries, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>16.1f} {self_us / 1000:>10.1f}  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile app.py cold start and enforce a startup budget")
+    parser.add_argument('--budget', type=float,
+                        default=STARTUP_BUDGET_SECONDS,
+                        help="Maximum allowed cold start in seconds")
+    parser.add_argument('--top', type=int, default=20, help="Number of imports to show in the report")
+    parser.add_argument('--runs', type=int, default=1,
+                        help="Number of cold starts to measure; the fastest one is checked against the budget")
+    args = parser.parse_args()
+
+    runs = [run_cold_start() for _ in range(max(1, args.runs))]
+    elapsed, import_lines, eager_modules = min(runs, key=lambda run: run[0])
+
+    print_report(elapsed, parse_import_times(import_lines), args.top)
+
+    failed = False
+    if eager_modules:
+        print(f"\nFAIL: heavy modules imported at startup: {', '.join(eager_modules)}")
+        failed = True
+    if elapsed > args.budget:
+        print(f"\nFAIL: cold start {elapsed:.3f}s exceeds budget of {args.budget:.3f}s")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print(f"\nOK: cold start {elapsed:.3f}s is within budget of {args.budget:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
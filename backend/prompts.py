@@ -0,0 +1,490 @@
+"""
+Chat completion requests for the generation routes.
+
+Each *_request() function returns the keyword arguments for
+chat.completions.create(), so the synchronous routes (OpenAI client) and the
+async job path (AsyncOpenAI, see async_jobs.py) send exactly the same
+prompts. The parse/build helpers turn completion text into the content that
+is stored for a file.
+"""
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+CHAT_MODEL = "gpt-3.5-turbo"
+# Documents are truncated to stay well within the model's context window
+MAX_DOCUMENT_CHARS = 14000
+
+# Reading/writing study guides are generated part by part
+STUDY_GUIDE_CHUNK_CHARS = 3000
+STUDY_GUIDE_MAX_CHUNKS = 5
+
+PLACEHOLDER_IMAGE = "/static/images/placeholder.png"
+
+
+def truncate_document(document_text, max_chars=MAX_DOCUMENT_CHARS):
+    """First max_chars characters of a document"""
+    return document_text[:max_chars]
+
+
+def summary_request(document_text):
+    return {
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are an expert at summarizing documents. Create a comprehensive summary that includes: 1) Main points and key ideas 2) Important details and examples 3) Conclusions or findings. Format the summary with clear sections and bullet points where appropriate."},
+            {"role": "user", "content": f"Please summarize this document:\n\n{truncate_document(document_text)}"}
+        ],
+        "max_tokens": 1000
+    }
+
+
+MULTIPLE_CHOICE_QUIZ_PROMPT = """Create 10 multiple choice questions based on the content. Format your response as a JSON array of questions. Each question should have:
+- A clear question text
+- Four options (A, B, C, D)
+- The correct answer letter
+- A brief explanation
+
+Example format:
+{
+    "questions": [
+        {
+            "question": "What is the main topic discussed?",
+            "options": [
+                "A) First option",
+                "B) Second option",
+                "C) Third option",
+                "D) Fourth option"
+            ],
+            "correct_answer": "A",
+            "explanation": "This is correct because..."
+        }
+    ]
+}"""
+
+FILL_IN_BLANK_QUIZ_PROMPT = """Create 5 fill-in-the-blank questions based on the content. For each question:
+1. Take a direct quote or sentence from the content
+2. Replace a key term or concept with _____ (5 underscores)
+3. The blank should be a single word or short phrase that is clearly defined in the content
+4. Include the surrounding context to make it clear what should go in the blank
+
+Format your response as a JSON object with this structure:
+{
+    "questions": [
+        {
+            "text_before_blank": "In machine learning, a",
+            "text_after_blank": "neural network is designed to process grid-like data such as images.",
+            "correct_answer": "convolutional",
+            "alternative_answers": ["CNN", "convolution", "convolutional neural network"],
+            "required_keywords": ["conv"],
+            "explanation": "Convolutional neural networks (CNNs) are specialized for processing grid-like data, particularly images, by using convolutional layers to detect patterns and features.",
+            "context": "This type of neural network is specifically used for image processing and computer vision tasks."
+        }
+    ]
+}
+
+Make sure each question:
+1. Has a clear blank indicated by _____ (5 underscores)
+2. Has enough context to determine the answer
+3. Has a specific, unambiguous answer
+4. Includes relevant synonyms or acceptable variations of the answer"""
+
+
+def quiz_request(content, quiz_type):
+    system_prompt = MULTIPLE_CHOICE_QUIZ_PROMPT if quiz_type == 'multiple_choice' else FILL_IN_BLANK_QUIZ_PROMPT
+    return {
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Create quiz questions based on this content:\n\n{truncate_document(content)}"}
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.7,
+        "max_tokens": 2000
+    }
+
+
+def study_guide_overview_request(document_text):
+    return {
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are an expert educator specializing in identifying main topics and creating structured outlines. Extract the main topics from this document and create a brief outline."},
+            {"role": "user", "content": f"Extract the 3-6 main topics from this document and provide a brief overview:\n\n{document_text[:1500]}"}
+        ],
+        "max_tokens": 500,
+        "temperature": 0.5
+    }
+
+
+STUDY_GUIDE_CHUNK_PROMPT = """You are an expert educator specializing in creating detailed educational content. Your goal is to explain concepts thoroughly while maintaining engagement and clarity. Create content that teaches concepts as if explaining to someone learning about them for the first time.
+
+Follow these guidelines:
+1. Start each major section with a brief overview paragraph that introduces the concept
+2. Break down complex topics into clear explanations with:
+   - Detailed paragraphs that thoroughly explain each concept
+   - Bullet points for key features, components, or steps
+   - Examples and real-world applications to reinforce understanding
+3. Use "Understanding X" sections to provide deeper insights into important concepts
+4. Include "Key Concept" boxes (using > for blockquotes) to highlight crucial information
+5. Add "For Example" sections to demonstrate practical applications
+
+Format using:
+- Clear headings (# for main topics, ## for subtopics, ### for specific concepts)
+- Paragraphs for detailed explanations
+- Bullet points for features and components
+- Blockquotes (>) for key concept boxes
+- Numbered lists for steps and processes"""
+
+
+def study_guide_chunks(document_text):
+    """Split a document into the parts that are turned into study guide sections (at most STUDY_GUIDE_MAX_CHUNKS)"""
+    chunks = [document_text[i:i + STUDY_GUIDE_CHUNK_CHARS]
+              for i in range(0, len(document_text), STUDY_GUIDE_CHUNK_CHARS)]
+    return chunks[:STUDY_GUIDE_MAX_CHUNKS]
+
+
+def study_guide_chunk_request(index, chunk):
+    return {
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": STUDY_GUIDE_CHUNK_PROMPT},
+            {"role": "user", "content": f"You're processing part {index+1} of a larger document. Create educational content that explains the concepts in this chunk, ensuring it flows well as part of a larger study guide:\n\n{chunk}"}
+        ],
+        "max_tokens": 1500,
+        "temperature": 0.7
+    }
+
+
+def build_study_guide_content(overview_text, processed_chunks):
+    """Combine the overview and the generated parts into the reading/writing content"""
+    combined_content = f"# Document Study Guide\n\n## Overview\n\n{overview_text}\n\n"
+    for i, chunk in enumerate(processed_chunks):
+        combined_content += f"\n## Part {i+1}\n\n{chunk}\n\n"
+
+    combined_content += "\n## Study Tips\n\n* Review each section thoroughly before proceeding to the next\n* Create your own notes based on the key points\n* Try to explain these concepts in your own words\n* Practice applying these concepts to real-world scenarios"
+
+    return {
+        "title": "Reading/Writing Learning Materials",
+        "description": "This content has been optimized for reading/writing learners with structured notes, clear headings, and organized points.",
+        "elements": [
+            {
+                "type": "text",
+                "content": combined_content,
+                "caption": "Structured Study Guide"
+            }
+        ]
+    }
+
+
+def auditory_script_request(document_text):
+    return {
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are an AI tutor specialized in creating spoken-friendly content for auditory learners. Transform educational content into engaging, conversational explanations that sound natural when spoken aloud."},
+            {"role": "user", "content": f"Transform this content into a spoken-friendly, engaging explanation that would be easy to understand when read aloud:\n\n{truncate_document(document_text)}"}
+        ],
+        "max_tokens": 2000,
+        "temperature": 0.7
+    }
+
+
+def build_auditory_content(formatted_text):
+    """Auditory content for a spoken explanation (the audio URL is added separately)"""
+    return {
+        "title": "Audio Learning Materials",
+        "description": "This content has been optimized for auditory learners with spoken explanations and examples.",
+        "elements": [
+            {
+                "type": "text",
+                "content": formatted_text,
+                "caption": "Spoken Explanation"
+            }
+        ]
+    }
+
+
+KINESTHETIC_PROMPT = """You are an AI tutor specialized in creating hands-on, interactive learning activities for kinesthetic learners.
+Transform educational content into engaging physical exercises, experiments, and real-world applications.
+
+For each activity, you MUST provide:
+1. Title: A clear, action-oriented title
+2. Description: Brief overview of what will be learned
+3. Materials Needed: List of required items (at least 2)
+4. Steps: Detailed numbered instructions (at least 3 steps)
+5. Tips: Practical advice for success (at least 2 tips)
+6. Reflection Questions: Thought-provoking questions (at least 2 questions)
+
+Format each activity section with these exact headings and format:
+Title: [Activity Title]
+Description: [Brief overview]
+Materials:
+- [First item]
+- [Second item]
+Steps:
+1. [First step]
+2. [Second step]
+3. [Third step]
+Tips:
+- [First tip]
+- [Second tip]
+Reflection Questions:
+- [First question]
+- [Second question]
+
+Create 2-3 activities that are:
+- Hands-on and physically engaging
+- Using readily available materials
+- Safe and appropriate
+- Connected to real-world applications
+- Suitable for both individual and group work"""
+
+
+def kinesthetic_request(document_text):
+    return {
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": KINESTHETIC_PROMPT},
+            {"role": "user", "content": f"Create interactive, hands-on learning activities for this content:\n\n{truncate_document(document_text)}"}
+        ],
+        "max_tokens": 2000,
+        "temperature": 0.7
+    }
+
+
+def parse_kinesthetic_activities(activities_text):
+    """Parse the activities in a kinesthetic completion into the stored content"""
+    activities = []
+    current_activity = None
+    current_section = None
+
+    lines = activities_text.split('\n')
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        if not line:
+            i += 1
+            continue
+
+        # Check for new activity
+        if line.startswith('Title:'):
+            if current_activity and current_activity['title']:  # Save previous activity if exists
+                activities.append(current_activity)
+            current_activity = {
+                'title': line.split(':', 1)[1].strip(),
+                'description': '',
+                'materials': [],
+                'steps': [],
+                'tips': [],
+                'reflection': []
+            }
+            current_section = 'title'
+
+        # Check for sections
+        elif line.startswith('Description:'):
+            current_section = 'description'
+            current_activity['description'] = line.split(':', 1)[1].strip()
+        elif line.startswith('Materials:'):
+            current_section = 'materials'
+        elif line.startswith('Steps:'):
+            current_section = 'steps'
+        elif line.startswith('Tips:'):
+            current_section = 'tips'
+        elif line.startswith('Reflection Questions:'):
+            current_section = 'reflection'
+
+        # Process content based on current section
+        elif current_activity and current_section:
+            content = line
+
+            # Handle numbered steps
+            if line[0].isdigit() and '. ' in line:
+                content = line.split('. ', 1)[1].strip()
+            # Handle bullet points
+            elif line.startswith('- ') or line.startswith('* '):
+                content = line[2:].strip()
+            # Handle continuation of description
+            elif current_section == 'description' and not line.startswith(('Materials:', 'Steps:', 'Tips:', 'Reflection Questions:', 'Title:')):
+                current_activity['description'] += ' ' + content
+                i += 1
+                continue
+
+            # Skip if content is empty or just a bullet/number
+            if not content or content in ['-', '*'] or content.isdigit():
+                i += 1
+                continue
+
+            # Add content to appropriate section
+            if current_section == 'materials':
+                current_activity['materials'].append(content)
+            elif current_section == 'steps':
+                current_activity['steps'].append(content)
+            elif current_section == 'tips':
+                current_activity['tips'].append(content)
+            elif current_section == 'reflection':
+                current_activity['reflection'].append(content)
+
+        i += 1
+
+    # Add the last activity if exists
+    if current_activity and current_activity['title']:
+        activities.append(current_activity)
+
+    # Validate activities
+    validated_activities = []
+    for activity in activities:
+        if (activity['title'] and
+            activity['description'] and
+            len(activity['materials']) >= 1 and
+            len(activity['steps']) >= 2 and
+            len(activity['tips']) >= 1 and
+            len(activity['reflection']) >= 1):
+            validated_activities.append(activity)
+
+    if not validated_activities:
+        logger.warning("No valid activities were generated")
+        return {
+            "title": "Interactive Learning Activities",
+            "description": "Learn through hands-on activities and physical engagement.",
+            "activities": [{
+                "title": "Activity Generation Error",
+                "description": "Please try regenerating the activities.",
+                "materials": ["Paper", "Pen"],
+                "steps": ["Review the content carefully", "Take notes on key concepts", "Practice explaining the concepts"],
+                "tips": ["Focus on understanding one concept at a time", "Try to relate concepts to real-world examples"],
+                "reflection": ["What are the main ideas you learned?", "How can you apply this knowledge?"]
+            }]
+        }
+
+    return {
+        "title": "Interactive Learning Activities",
+        "description": "Learn through hands-on activities and physical engagement.",
+        "activities": validated_activities
+    }
+
+
+def visual_suggestions_request(document_text):
+    return {
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": """Create visual learning suggestions for the provided content.
+Generate a list of 4-6 specific ways a visual learner could engage with this content.
+Focus on techniques like mind mapping, diagramming, sketching, and visual note-taking."""},
+            {"role": "user", "content": f"Create visual learning suggestions for this content:\n\n{truncate_document(document_text)}"}
+        ],
+        "temperature": 0.7
+    }
+
+
+def visual_explanations_request(document_text):
+    return {
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": """Extract 3-5 main concepts or topics from the provided text.
+For each concept:
+1. Provide a short title (1-3 words)
+2. Write a brief explanation (50-70 words)
+
+Return a list of concepts in JSON format with:
+- 'title': The concept name
+- 'text': A brief explanation
+"""},
+            {"role": "user", "content": f"Extract key concepts from this content:\n\n{truncate_document(document_text)}"}
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.7
+    }
+
+
+def build_visual_content(suggestions_text, explanations_text):
+    """
+    Build the visual content from the suggestions and concept explanations completions.
+    Raises ValueError (or json.JSONDecodeError) if the explanations cannot be parsed.
+    """
+    suggestions = []
+    for line in suggestions_text.strip().split('\n'):
+        # Remove numbered bullets or dashes if present
+        clean_line = re.sub(r'^\d+\.\s*|^-\s*', '', line.strip())
+        if clean_line:
+            suggestions.append(clean_line)
+
+    try:
+        concepts_data = json.loads(explanations_text)
+        explanations = concepts_data.get("concepts", []) if isinstance(concepts_data, dict) else []
+
+        # If response doesn't have the expected format, try parsing differently
+        if not explanations and isinstance(concepts_data, list):
+            explanations = concepts_data
+
+        # Process explanations to ensure correct format
+        processed_explanations = []
+        for exp in explanations:
+            if isinstance(exp, dict) and 'title' in exp:
+                # Set a default image path
+                if 'image' not in exp:
+                    exp['image'] = PLACEHOLDER_IMAGE
+                processed_explanations.append(exp)
+
+        if not processed_explanations:
+            raise ValueError("Failed to parse explanations from OpenAI response")
+
+    except (json.JSONDecodeError, KeyError, ValueError) as e:
+        logger.error("Error parsing concepts response: %s", e)
+        logger.debug("Raw response: %s", explanations_text)
+        raise
+
+    return {
+        "success": True,
+        "content": {
+            "title": "Visual Learning Materials",
+            "description": "Learn through diagrams, concept maps, and visual representations.",
+            "suggestions": suggestions,
+            "explanations": processed_explanations
+        }
+    }
+
+
+def visual_concepts_request(document_text):
+    return {
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": """Extract 4-6 main concepts or topics from the provided text.
+For each concept:
+1. Provide a short title (1-3 words)
+2. Write a brief 1-2 sentence explanation of the concept
+
+Return a JSON array where each item has:
+- 'title': The concept name
+- 'description': A brief explanation (max 120 characters)
+"""},
+            {"role": "user", "content": f"Extract key concepts from this content:\n\n{truncate_document(document_text)}"}
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.7
+    }
+
+
+def parse_visual_concepts(concepts_text):
+    """List of {title, description} concepts from a visual concepts completion"""
+    data = json.loads(concepts_text)
+    return data if isinstance(data, list) else data.get("concepts", [])
+
+
+# Shown when concepts cannot be generated (no API key or an OpenAI error)
+SAMPLE_VISUAL_CONCEPTS = [
+    {
+        "title": "Convolutional Neural Network",
+        "description": "Utilized for classification and computer vision tasks.",
+        "image": PLACEHOLDER_IMAGE
+    },
+    {
+        "title": "Recurrent Neural Network",
+        "description": "For sequential data processing, like text or time series.",
+        "image": PLACEHOLDER_IMAGE
+    },
+    {
+        "title": "Transfer Learning",
+        "description": "Using pre-trained models and fine-tuning for new tasks.",
+        "image": PLACEHOLDER_IMAGE
+    }
+]
@@ -0,0 +1,173 @@
+"""
+Leveled, structured logging.
+
+configure_logging() sends every logger's records through a QueueHandler.
+The calling thread only resolves the message and puts the record on an
+in-memory queue; a QueueListener thread formats it and writes it to stdout,
+so requests never block on console I/O. Lines below LOG_LEVEL are dropped by
+the logger's level check before anything is formatted, as long as callers
+pass %-style arguments instead of building f-strings:
+
+    logger.debug("Extracted %s characters from %s", len(text), file_path)
+
+init_request_logging(app) gives every request an id (taken from an incoming
+X-Request-ID header or generated) that is added to each line logged while
+the request is handled and returned in the response's X-Request-ID header.
+Generation jobs are started with the id of the request that submitted them
+(see bind_request_id).
+
+LOG_FORMAT=json writes one JSON object per line for log aggregation; the
+default text format is for reading in a terminal. Fields passed with
+extra={...} are included in JSON lines. DEBUG lines are sampled per request:
+a LOG_DEBUG_SAMPLE_RATE share of requests log all of their debug lines, so
+a sampled request can still be followed from start to end.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+
+from flask import request
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Incoming ids are only reused if they look like an id (they end up in every log line)
+_VALID_REQUEST_ID = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+# Client libraries that log every HTTP call at DEBUG; kept at INFO or above
+NOISY_LOGGERS = ('urllib3', 'httpx', 'httpcore', 'hpack', 'googleapiclient.discovery', 'google.auth')
+
+# Attributes every LogRecord has; anything else on a record came from extra={...}
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'request_id'}
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_debug_sampled = contextvars.ContextVar('debug_sampled', default=None)
+_listener = None
+
+
+def get_request_id():
+    """Id of the request being handled in this context, or None"""
+    return _request_id.get()
+
+
+def bind_request_id(request_id):
+    """Tag the log lines of the current context (e.g. a background job) with request_id"""
+    _request_id.set(request_id)
+
+
+class ContextFilter(logging.Filter):
+    """Add the request id to records and drop the DEBUG records of unsampled requests"""
+
+    def __init__(self, debug_sample_rate=LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            sampled = _debug_sampled.get()
+            if sampled is None:
+                # Outside a request every line is sampled on its own
+                sampled = random.random() < self.debug_sample_rate
+            if not sampled:
+                return False
+        record.request_id = _request_id.get() or '-'
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'requestId': getattr(record, 'request_id', '-'),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records with their message resolved; formatting is left to the listener thread"""
+
+    def prepare(self, record):
+        # Arguments may change after the call returns, so merge them now. The
+        # traceback is rendered here too, while the frames are still current.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, debug_sample_rate=LOG_DEBUG_SAMPLE_RATE):
+    """Route the root logger through a queue to a stdout writer thread (once per process)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    queue_handler = _QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(ContextFilter(debug_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(max(root.level, logging.INFO))
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def init_request_logging(app):
+    """Bind a request id (and the debug sampling decision) to every request"""
+
+    @app.before_request
+    def start_request_logging():
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        _request_id.set(incoming if _VALID_REQUEST_ID.fullmatch(incoming) else uuid.uuid4().hex)
+        _debug_sampled.set(random.random() < LOG_DEBUG_SAMPLE_RATE)
+
+    @app.after_request
+    def add_request_id_header(response):
+        request_id = _request_id.get()
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    @app.teardown_request
+    def unbind_request_id(exc=None):
+        # Worker threads are reused; lines logged between requests must not carry a stale id
+        _request_id.set(None)
+        _debug_sampled.set(None)
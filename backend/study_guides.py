@@ -0,0 +1,305 @@
+"""
+Study guide parsing and rendering.
+
+The AI-generated markdown is parsed once into a small intermediate document
+(a tuple of blocks) which both the DOCX and the PDF renderer consume. Parsed
+documents are cached by content hash so re-exports of the same study guide
+skip parsing entirely. The styled DOCX template and the PDF paragraph styles
+are built once per process and shared by every render.
+"""
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from io import BytesIO
+from types import MappingProxyType
+import hashlib
+import logging
+import os
+import threading
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Title used for every exported study guide (matches the web version)
+STUDY_GUIDE_TITLE = "Reading/Writing Learning Materials"
+
+# A single block of the intermediate document.
+#   kind:   'heading' | 'bullets' | 'numbered' | 'paragraph' | 'blank'
+#   text:   heading/paragraph/numbered item text
+#   level:  heading level (1-3)
+#   items:  bullet list items
+#   number: the number of a numbered list item
+Block = namedtuple('Block', ['kind', 'text', 'level', 'items', 'number'],
+                   defaults=('', 0, (), None))
+
+# A parsed study guide; content_hash identifies the markdown it was built from
+StudyGuide = namedtuple('StudyGuide', ['content_hash', 'blocks'])
+
+# Parsed documents keyed by content hash (bounded LRU)
+STUDY_GUIDE_CACHE_SIZE = int(os.getenv('STUDY_GUIDE_CACHE_SIZE', '128'))
+_parse_cache = OrderedDict()
+_parse_cache_lock = threading.Lock()
+
+
+def study_guide_hash(content):
+    """Return the content hash used to identify a study guide"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def parse_study_guide_markdown(content):
+    """Parse study guide markdown into a tuple of blocks (uncached)"""
+    blocks = []
+    current_list = []
+
+    def flush_list():
+        if current_list:
+            blocks.append(Block('bullets', items=tuple(current_list)))
+            current_list.clear()
+
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            flush_list()
+            blocks.append(Block('blank'))
+            continue
+
+        # Handle headers
+        if line.startswith('# '):
+            flush_list()
+            blocks.append(Block('heading', line[2:], level=1))
+        elif line.startswith('## '):
+            flush_list()
+            blocks.append(Block('heading', line[3:], level=2))
+        elif line.startswith('### '):
+            flush_list()
+            blocks.append(Block('heading', line[4:], level=3))
+        # Handle bullet points
+        elif line.startswith('* ') or line.startswith('- '):
+            current_list.append(line[2:])
+        # Handle numbered lists
+        elif line[0].isdigit() and '. ' in line:
+            flush_list()
+            number, text = line.split('. ', 1)
+            blocks.append(Block('numbered', text, number=number))
+        # Regular paragraph
+        else:
+            flush_list()
+            blocks.append(Block('paragraph', line))
+
+    flush_list()
+    return tuple(blocks)
+
+
+def parse_study_guide(content):
+    """Parse study guide markdown, reusing the cached result for identical content"""
+    content_hash = study_guide_hash(content)
+
+    with _parse_cache_lock:
+        cached = _parse_cache.get(content_hash)
+        if cached is not None:
+            _parse_cache.move_to_end(content_hash)
+            return cached
+
+    study_guide = StudyGuide(content_hash, parse_study_guide_markdown(content))
+
+    with _parse_cache_lock:
+        _parse_cache[content_hash] = study_guide
+        while len(_parse_cache) > STUDY_GUIDE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+    return study_guide
+
+
+@lru_cache(maxsize=None)
+def get_docx_template_bytes():
+    """Build the pre-styled base .docx once per process and return it as bytes"""
+    from docx import Document
+    from docx.shared import Pt, RGBColor
+    from docx.enum.style import WD_STYLE_TYPE
+
+    doc = Document()
+
+    # Set up styles
+    styles = doc.styles
+
+    # Title style
+    title_style = styles.add_style('CustomTitle', WD_STYLE_TYPE.PARAGRAPH)
+    title_font = title_style.font
+    title_font.size = Pt(24)
+    title_font.bold = True
+    title_font.color.rgb = RGBColor(48, 84, 150)
+
+    # Heading 1 style
+    h1_style = styles.add_style('CustomH1', WD_STYLE_TYPE.PARAGRAPH)
+    h1_font = h1_style.font
+    h1_font.size = Pt(18)
+    h1_font.bold = True
+    h1_font.color.rgb = RGBColor(94, 110, 220)
+
+    # Heading 2 style
+    h2_style = styles.add_style('CustomH2', WD_STYLE_TYPE.PARAGRAPH)
+    h2_font = h2_style.font
+    h2_font.size = Pt(16)
+    h2_font.bold = True
+    h2_font.color.rgb = RGBColor(63, 81, 181)
+
+    # Heading 3 style
+    h3_style = styles.add_style('CustomH3', WD_STYLE_TYPE.PARAGRAPH)
+    h3_font = h3_style.font
+    h3_font.size = Pt(14)
+    h3_font.bold = True
+    h3_font.color.rgb = RGBColor(94, 110, 220)
+
+    # Normal text style
+    normal_style = styles.add_style('CustomNormal', WD_STYLE_TYPE.PARAGRAPH)
+    normal_font = normal_style.font
+    normal_font.size = Pt(11)
+
+    template = BytesIO()
+    doc.save(template)
+    return template.getvalue()
+
+
+@lru_cache(maxsize=None)
+def get_pdf_styles():
+    """Build the study guide paragraph styles once per process (read-only registry)"""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    # Get sample stylesheet and derive the custom styles from it
+    sample_styles = getSampleStyleSheet()
+
+    return MappingProxyType({
+        'CustomTitle': ParagraphStyle(
+            name='CustomTitle',
+            parent=sample_styles['Title'],
+            fontSize=24,
+            spaceAfter=30,
+            textColor=colors.HexColor('#304E96')
+        ),
+        'CustomH1': ParagraphStyle(
+            name='CustomH1',
+            parent=sample_styles['Heading1'],
+            fontSize=18,
+            spaceAfter=16,
+            textColor=colors.HexColor('#5E6EDC')
+        ),
+        'CustomH2': ParagraphStyle(
+            name='CustomH2',
+            parent=sample_styles['Heading2'],
+            fontSize=16,
+            spaceAfter=14,
+            textColor=colors.HexColor('#3F51B5')
+        ),
+        'CustomH3': ParagraphStyle(
+            name='CustomH3',
+            parent=sample_styles['Heading3'],
+            fontSize=14,
+            spaceAfter=12,
+            textColor=colors.HexColor('#5E6EDC')
+        ),
+        'CustomBody': ParagraphStyle(
+            name='CustomBody',
+            parent=sample_styles['Normal'],
+            fontSize=11,
+            spaceAfter=12
+        ),
+    })
+
+
+@timed('render_docx')
+def render_docx_study_guide(study_guide):
+    """Render a parsed study guide to a DOCX file in a BytesIO buffer"""
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    # Start from the pre-styled template instead of re-registering the custom styles
+    doc = Document(BytesIO(get_docx_template_bytes()))
+
+    # Resolve styles once; looking them up by name scans every style in the document
+    styles = doc.styles
+    normal_style = styles['CustomNormal']
+    bullet_style = styles['List Bullet']
+    number_style = styles['List Number']
+    heading_styles = {1: styles['CustomH1'], 2: styles['CustomH2'], 3: styles['CustomH3']}
+
+    # Add title with consistent text across all platforms
+    doc.add_paragraph(STUDY_GUIDE_TITLE, styles['CustomTitle']).alignment = WD_ALIGN_PARAGRAPH.CENTER
+    doc.add_paragraph()  # Add some space
+
+    for block in study_guide.blocks:
+        if block.kind == 'blank':
+            doc.add_paragraph()  # Add empty paragraph for spacing
+        elif block.kind == 'heading':
+            doc.add_paragraph(block.text, heading_styles[block.level])
+        elif block.kind == 'bullets':
+            doc.add_paragraph(style=normal_style)
+            for item in block.items:
+                doc.add_paragraph(item, style=bullet_style)
+        elif block.kind == 'numbered':
+            doc.add_paragraph(block.text, style=number_style)
+        else:
+            doc.add_paragraph(block.text, normal_style)
+
+    # Save to BytesIO
+    docx_file = BytesIO()
+    doc.save(docx_file)
+    docx_file.seek(0)
+    return docx_file
+
+
+def render_pdf_study_guide(study_guide):
+    """Render a parsed study guide to a PDF file in a BytesIO buffer"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
+
+    styles = get_pdf_styles()
+
+    # Build the PDF content
+    elements = []
+
+    # Add title - using a consistent title for all documents
+    elements.append(Paragraph(STUDY_GUIDE_TITLE, styles['CustomTitle']))
+    elements.append(Spacer(1, 12))
+
+    heading_styles = {1: 'CustomH1', 2: 'CustomH2', 3: 'CustomH3'}
+
+    for block in study_guide.blocks:
+        if block.kind == 'blank':
+            elements.append(Spacer(1, 12))
+        elif block.kind == 'heading':
+            elements.append(Paragraph(block.text, styles[heading_styles[block.level]]))
+        elif block.kind == 'bullets':
+            elements.append(ListFlowable(
+                [ListItem(Paragraph(item, styles['CustomBody'])) for item in block.items],
+                bulletType='bullet'
+            ))
+        elif block.kind == 'numbered':
+            elements.append(Paragraph(f"{block.number}. {block.text}", styles['CustomBody']))
+        else:
+            elements.append(Paragraph(block.text, styles['CustomBody']))
+
+    # Build the PDF
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+def create_docx_study_guide(content, title="Study Guide"):
+    """
+    Create a well-formatted DOCX document from the AI-generated content
+    - This version creates a DOCX with exactly the same content as the web version
+    """
+    logger.debug("Creating DOCX study guide with exact same content as web")
+    return render_docx_study_guide(parse_study_guide(content))
+
+
+def create_pdf_study_guide(content, title="Study Guide"):
+    """
+    Create a well-formatted PDF document from the AI-generated content
+    - This version creates a PDF with exactly the same content as the web version
+    """
+    logger.debug("Creating new PDF study guide with exact same content as web")
+    return render_pdf_study_guide(parse_study_guide(content))
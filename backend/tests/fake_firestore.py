@@ -0,0 +1,127 @@
+"""
+In-memory stand-in for the parts of the Firestore client the artifacts code uses:
+documents, subcollections, batches, get_all and equality queries. Documents are
+kept as plain dicts keyed by their path.
+"""
+import copy
+
+from firebase_admin import firestore
+
+# Value stored for firestore.SERVER_TIMESTAMP
+SERVER_TIME = 'server-time'
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self.exists else None
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def get(self, field_paths=None):
+        data = self._db.docs.get(self.path)
+        if data is not None and field_paths is not None:
+            data = {field: data[field] for field in field_paths if field in data}
+        return FakeSnapshot(self, data)
+
+    def set(self, data):
+        self._db.docs[self.path] = _resolve(data)
+
+    def update(self, data):
+        if self.path not in self._db.docs:
+            raise KeyError(f"No document to update: {self.path}")
+        document = self._db.docs[self.path]
+        for field_path, value in data.items():
+            *parents, name = field_path.split('.')
+            target = document
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            if value is firestore.DELETE_FIELD:
+                target.pop(name, None)
+            else:
+                target[name] = _resolve(value)
+
+    def delete(self):
+        self._db.docs.pop(self.path, None)
+
+
+class FakeCollection:
+    def __init__(self, db, path, filters=()):
+        self._db = db
+        self.path = path
+        self._filters = filters
+
+    def document(self, doc_id):
+        return FakeDocument(self._db, f"{self.path}/{doc_id}")
+
+    def where(self, field, op, value):
+        assert op == '==', op
+        return FakeCollection(self._db, self.path, self._filters + ((field, value),))
+
+    def stream(self):
+        prefix = f"{self.path}/"
+        for path in sorted(self._db.docs):
+            if not path.startswith(prefix) or '/' in path[len(prefix):]:
+                continue
+            data = self._db.docs[path]
+            if all(data.get(field) == value for field, value in self._filters):
+                yield FakeSnapshot(FakeDocument(self._db, path), data)
+
+
+class FakeBatch:
+    """Applies its writes on commit, all at once"""
+
+    def __init__(self):
+        self._writes = []
+
+    def set(self, reference, data):
+        self._writes.append(lambda: reference.set(data))
+
+    def update(self, reference, data):
+        self._writes.append(lambda: reference.update(data))
+
+    def delete(self, reference):
+        self._writes.append(reference.delete)
+
+    def commit(self):
+        for write in self._writes:
+            write()
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}  # path -> data
+        self.reads = 0  # documents read by get_all
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch()
+
+    def get_all(self, references):
+        for reference in references:
+            self.reads += 1
+            yield reference.get()
+
+
+def _resolve(value):
+    """Copy value with SERVER_TIMESTAMP sentinels replaced by SERVER_TIME"""
+    if value is firestore.SERVER_TIMESTAMP:
+        return SERVER_TIME
+    if isinstance(value, dict):
+        return {key: _resolve(item) for key, item in value.items()}
+    return copy.deepcopy(value)
@@ -0,0 +1,122 @@
+"""Artifact loading for migrated, unmigrated and half-migrated file documents, and the migration itself"""
+import copy
+
+import pytest
+
+pytest.importorskip('firebase_admin')
+
+from artifacts import (ARTIFACTS_COLLECTION, artifact_pointer, load_artifact, load_artifacts,  # noqa: E402
+                       write_artifact)
+from fake_firestore import SERVER_TIME, FakeFirestore  # noqa: E402
+from migrate_artifacts import migrate_files  # noqa: E402
+
+STUDY_GUIDE = {'elements': [{'type': 'text', 'content': '# Study guide'}]}
+QUIZ = [{'question': 'Q1', 'answer': 'A'}]
+
+
+def add_artifact(db, file_id, artifact_id, field, content):
+    db.docs[f"files/{file_id}/{ARTIFACTS_COLLECTION}/{artifact_id}"] = {
+        'field': field, 'content': content, 'createdAt': SERVER_TIME}
+
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    # Written before the split: all content inline
+    db.docs['files/unmigrated'] = {
+        'userId': 'u1', 'name': 'old.pdf', 'summary': 'Old summary', 'readingWritingContent': STUDY_GUIDE,
+        'quiz_multiple_choice': QUIZ, 'quiz_multiple_choice_generatedAt': 'yesterday'}
+    # Written after the split: pointers only
+    db.docs['files/migrated'] = {
+        'userId': 'u1', 'name': 'new.pdf', 'artifacts': {
+            'summary': {**artifact_pointer('summary'), 'updatedAt': SERVER_TIME},
+            'reading_writing': {**artifact_pointer('reading_writing'), 'updatedAt': SERVER_TIME}}}
+    add_artifact(db, 'migrated', 'summary', 'summary', 'New summary')
+    add_artifact(db, 'migrated', 'reading_writing', 'readingWritingContent', STUDY_GUIDE)
+    # A summary generated after the split next to an older inline study guide
+    db.docs['files/half'] = {
+        'userId': 'u2', 'name': 'half.pdf', 'readingWritingContent': STUDY_GUIDE, 'artifacts': {
+            'summary': {**artifact_pointer('summary'), 'updatedAt': SERVER_TIME}}}
+    add_artifact(db, 'half', 'summary', 'summary', 'Half summary')
+    return db
+
+
+def load(db, file_id, fields=None):
+    doc_ref = db.collection('files').document(file_id)
+    return load_artifacts(db, doc_ref, doc_ref.get().to_dict(), fields)
+
+
+def test_load_artifact_unmigrated_reads_inline_content(db):
+    doc_ref = db.collection('files').document('unmigrated')
+    file_data = doc_ref.get().to_dict()
+    assert load_artifact(doc_ref, file_data, 'summary') == 'Old summary'
+    assert load_artifact(doc_ref, file_data, 'quiz_multiple_choice') == QUIZ
+    assert load_artifact(doc_ref, file_data, 'visualContent') is None
+
+
+def test_load_artifact_migrated_reads_artifact(db):
+    doc_ref = db.collection('files').document('migrated')
+    file_data = doc_ref.get().to_dict()
+    assert load_artifact(doc_ref, file_data, 'summary') == 'New summary'
+    assert load_artifact(doc_ref, file_data, 'readingWritingContent') == STUDY_GUIDE
+    # No pointer: no artifact is read
+    assert load_artifact(doc_ref, file_data, 'auditoryContent') is None
+
+
+def test_load_artifacts_by_document_state(db):
+    assert load(db, 'unmigrated') == {
+        'summary': 'Old summary', 'readingWritingContent': STUDY_GUIDE, 'quiz_multiple_choice': QUIZ}
+    assert load(db, 'migrated') == {'summary': 'New summary', 'readingWritingContent': STUDY_GUIDE}
+    assert load(db, 'half') == {'summary': 'Half summary', 'readingWritingContent': STUDY_GUIDE}
+
+
+def test_load_artifacts_only_reads_requested_fields(db):
+    assert load(db, 'half', ['summary']) == {'summary': 'Half summary'}
+    assert load(db, 'half', ['readingWritingContent']) == {'readingWritingContent': STUDY_GUIDE}
+    db.reads = 0
+    assert load(db, 'migrated', ['visualContent']) == {}
+    assert db.reads == 0
+
+
+def test_write_artifact_replaces_inline_content(db):
+    doc_ref = db.collection('files').document('unmigrated')
+    write_artifact(db, doc_ref, 'summary', 'Regenerated', {'summaryGeneratedAt': SERVER_TIME})
+
+    file_data = db.docs['files/unmigrated']
+    assert 'summary' not in file_data
+    assert file_data['artifacts']['summary']['status'] == 'ready'
+    assert file_data['summaryGeneratedAt'] == SERVER_TIME
+    assert load(db, 'unmigrated', ['summary']) == {'summary': 'Regenerated'}
+
+
+def test_migration_moves_inline_content_out_of_every_document(db):
+    before = {file_id: load(db, file_id) for file_id in ('unmigrated', 'migrated', 'half')}
+
+    assert migrate_files(db) == (2, 3)
+
+    for file_id, contents in before.items():
+        file_data = db.docs[f"files/{file_id}"]
+        assert not set(file_data) & {'summary', 'readingWritingContent', 'quiz_multiple_choice'}
+        assert set(file_data['artifacts']) >= {'summary'}
+        assert load(db, file_id) == contents
+    # Timestamps of quizzes are metadata, not artifacts
+    assert db.docs['files/unmigrated']['quiz_multiple_choice_generatedAt'] == 'yesterday'
+    assert db.docs[f"files/unmigrated/{ARTIFACTS_COLLECTION}/quiz_multiple_choice"]['content'] == QUIZ
+
+
+def test_migration_twice_is_a_no_op(db):
+    migrate_files(db)
+    after_first_run = copy.deepcopy(db.docs)
+
+    assert migrate_files(db) == (0, 3)
+    assert db.docs == after_first_run
+
+
+def test_migration_dry_run_and_user_filter(db):
+    before = copy.deepcopy(db.docs)
+    assert migrate_files(db, dry_run=True) == (2, 3)
+    assert db.docs == before
+
+    assert migrate_files(db, user_id='u2') == (1, 1)
+    assert 'readingWritingContent' not in db.docs['files/half']
+    assert 'readingWritingContent' in db.docs['files/unmigrated']
@@ -0,0 +1,29 @@
+"""Cold-start regression guard: the checks of profile_startup.py as tests"""
+import pytest
+
+from profile_startup import LAZY_MODULES, STARTUP_BUDGET_SECONDS, parse_import_times, run_cold_start
+
+# The probe imports app.py, which needs the backend's requirements
+pytest.importorskip('flask')
+pytest.importorskip('firebase_admin')
+
+RUNS = 3
+
+
+@pytest.fixture(scope='module')
+def cold_start():
+    """Fastest of RUNS cold starts, as (seconds, importtime lines, eagerly imported lazy modules)"""
+    return min((run_cold_start() for _ in range(RUNS)), key=lambda run: run[0])
+
+
+def test_lazy_modules_not_imported_at_startup(cold_start):
+    _, _, eager_modules = cold_start
+    assert not eager_modules, f"imported at startup, should be lazy: {eager_modules} (of {LAZY_MODULES})"
+
+
+def test_cold_start_within_budget(cold_start):
+    elapsed, import_lines, _ = cold_start
+    slowest = sorted(parse_import_times(import_lines), reverse=True)[:10]
+    report = '\n'.join(f"{cumulative_us / 1000:10.1f} ms  {module}" for cumulative_us, _, module in slowest)
+    assert elapsed <= STARTUP_BUDGET_SECONDS, (
+        f"cold start {elapsed:.3f}s exceeds STARTUP_BUDGET_SECONDS={STARTUP_BUDGET_SECONDS}; slowest imports:\n{report}")
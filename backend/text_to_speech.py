@@ -0,0 +1,315 @@
+"""
+Chunked text-to-speech for long explanations.
+
+OpenAI's speech endpoint rejects inputs over 4096 characters, so long text is
+split at sentence boundaries into segments under the limit, the segments are
+synthesized concurrently on a pool shared by the whole process (so
+TTS_MAX_WORKERS bounds the TTS calls in flight across all requests and jobs),
+and the MP3 audio is stitched back together in order. iter_speech_segments
+streams each segment's response and forwards its bytes as the API delivers
+them, once every segment before it has been forwarded, so playback or upload
+starts before even the first segment has been synthesized completely.
+
+Audio is content-addressed: audio_cache_key hashes (text, voice, model) so
+identical explanations map to the same Storage object and are synthesized
+only once.
+
+For streaming playback the first segment is kept short (TTS_FIRST_SEGMENT_CHARS)
+so the first audio reaches the browser quickly, and AudioPipe lets the same
+bytes be fed to a Storage upload running in another thread.
+
+synthesize_speech_async does the same as synthesize_speech for generation
+jobs running on an event loop: it awaits the same pool without blocking the
+loop.
+"""
+import asyncio
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+import hashlib
+import itertools
+import os
+import queue
+import re
+import threading
+
+from metrics import span, record_openai_speech
+
+# OpenAI's TTS input limit is 4096 characters; keep some headroom
+TTS_SEGMENT_CHARS = int(os.getenv('TTS_SEGMENT_CHARS', '4000'))
+# TTS calls in flight per process
+TTS_MAX_WORKERS = int(os.getenv('TTS_MAX_WORKERS', '4'))
+# A short leading segment synthesizes in well under a second, so streamed playback starts quickly
+TTS_FIRST_SEGMENT_CHARS = int(os.getenv('TTS_FIRST_SEGMENT_CHARS', '300'))
+# Read size of streamed speech responses
+TTS_STREAM_CHUNK_BYTES = 16 * 1024
+TTS_MODEL = 'tts-1'
+TTS_VOICE = 'alloy'
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+_tts_pool = None
+_tts_pool_lock = threading.Lock()
+
+
+def get_tts_pool():
+    """Process-wide pool every segment is synthesized on (created on first use)"""
+    global _tts_pool
+    with _tts_pool_lock:
+        if _tts_pool is None:
+            _tts_pool = ThreadPoolExecutor(max_workers=max(1, TTS_MAX_WORKERS), thread_name_prefix='tts')
+        return _tts_pool
+
+
+def shutdown_tts_pool(wait=True):
+    """Stop the TTS pool; with wait=True, running syntheses finish first"""
+    global _tts_pool
+    with _tts_pool_lock:
+        pool, _tts_pool = _tts_pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def _split_long_sentence(sentence, max_chars):
+    """Split a sentence that is longer than max_chars at word boundaries"""
+    pieces = []
+    current = ''
+    for word in sentence.split():
+        while len(word) > max_chars:
+            # A single "word" longer than the limit (e.g. a URL) is hard-cut
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(word[:max_chars])
+            word = word[max_chars:]
+        candidate = f"{current} {word}" if current else word
+        if len(candidate) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_tts_segments(text, max_chars=TTS_SEGMENT_CHARS, first_max_chars=None):
+    """
+    Split text at sentence boundaries into segments of at most max_chars characters.
+    If first_max_chars is given the first segment is limited to that size instead.
+    """
+    segments = []
+    current = ''
+    for paragraph in re.split(r'\n\s*\n', text.strip()):
+        for sentence in _SENTENCE_END.split(paragraph.strip()):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            limit = first_max_chars if first_max_chars and not segments else max_chars
+            for piece in (_split_long_sentence(sentence, limit) if len(sentence) > limit else [sentence]):
+                limit = first_max_chars if first_max_chars and not segments else max_chars
+                candidate = f"{current} {piece}" if current else piece
+                if len(candidate) > limit and current:
+                    segments.append(current)
+                    current = piece
+                else:
+                    current = candidate
+    if current:
+        segments.append(current)
+    return segments
+
+
+def _id3_tag_length(header):
+    """Length of the ID3v2 tag starting an MP3 stream (0 if none); header is its first 10+ bytes"""
+    if len(header) >= 10 and header[:3] == b'ID3':
+        # Tag size is a 28-bit "syncsafe" integer (7 bits per byte)
+        size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        footer = 10 if header[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def strip_id3_tag(audio):
+    """Remove a leading ID3v2 tag so MP3 segments can be concatenated frame to frame"""
+    return audio[_id3_tag_length(audio):]
+
+
+def _strip_id3_stream(chunks):
+    """strip_id3_tag for audio arriving in chunks: yield the chunks without the leading tag"""
+    header = b''
+    for chunk in chunks:
+        header += chunk
+        if len(header) >= 10:
+            break
+    skip = _id3_tag_length(header)
+    for chunk in itertools.chain([header], chunks):
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        yield chunk[skip:]
+        skip = 0
+
+
+def synthesize_segment(client, segment, voice=TTS_VOICE, model=TTS_MODEL):
+    """Synthesize a single segment and return its MP3 bytes"""
+    with span('openai_tts'):
+        response = client.audio.speech.create(model=model, voice=voice, input=segment)
+    record_openai_speech(model, len(segment))
+    return response.content
+
+
+def stream_segment(client, segment, voice, model, chunks, stop):
+    """
+    Synthesize a single segment, putting its MP3 bytes on the chunks queue as the API
+    sends them, then None (an exception instead if the call fails). Stops reading when
+    stop is set.
+    """
+    try:
+        with span('openai_tts'):
+            speech = client.audio.speech
+            if hasattr(speech, 'with_streaming_response'):
+                with speech.with_streaming_response.create(model=model, voice=voice, input=segment) as response:
+                    record_openai_speech(model, len(segment))
+                    for data in response.iter_bytes(TTS_STREAM_CHUNK_BYTES):
+                        if stop.is_set():
+                            return
+                        chunks.put(data)
+            else:
+                # openai < 1.6 has no streamed responses; the segment arrives whole
+                chunks.put(speech.create(model=model, voice=voice, input=segment).content)
+                record_openai_speech(model, len(segment))
+    except Exception as e:
+        chunks.put(e)
+    finally:
+        chunks.put(None)
+
+
+def _read_chunks(chunks):
+    """Yield the chunks stream_segment puts on a queue, raising its error if it failed"""
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            return
+        if isinstance(chunk, BaseException):
+            raise chunk
+        yield chunk
+
+
+def iter_speech_segments(client, text, voice=TTS_VOICE, model=TTS_MODEL, first_segment_chars=None):
+    """
+    Synthesize text segment by segment and yield MP3 bytes in order.
+    Segments are synthesized concurrently on the shared pool. The bytes of each
+    segment are yielded as the API delivers them once all segments before it have
+    been yielded; later segments are buffered until then.
+    """
+    segments = split_tts_segments(text, first_max_chars=first_segment_chars)
+    if not segments:
+        return
+
+    pool = get_tts_pool()
+    stop = threading.Event()
+    streams = [queue.SimpleQueue() for _ in segments]
+    futures = []
+    for segment, chunks in zip(segments, streams):
+        future = pool.submit(stream_segment, client, segment, voice, model, chunks, stop)
+        # A segment cancelled before it started (pool shut down) never puts its end marker
+        future.add_done_callback(
+            lambda f, chunks=chunks: f.cancelled() and chunks.put(CancelledError("Speech synthesis cancelled")))
+        futures.append(future)
+    try:
+        for index, chunks in enumerate(streams):
+            yield from (_read_chunks(chunks) if index == 0 else _strip_id3_stream(_read_chunks(chunks)))
+    finally:
+        # Stop pending and running synthesis if the consumer goes away early
+        stop.set()
+        for future in futures:
+            future.cancel()
+
+
+def synthesize_speech(client, text, voice=TTS_VOICE, model=TTS_MODEL):
+    """Synthesize text of any length and return the stitched MP3 bytes"""
+    return b''.join(iter_speech_segments(client, text, voice=voice, model=model))
+
+
+async def synthesize_speech_async(client, text, voice=TTS_VOICE, model=TTS_MODEL):
+    """
+    Synthesize text of any length and return the stitched MP3 bytes, awaiting the
+    shared pool so job syntheses count against the same TTS_MAX_WORKERS limit.
+    client is the synchronous OpenAI client (it runs on the pool's threads).
+    """
+    pool = get_tts_pool()
+    futures = [pool.submit(synthesize_segment, client, segment, voice, model)
+               for segment in split_tts_segments(text)]
+    try:
+        audio = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+    finally:
+        for future in futures:
+            future.cancel()
+    return b''.join(segment_audio if index == 0 else strip_id3_tag(segment_audio)
+                    for index, segment_audio in enumerate(audio))
+
+
+def audio_cache_key(text, voice=TTS_VOICE, model=TTS_MODEL):
+    """Content hash identifying the audio synthesized for (text, voice, model)"""
+    return hashlib.sha256(f"{model}\n{voice}\n{text}".encode('utf-8')).hexdigest()
+
+
+def audio_storage_path(cache_key):
+    """Content-addressed Storage path for synthesized audio"""
+    return f"audio/sha256/{cache_key}.mp3"
+
+
+class AudioPipe:
+    """
+    Minimal file-like pipe: one thread write()s chunks, another read()s them.
+    Used to feed a Storage upload from audio that is being streamed to a client.
+    tell() reports the bytes read so far, which resumable uploads of unknown
+    size use to compute each chunk's Content-Range.
+    """
+
+    def __init__(self, max_chunks=64):
+        self._chunks = queue.Queue(maxsize=max_chunks)
+        self._buffer = b''
+        self._closed = False
+        self._position = 0
+        self._discarded = False
+
+    def write(self, data):
+        # Once the reader has gone away nobody drains the queue; drop the data instead of blocking
+        if not self._discarded:
+            self._chunks.put(data)
+
+    def close(self):
+        """Signal end of stream; the reader sees EOF once the queued data is consumed"""
+        self._chunks.put(None)
+
+    def abort(self):
+        """Make the reader fail so a partial upload is never committed"""
+        if not self._discarded:
+            self._chunks.put(IOError("Audio stream aborted"))
+
+    def discard(self):
+        """Called by the reader when it stops reading: later writes are dropped and a blocked writer is released"""
+        self._discarded = True
+        while True:
+            try:
+                self._chunks.get_nowait()
+            except queue.Empty:
+                return
+
+    def read(self, size=-1):
+        while not self._closed and (size < 0 or len(self._buffer) < size):
+            chunk = self._chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk is None:
+                self._closed = True
+            else:
+                self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._position += len(data)
+        return data
+
+    def tell(self):
+        return self._position